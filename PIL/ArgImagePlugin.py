@@ -406,6 +406,7 @@ class ArgImageFile(ImageFile.ImageFile):
 
     format = "ARG"
     format_description = "Animated raster graphics"
+    framecomposite = 1
 
     def _open(self):
 
@@ -429,7 +430,7 @@ class ArgImageFile(ImageFile.ImageFile):
         if cid != b"AHDR":
             raise SyntaxError("expected an AHDR chunk")
 
-        s = self.arg.call(cid, offset, bytes)
+        s = self.arg.call(cid.decode("ascii"), offset, bytes)
 
         self.arg.crc(cid, s)
 
@@ -437,6 +438,10 @@ class ArgImageFile(ImageFile.ImageFile):
         self.mode = self.arg.mode
         self.size = self.arg.size
 
+        self.frame = -1
+        self.__rewind = self.fp.tell()
+        self.frameindex = ImageFile.FrameIndex()
+
     def load(self):
 
         if self.arg.im is None:
@@ -451,10 +456,25 @@ class ArgImageFile(ImageFile.ImageFile):
 
     def seek(self, frame):
 
+        self._seekframe(frame)
+
+    def _rewind(self):
+
+        # start over with a fresh parser, after the AHDR chunk
+        arg = ArgStream(self.arg.fp)
+        arg.size, arg.mode, arg.rawmode = self.size, self.mode, self.arg.rawmode
+        arg.fp.seek(self.__rewind)
+        self.arg = arg
+        self.frame = -1
+        self._step()
+
+    def _step(self):
+
         if self.arg.eof:
             raise EOFError("end of animation")
 
         self.fp = self.arg.fp
+        offset = self.fp.tell()
 
         while 1:
 
@@ -467,7 +487,7 @@ class ArgImageFile(ImageFile.ImageFile):
                 raise EOFError("end of animation")
 
             try:
-                s = self.arg.call(cid, offset, bytes)
+                s = self.arg.call(cid.decode("ascii"), offset, bytes)
             except EOFError:
                 break
 
@@ -480,8 +500,32 @@ class ArgImageFile(ImageFile.ImageFile):
 
         self.fp.read(4) # ship extra CRC
 
+        if self.arg.eof:
+            raise EOFError("end of animation")
+
+        self.frame = self.frame + 1
+        if self.frame == len(self.frameindex.offsets):
+            self.frameindex.offsets.append(offset)
+
+        self._keyframe()
+
     def tell(self):
-        return 0
+        return self.frame
+
+    def _getstate(self):
+        # the parser state, with copies of all stored images
+        state = self.arg.__dict__.copy()
+        state["images"] = dict([(k, im.copy()) for k, im in self.arg.images.items()])
+        state["im"] = self.arg.im.copy()
+        return self.frame, self.fp.tell(), state
+
+    def _setstate(self, state):
+        self.frame, offset, state = state
+        self.arg.__dict__.update(state)
+        self.arg.images = dict([(k, im.copy()) for k, im in state["images"].items()])
+        self.arg.im = state["im"].copy()
+        self.fp = self.arg.fp
+        self.fp.seek(offset)
 
     def verify(self):
         "Verify ARG file"
@@ -63,6 +63,9 @@ class BmpImageFile(ImageFile.ImageFile):
     format = "BMP"
     format_description = "Windows Bitmap"
 
+    # mostly raw pixel data; read in large blocks
+    decodermaxblock = ImageFile.RAWBLOCK
+
     def _bitmap(self, header = 0, offset = 0):
 
         if header:
@@ -85,10 +85,11 @@ class FliImageFile(ImageFile.ImageFile):
         self.palette = ImagePalette.raw("RGB", b"".join(palette))
 
         # set things up to decode first frame
-        self.frame = -1
         self.__fp = self.fp
+        self.__rewind = self.__offset
+        self.frameindex = ImageFile.FrameIndex()
 
-        self.seek(0)
+        self._rewind()
 
     def _palette(self, palette, shift):
         # load palette
@@ -110,16 +111,25 @@ class FliImageFile(ImageFile.ImageFile):
 
     def seek(self, frame):
 
-        if frame != self.frame + 1:
-            raise ValueError("cannot seek to frame %d" % frame)
-        self.frame = frame
+        self._seekframe(frame)
+
+    def _rewind(self):
+
+        self.frame = -1
+        self.__offset = self.__rewind
+        self.im = None
+        self._step()
+
+    def _step(self):
+
+        frame = self.frame + 1
 
         # move to next frame
         self.fp = self.__fp
         self.fp.seek(self.__offset)
 
         s = self.fp.read(4)
-        if not s:
+        if len(s) < 4:
             raise EOFError
 
         framesize = i32(s)
@@ -127,12 +137,32 @@ class FliImageFile(ImageFile.ImageFile):
         self.decodermaxblock = framesize
         self.tile = [("fli", (0,0)+self.size, self.__offset, None)]
 
+        self.frame = frame
+        offsets = self.frameindex.offsets
+        if frame == len(offsets):
+            offsets.append(self.__offset)
+
         self.__offset = self.__offset + framesize
 
     def tell(self):
 
         return self.frame
 
+    def load_end(self):
+
+        self._keyframe()
+
+    def _getstate(self):
+
+        return self.frame, self.__offset, self.im.copy()
+
+    def _setstate(self, state):
+
+        self.frame, self.__offset, im = state
+        self.im = im.copy()
+        self.tile = []
+        self.fp = self.__fp
+
 #
 # registry
 
@@ -28,6 +28,8 @@
 __version__ = "0.9"
 
 
+import array
+
 from . import Image, ImageFile, ImagePalette
 
 
@@ -57,6 +59,7 @@ class GifImageFile(ImageFile.ImageFile):
     format_description = "Compuserve GIF"
 
     global_palette = None
+    framecomposite = 1
 
     def data(self):
         s = self.fp.read(1)
@@ -94,30 +97,38 @@ class GifImageFile(ImageFile.ImageFile):
 
         self.__fp = self.fp # FIXME: hack
         self.__rewind = self.fp.tell()
-        self.seek(0) # get ready to read first frame
+        self.frameindex = ImageFile.FrameIndex()
+        self._rewind() # get ready to read first frame
 
     def seek(self, frame):
+        self._seekframe(frame)
 
-        if frame == 0:
-            # rewind
-            self.__offset = 0
-            self.dispose = None
-            self.__frame = -1
-            self.__fp.seek(self.__rewind)
+    def _rewind(self):
+        self.__offset = 0
+        self.dispose = None
+        self.__frame = -1
+        self.__fp.seek(self.__rewind)
+        self.im = None
+        self._step()
 
-        if frame != self.__frame + 1:
-            raise ValueError("cannot seek to frame %d" % frame)
-        self.__frame = frame
+    def _step(self):
+
+        frame = self.__frame + 1
+        offsets = self.frameindex.offsets
 
         self.tile = []
 
         self.fp = self.__fp
-        if self.__offset:
+        if frame < len(offsets):
+            # we've been here before
+            self.fp.seek(offsets[frame])
+        elif self.__offset:
             # backup to last frame
             self.fp.seek(self.__offset)
             while self.data():
                 pass
-            self.__offset = 0
+        self.__offset = 0
+        offset = self.fp.tell()
 
         if self.dispose:
             self.im = self.dispose
@@ -207,9 +218,28 @@ class GifImageFile(ImageFile.ImageFile):
         if self.palette:
             self.mode = "P"
 
+        self.__frame = frame
+        if frame == len(offsets):
+            offsets.append(offset)
+
     def tell(self):
         return self.__frame
 
+    def load_end(self):
+        self._keyframe()
+
+    def _getstate(self):
+        return (self.__frame, self.__offset, self.dispose and self.dispose.copy(),
+                self.palette, self.info.copy(), self.mode, self.im.copy())
+
+    def _setstate(self, state):
+        self.__frame, self.__offset, dispose, self.palette, info, self.mode, im = state
+        self.dispose = dispose and dispose.copy()
+        self.info = info.copy()
+        self.im = im.copy()
+        self.tile = []
+        self.fp = self.__fp
+
 
 # --------------------------------------------------------------------
 # Write GIF files
@@ -242,16 +272,25 @@ def _save(im, fp, filename):
         # convert on the fly (EXPERIMENTAL -- I'm not sure PIL
         # should automatically convert images on save...)
         if Image.getmodebase(im.mode) == "RGB":
-            imOut = im.convert("P")
+            imOut = _palettize(im)
             rawmode = "P"
         else:
             imOut = im.convert("L")
             rawmode = "L"
 
+    if im.mode == "1":
+        # two colours only need a two entry palette
+        imOut = _bilevel(im)
+        rawmode = "P"
+
     # header
-    for s in getheader(imOut, im.encoderinfo):
+    header = getheader(imOut, im.encoderinfo)
+    for s in header:
         fp.write(s)
 
+    # the smallest code size is 2 bits, even for two colours
+    bits = max((header[0][10] & 7) + 1, 2)
+
     flags = 0
 
     try:
@@ -286,9 +325,9 @@ def _save(im, fp, filename):
              o16(im.size[0]) +          # size
              o16(im.size[1]) +
              bytes((flags,              # flags
-             8)))                       # bits
+             bits)))                    # bits
 
-    imOut.encoderconfig = (8, interlace)
+    imOut.encoderconfig = (bits, interlace)
 
     ImageFile._save(imOut, fp, [("gif", (0,0)+im.size, 0, rawmode)])
 
@@ -320,39 +359,72 @@ def _save_netpbm(im, fp, filename):
 # --------------------------------------------------------------------
 # GIF utilities
 
+def _bilevel(im):
+    # convert a bilevel image to "P", with a black and white palette
+    data = im.convert("L").tobytes()
+    imOut = Image.frombytes("P", im.size, data.translate(_BILEVEL))
+    imOut.putpalette(b"\0\0\0\xff\xff\xff")
+    return imOut
+
+_BILEVEL = bytes([i >> 7 for i in range(256)])
+
+def _palettize(im):
+    # convert an RGB image to "P".  images with at most 256 colours
+    # (such as pixelized images) get an exact palette; the colours are
+    # collected and mapped as 24-bit integers, one per pixel.
+    if im.mode != "RGB":
+        im = im.convert("RGB")
+    data = im.tobytes()
+    wide = bytearray(len(data) // 3 * 4)
+    for band in range(3):
+        wide[band::4] = data[band::3]
+    pixels = array.array("I", wide)
+    colors = set(pixels)
+    if len(colors) > 256:
+        try:
+            return im.convert("P", palette=Image.ADAPTIVE)
+        except AttributeError:
+            return im.convert("P") # no quantizer; use the web palette
+    colors = sorted(colors)
+    index = dict((c, i) for i, c in enumerate(colors))
+    imOut = Image.frombytes("P", im.size, bytes(map(index.__getitem__, pixels)))
+    wide = array.array("I", colors).tobytes()
+    palette = bytearray(len(colors) * 3)
+    for band in range(3):
+        palette[band::3] = wide[band::4]
+    imOut.putpalette(palette)
+    return imOut
+
 def getheader(im, info=None):
     """Return a list of strings representing a GIF header"""
 
-    optimize = info and info.get("optimize", 0)
+    # the palette only needs to cover the colours used, rounded up to
+    # a power of two
+    if im.mode in ("L", "P"):
+        maxcolor = im.getextrema()[1] + 1
+    else:
+        maxcolor = 256
+    bits = 1
+    while (1 << bits) < maxcolor:
+        bits = bits + 1
 
     s = [
         b"GIF87a" +          # magic
         o16(im.size[0]) +    # size
         o16(im.size[1]) +
-        bytes((7 + 128,      # flags: bits + palette
+        bytes((bits - 1 + 128, # flags: bits + palette
         0,                   # background
         0))                  # reserved/aspect
     ]
 
-    if optimize:
-        # minimize color palette
-        i = 0
-        maxcolor = 0
-        for count in im.histogram():
-            if count:
-                maxcolor = i
-            i = i + 1
-    else:
-        maxcolor = 256
-
     # global palette
     if im.mode == "P":
         # colour palette
-        s.append(im.im.getpalette("RGB")[:maxcolor*3])
+        palette = im.im.getpalette("RGB")[:maxcolor*3]
     else:
         # greyscale
-        for i in range(maxcolor):
-            s.append(bytes((i, i, i)))
+        palette = bytes([i for i in range(maxcolor) for band in range(3)])
+    s.append(palette + bytes((3 << bits) - len(palette)))
 
     return s
 
@@ -402,6 +474,6 @@ Image.register_mime(GifImageFile.format, "image/gif")
 
 #
 # Uncomment the following line if you wish to use NETPBM/PBMPLUS
-# instead of the built-in "uncompressed" GIF encoder
+# instead of the built-in GIF encoder
 
 # Image.register_save(GifImageFile.format, _save_netpbm)
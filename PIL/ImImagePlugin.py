@@ -107,6 +107,9 @@ class ImImageFile(ImageFile.ImageFile):
     format = "IM"
     format_description = "IFUNC Image Memory"
 
+    # mostly raw pixel data; read in large blocks
+    decodermaxblock = ImageFile.RAWBLOCK
+
     def _open(self):
 
         # Quick rejection: if there's not an LF among the first
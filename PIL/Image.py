@@ -55,7 +55,10 @@ try:
     # directly; import Image and use the Image.core variable instead.
     import _imaging as core
 except ImportError as v:
-    core = _imaging_not_installed()
+    # fall back on the pure-Python storage core.  this supports image
+    # memories, raw data and the codecs implemented in Python, but is
+    # slower than the C module.
+    from . import _imagingpure as core
     if str(v)[:20] == "Module use of python" and warnings:
         # The _imaging C module is present, but not compiled for
         # the right version (windows only).  Print a warning, if
@@ -91,7 +94,7 @@ def isImageType(t):
 def isDirectory(f):
     return isStringType(f) and os.path.isdir(f)
 
-import numbers, collections
+import io, numbers, collections, struct, threading
 
 #
 # Debug level
@@ -265,6 +268,117 @@ def getmodebands(mode):
 
 _initialized = 0
 
+##
+# (Internal) Static plugin registry.  For each file format, this
+# lists the plugin module, the signatures (offset, bytes) that files
+# in that format start with, and the filename extensions it uses.
+# Plugins are imported on demand, when a file matches one of their
+# signatures, or when a matching extension or format is saved.
+# Formats without a reliable signature are only tried when no
+# signature matches.
+
+_PLUGINS = [
+    # format, module, signatures, extensions
+    ("BMP", "BmpImagePlugin", [(0, b"BM")], [".bmp"]),
+    ("GIF", "GifImagePlugin", [(0, b"GIF87a"), (0, b"GIF89a")], [".gif"]),
+    ("JPEG", "JpegImagePlugin", [(0, b"\xff")],
+     [".jfif", ".jpe", ".jpg", ".jpeg"]),
+    ("PPM", "PpmImagePlugin", [(0, b"P")], [".pbm", ".pgm", ".ppm"]),
+    ("PNG", "PngImagePlugin", [(0, b"\211PNG\r\n\032\n")], [".png"]),
+    ("TIFF", "TiffImagePlugin",
+     [(0, b"MM\000\052"), (0, b"II\052\000"), (0, b"II\xbc\000")],
+     [".tif", ".tiff"]),
+    ("ARG", "ArgImagePlugin", [(0, b"\212ARG\r\n\032\n")], [".arg"]),
+    ("BUFR", "BufrStubImagePlugin", [(0, b"BUFR"), (0, b"ZCZC")], [".bufr"]),
+    ("CUR", "CurImagePlugin", [(0, b"\0\0\2\0")], [".cur"]),
+    ("DCX", "DcxImagePlugin", [(0, b"\xb1\x68\xde\x3a")], [".dcx"]),
+    ("EPS", "EpsImagePlugin", [(0, b"%!PS"), (0, b"\xc5\xd0\xd3\xc6")],
+     [".ps", ".eps"]),
+    ("FITS", "FitsStubImagePlugin", [(0, b"SIMPLE")], [".fit", ".fits"]),
+    ("FLI", "FliImagePlugin", [(4, b"\x11\xaf"), (4, b"\x12\xaf")],
+     [".fli", ".flc"]),
+    ("FPX", "FpxImagePlugin", [(0, b"\320\317\021\340\241\261\032\341")],
+     [".fpx"]),
+    ("GBR", "GbrImagePlugin", [(4, b"\0\0\0\1")], [".gbr"]),
+    ("GRIB", "GribStubImagePlugin", [(0, b"GRIB")], [".grib"]),
+    ("HDF5", "Hdf5StubImagePlugin", [(0, b"\x89HDF\r\n\x1a\n")],
+     [".h5", ".hdf"]),
+    ("ICNS", "IcnsImagePlugin", [(0, b"icns")], [".icns"]),
+    ("ICO", "IcoImagePlugin", [(0, b"\0\0\1\0")], [".ico"]),
+    ("IM", "ImImagePlugin", [], [".im"]),
+    ("IMT", "ImtImagePlugin", [], []),
+    ("IPTC", "IptcImagePlugin", [], [".iim"]),
+    ("MCIDAS", "McIdasImagePlugin", [(0, b"\0\0\0\0\0\0\0\4")], []),
+    ("MIC", "MicImagePlugin", [(0, b"\320\317\021\340\241\261\032\341")],
+     [".mic"]),
+    ("MPEG", "MpegImagePlugin", [(0, b"\0\0\1\xb3")], [".mpg", ".mpeg"]),
+    ("MSP", "MspImagePlugin", [(0, b"DanM"), (0, b"LinS")], [".msp"]),
+    ("PALM", "PalmImagePlugin", [], [".palm"]),
+    ("PCD", "PcdImagePlugin", [], [".pcd"]),
+    ("PCX", "PcxImagePlugin", [(0, b"\x0a")], [".pcx"]),
+    ("PDF", "PdfImagePlugin", [], [".pdf"]),
+    ("PIXAR", "PixarImagePlugin", [(0, b"\200\350\000\000")], []),
+    ("PSD", "PsdImagePlugin", [(0, b"8BPS")], [".psd"]),
+    ("SGI", "SgiImagePlugin", [(0, b"\001\332")],
+     [".bw", ".rgb", ".rgba", ".sgi"]),
+    ("SPIDER", "SpiderImagePlugin", [], []),
+    ("SUN", "SunImagePlugin", [(0, b"\x59\xa6\x6a\x95")], [".ras"]),
+    ("TGA", "TgaImagePlugin", [(0, b"\0")], [".tga"]),
+    ("WMF", "WmfImagePlugin",
+     [(0, b"\xd7\xcd\xc6\x9a\x00\x00"), (0, b"\x01\x00\x00\x00")],
+     [".wmf", ".emf"]),
+    ("XBM", "XbmImagePlugin", [(0, b"#define")], [".xbm"]),
+    ("XPM", "XpmImagePlugin", [(0, b"/* XPM */")], [".xpm"]),
+    ("XVTHUMB", "XVThumbImagePlugin", [(0, b"P7 332")], []),
+    ]
+
+# formats loaded by preinit
+_PREINIT = ("BMP", "GIF", "JPEG", "PPM", "PNG", "TIFF")
+
+_loaded = {}
+_load_lock = threading.RLock()
+
+def _load_plugin(module):
+    # import a plugin module (once); it registers itself on import.
+    # the module is only marked as loaded once the import is done, so
+    # other threads (see identify_many) wait for it to register
+    if module in _loaded:
+        return
+    with _load_lock:
+        if module in _loaded:
+            return
+        try:
+            __import__("PIL." + module, globals(), locals(), [])
+        except ImportError:
+            if DEBUG:
+                print("Image: failed to import", end=' ')
+                print(module, ":", sys.exc_info()[1])
+        _loaded[module] = None
+
+_SIGNATURES = None
+
+def _match(prefix):
+    # get the modules whose signatures match the prefix, in registry
+    # order.  signatures are indexed on their offset and first byte.
+    global _SIGNATURES
+    if _SIGNATURES is None:
+        index = {}
+        for i, (id, module, signatures, extensions) in enumerate(_PLUGINS):
+            for offset, magic in signatures:
+                key = offset, magic[:1]
+                index.setdefault(key, []).append((i, offset, magic, module))
+        offsets = sorted(set([offset for offset, c in index]))
+        _SIGNATURES = offsets, index
+    offsets, index = _SIGNATURES
+    found = []
+    for offset in offsets:
+        for item in index.get((offset, prefix[offset:offset+1]), ()):
+            i, offset, magic, module = item
+            if prefix[offset:offset+len(magic)] == magic:
+                found.append((i, module))
+    found.sort()
+    return [module for i, module in found]
+
 ##
 # Explicitly loads standard file format drivers.
 
@@ -275,30 +389,9 @@ def preinit():
     if _initialized >= 1:
         return
 
-    try:
-        from . import BmpImagePlugin
-    except ImportError:
-        pass
-    try:
-        from . import GifImagePlugin
-    except ImportError:
-        pass
-    try:
-        from . import JpegImagePlugin
-    except ImportError:
-        pass
-    try:
-        from . import PpmImagePlugin
-    except ImportError:
-        pass
-    try:
-        from . import PngImagePlugin
-    except ImportError:
-        pass
-    try:
-        from . import TiffImagePlugin
-    except ImportError:
-        pass
+    for format, module, signatures, extensions in _PLUGINS:
+        if format in _PREINIT:
+            _load_plugin(module)
 
     _initialized = 1
 
@@ -313,34 +406,8 @@ def init():
     if _initialized >= 2:
         return 0
 
-    visited = {}
-
-    directories = sys.path
-
-    try:
-        directories = directories + [os.path.dirname(__file__)]
-    except NameError:
-        pass
-
-    # only check directories (including current, if present in the path)
-    for directory in filter(isDirectory, directories):
-        fullpath = os.path.abspath(directory)
-        if fullpath in visited:
-            continue
-        for file in os.listdir(directory):
-            if file[-14:] == "ImagePlugin.py":
-                f, e = os.path.splitext(file)
-                try:
-                    sys.path.insert(0, directory)
-                    try:
-                        __import__('PIL.'+f, globals(), locals(), [])
-                    finally:
-                        del sys.path[0]
-                except ImportError:
-                    if DEBUG:
-                        print("Image: failed to import", end=' ')
-                        print(f, ":", sys.exc_info()[1])
-        visited[fullpath] = None
+    for format, module, signatures, extensions in _PLUGINS:
+        _load_plugin(module)
 
     if OPEN or SAVE:
         _initialized = 2
@@ -1273,6 +1340,35 @@ class Image:
 
         return self.im.putpixel(xy, value)
 
+    ##
+    # Returns a copy of this image, reduced by integer factors.  Each
+    # pixel in the new image is the average of a block of factor_x by
+    # factor_y pixels in this image.  If the size is not a multiple of
+    # the factors, the blocks along the right and bottom edges are
+    # smaller.
+    #
+    # @def reduce(factor_x, factor_y=None)
+    # @param factor_x Horizontal reduction factor.
+    # @param factor_y Vertical reduction factor.  If omitted, it is
+    #    set to factor_x.
+    # @return An Image object.
+    # @exception ValueError If the image has mode "1" or "P".
+
+    def reduce(self, factor_x, factor_y=None):
+        "Reduce image by integer factors"
+
+        if factor_y is None:
+            factor_y = factor_x
+
+        self.load()
+
+        try:
+            im = self.im.reduce((factor_x, factor_y))
+        except AttributeError:
+            raise ValueError("reduce not supported by this core")
+
+        return self._new(im)
+
     ##
     # Returns a resized copy of this image.
     #
@@ -1285,7 +1381,15 @@ class Image:
     #    (cubic spline interpolation in a 4x4 environment), or
     #    <b>ANTIALIAS</b> (a high-quality downsampling filter).
     #    If omitted, or if the image has mode "1" or "P", it is
-    #    set <b>NEAREST</b>.
+    #    set <b>NEAREST</b>.  With the other filters, if the image
+    #    is at least twice the requested size in both directions, it
+    #    is first reduced by the largest whole factors that fit (see
+    #    <b>reduce</b>), and the filter is applied to the matching
+    #    region of the result, so the output pixels are sampled at
+    #    the same positions as without the reduction.  If the size is
+    #    not a multiple of the factor, the last row and column of
+    #    blocks are averaged over the pixels that are there, which
+    #    is an approximation of the filter along those edges.
     # @return An Image object.
 
     def resize(self, size, resample=NEAREST):
@@ -1299,14 +1403,33 @@ class Image:
         if self.mode in ("1", "P"):
             resample = NEAREST
 
+        core = self.im
+        args = size, resample
+
+        if resample != NEAREST and size[0] > 0 and size[1] > 0:
+            # average whole blocks first; the filter then only has
+            # to handle the remaining (less than 2x) reduction.  the
+            # box maps the original image onto the reduced one, which
+            # may end in a partial block
+            factor = self.size[0] // size[0], self.size[1] // size[1]
+            if factor[0] > 1 and factor[1] > 1:
+                try:
+                    core = core.reduce(factor)
+                except AttributeError:
+                    pass # not supported by this core
+                else:
+                    box = (0, 0, float(self.size[0]) / factor[0],
+                           float(self.size[1]) / factor[1])
+                    args = size, resample, box
+
         if resample == ANTIALIAS:
             # requires stretch support (imToolkit & PIL 1.1.3)
             try:
-                im = self.im.stretch(size, resample)
+                im = core.stretch(*args)
             except AttributeError:
                 raise ValueError("unsupported resampling filter")
         else:
-            im = self.im.resize(size, resample)
+            im = core.resize(*args)
 
         return self._new(im)
 
@@ -1416,11 +1539,13 @@ class Image:
         self.encoderinfo = params
         self.encoderconfig = ()
 
-        preinit()
-
         ext = os.path.splitext(filename)[1].lower()
 
         if not format:
+            if ext not in EXTENSION:
+                for id, module, signatures, extensions in _PLUGINS:
+                    if ext in extensions:
+                        _load_plugin(module)
             try:
                 format = EXTENSION[ext]
             except KeyError:
@@ -1430,6 +1555,10 @@ class Image:
                 except KeyError:
                     raise KeyError(ext) # unknown extension
 
+        if format.upper() not in SAVE:
+            for id, module, signatures, extensions in _PLUGINS:
+                if id == format.upper():
+                    _load_plugin(module)
         try:
             save_handler = SAVE[format.upper()]
         except KeyError:
@@ -1863,13 +1992,16 @@ def frombuffer(mode, size, data, decoder_name="raw", *args):
                     RuntimeWarning, stacklevel=2
                 )
             args = mode, 0, -1 # may change to (mode, 0, 1) post-1.1.6
-        if args[0] in _MAPMODES:
-            im = new(mode, (1,1))
-            im = im._new(
-                core.map_buffer(data, size, decoder_name, None, 0, args)
-                )
-            im.readonly = 1
-            return im
+        if args[0] in getattr(core, "MAPMODES", _MAPMODES):
+            try:
+                mapped = core.map_buffer(data, size, decoder_name, None, 0, args)
+            except ValueError:
+                mapped = None # layout not usable as is; copy instead
+            if mapped is not None and mapped.mode == mode:
+                im = new(mode, (1,1))
+                im = im._new(mapped)
+                im.readonly = 1
+                return im
 
     return frombytes(mode, size, data, decoder_name, args)
 
@@ -1971,7 +2103,10 @@ def open(fp, mode="r"):
 
     prefix = fp.read(16)
 
-    preinit()
+    # load the plugins whose signatures match
+    for module in _match(prefix):
+        if module not in _loaded:
+            _load_plugin(module)
 
     for i in ID:
         try:
@@ -1995,6 +2130,107 @@ def open(fp, mode="r"):
 
     raise IOError("cannot identify image file")
 
+##
+# Header information returned by {@link #identify}.  This is a tuple
+# with the fields <b>format</b>, <b>mode</b>, <b>size</b>, and
+# <b>info</b>, as set by {@link #open}.
+
+Identity = collections.namedtuple("Identity", "format mode size info")
+
+IDENTIFY_BLOCK = 16384
+
+# errors from plugins that mean "not a (valid) image file"
+_IDENTIFY_ERRORS = (
+    IOError, SyntaxError, IndexError, TypeError, ValueError, EOFError,
+    struct.error
+    )
+
+def _readprefix(fp, size):
+    # read the first bytes of a file with a single positioned read
+    if isStringType(fp):
+        fd = os.open(fp, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        try:
+            return os.pread(fd, size, 0)
+        finally:
+            os.close(fd)
+    try:
+        return os.pread(fp.fileno(), size, 0)
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        pos = fp.tell()
+        fp.seek(0)
+        data = fp.read(size)
+        fp.seek(pos)
+        return data
+
+##
+# Identifies the given image file, without decoding any image data.
+# <p>
+# This reads the first {@link #IDENTIFY_BLOCK} bytes of the file with a
+# single read, and parses the header from that.  If the header extends
+# beyond that block, the file is opened in the usual way instead.  No
+# pixel storage is allocated in either case.  Header data that plugins
+# read on demand (such as TIFF tags) is read while identifying, so
+# none of it refers to the first block.
+#
+# @param fp A filename (string) or a file object.
+# @return An {@link #Identity} tuple.
+# @exception IOError If the file cannot be found, or the image cannot be
+#    identified.
+
+def identify(fp):
+    "Identify an image file, reading only its header"
+
+    prefix = _readprefix(fp, IDENTIFY_BLOCK)
+    try:
+        im = open(io.BytesIO(prefix))
+        _resolve(im)
+    except _IDENTIFY_ERRORS:
+        if len(prefix) < IDENTIFY_BLOCK:
+            raise IOError("cannot identify image file")
+        # header didn't fit in the block; do it the slow way
+        if not isStringType(fp):
+            fp.seek(0)
+        try:
+            im = open(fp)
+            _resolve(im)
+        except _IDENTIFY_ERRORS:
+            raise IOError("cannot identify image file")
+        if isStringType(fp):
+            im.fp.close()
+    return Identity(im.format, im.mode, im.size, im.info)
+
+def _resolve(im):
+    # read tag values that are still in the file
+    tag = getattr(im, "tag", None)
+    if tag is not None and getattr(tag, "fp", None) is not None:
+        tag.resolve()
+
+##
+# Identifies a number of image files, using a pool of worker threads.
+#
+# @param paths A sequence of filenames.
+# @param workers Number of worker threads.  The positioned reads release
+#    the interpreter lock, so a few threads help even for files that are
+#    already in the page cache.
+# @return A list of {@link #Identity} tuples, in the same order as the
+#    filenames.  Files that cannot be read or identified are given as
+#    None.
+
+def identify_many(paths, workers=4):
+    "Identify many image files"
+
+    def _identify(path):
+        try:
+            return identify(path)
+        except (IOError, OSError):
+            return None
+
+    if workers <= 1:
+        return list(map(_identify, paths))
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(workers) as executor:
+        return list(executor.map(_identify, paths))
+
 #
 # Image processing.
 
@@ -29,6 +29,7 @@
 
 import os
 import io
+import marshal
 import string
 import traceback
 
@@ -36,8 +37,13 @@ from . import Image
 
 MAXBLOCK = 65536
 
+RAWBLOCK = 1024*1024
+
 SAFEBLOCK = 1024*1024
 
+# distance between saved frames in animation frame indexes
+KEYFRAMES = 16
+
 ERRORS = {
     -1: "image buffer overrun error",
     -2: "decoding error",
@@ -63,6 +69,138 @@ def _tilesort(item):
     # sort on offset
     return item[2]
 
+def _maptile(tile, size):
+    # merge raw strips that follow each other in the file into a
+    # single tile covering the whole image, so that the image memory
+    # can be mapped in one piece.  returns None if that's not possible.
+    tile = sorted(tile, key=_tilesort)
+    d, e, o, a = tile[0]
+    if len(tile) == 1:
+        if d == "raw" and e == (0, 0) + size:
+            return tile[0]
+        return None
+    stride = None
+    y = 0
+    for d, e, offset, args in tile:
+        if d != "raw" or args[0] != a[0] or args[2] != 1:
+            return None
+        if e != (0, y, size[0], e[3]):
+            return None
+        if y:
+            if stride is None:
+                stride, rem = divmod(offset - o, y)
+                if rem or stride <= 0 or a[1] and stride != a[1]:
+                    return None
+            if offset != o + y * stride:
+                return None
+        y = e[3]
+    if y != size[1]:
+        return None
+    return "raw", (0, 0) + size, o, (a[0], stride, 1)
+
+class _MapFile:
+    # file-like reader for a memory map.  reads return views into the
+    # map, so data is handed to the decoder without being copied.
+
+    def __init__(self, map):
+        self.data = memoryview(map)
+        self.offset = 0
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset = offset + self.offset
+        elif whence == 2:
+            offset = offset + len(self.data)
+        self.offset = offset
+
+    def read(self, size=-1):
+        pos = self.offset
+        if size < 0:
+            data = self.data[pos:]
+        else:
+            data = self.data[pos:pos+size]
+        self.offset = pos + len(data)
+        return data
+
+def _decode(decoder, read, blocksize, prefix=b""):
+    # feed data from read() to the decoder until it is done, and
+    # return the final status.  unconsumed data is kept in a single
+    # bytearray; consumed bytes are dropped from its front, which is
+    # a constant-time operation, so each byte is copied at most once.
+    buffer = bytearray(prefix)
+    while 1:
+        s = read(blocksize)
+        if not s:
+            raise IOError(
+                "image file is truncated (%d bytes not processed)" %
+                len(buffer)
+                )
+        if buffer:
+            buffer += s
+            view = memoryview(buffer).toreadonly()
+            try:
+                n, e = decoder.decode(view)
+            finally:
+                view.release()
+            if n < 0:
+                return e
+            del buffer[:n]
+        else:
+            # nothing pending; hand the block over as is
+            n, e = decoder.decode(s)
+            if n < 0:
+                return e
+            if n < len(s):
+                buffer += memoryview(s)[n:]
+
+#
+# --------------------------------------------------------------------
+# Frame index
+
+##
+# Frame index for animation formats that can only be decoded in order,
+# since each frame is drawn on top of the previous ones.  The index
+# holds the file offset of each frame seen so far, and a copy of the
+# decoder state (including the composited image) every
+# <b>interval</b> frames.  Seeking then never decodes more than
+# <b>interval</b> frames.  Formats with independent frames only use
+# the offsets.
+# <p>
+# The offsets (but not the saved frames) can be stored with
+# <b>dump</b> and given back to a new index with <b>load</b>.
+
+class FrameIndex:
+    "Frame offsets and keyframes for an animation"
+
+    def __init__(self, interval=KEYFRAMES):
+        self.interval = interval
+        self.offsets = [] # where each frame starts in the file
+        self.keyframes = {} # frame number -> decoder state
+        self.frames = None # number of frames, once known
+
+    def keyframe(self, frame):
+        # get the last saved frame at or before the given frame
+        key = frame - frame % self.interval
+        while key >= 0:
+            if key in self.keyframes:
+                return key
+            key = key - self.interval
+        return None
+
+    def dump(self):
+        "Get the frame offsets as a string"
+        return marshal.dumps((1, self.offsets, self.frames))
+
+    def load(self, data):
+        "Add frame offsets from a string created by dump"
+        version, offsets, frames = marshal.loads(data)
+        if version != 1:
+            raise ValueError("unknown frame index version")
+        if len(offsets) > len(self.offsets):
+            self.offsets = list(offsets)
+        if frames is not None:
+            self.frames = frames
+
 #
 # --------------------------------------------------------------------
 # ImageFile base class
@@ -73,6 +211,10 @@ def _tilesort(item):
 class ImageFile(Image.Image):
     "Base class for image file format handlers."
 
+    # read size used by load(); formats that mostly hold raw pixel
+    # data can use larger blocks
+    decodermaxblock = MAXBLOCK
+
     def __init__(self, fp=None, filename=None):
         Image.Image.__init__(self)
 
@@ -80,7 +222,6 @@ class ImageFile(Image.Image):
         self.readonly = 1 # until we know better
 
         self.decoderconfig = ()
-        self.decodermaxblock = MAXBLOCK
 
         if Image.isStringType(fp):
             # filename
@@ -139,44 +280,78 @@ class ImageFile(Image.Image):
 
         readonly = 0
 
-        if self.filename and len(self.tile) == 1:
-            # try memory mapping
+        if self.filename and len(self.tile) == 1 and hasattr(Image.core, "map"):
+            # try memory mapping, using the built-in mapper
             d, e, o, a = self.tile[0]
             if d == "raw" and a[0] == self.mode and a[0] in Image._MAPMODES:
                 try:
-                    if hasattr(Image.core, "map"):
-                        # use built-in mapper
-                        self.map = Image.core.map(self.filename)
-                        self.map.seek(o)
-                        self.im = self.map.readimage(
-                            self.mode, self.size, a[1], a[2]
-                            )
-                    else:
-                        # use mmap, if possible
-                        import mmap
-                        file = open(self.filename, "r+")
-                        size = os.path.getsize(self.filename)
-                        # FIXME: on Unix, use PROT_READ etc
-                        self.map = mmap.mmap(file.fileno(), size)
-                        self.im = Image.core.map_buffer(
-                            self.map, self.size, d, e, o, a
-                            )
+                    self.map = Image.core.map(self.filename)
+                    self.map.seek(o)
+                    self.im = self.map.readimage(
+                        self.mode, self.size, a[1], a[2]
+                        )
                     readonly = 1
-                except (AttributeError, EnvironmentError, ImportError):
+                except (AttributeError, EnvironmentError):
+                    self.map = None
+
+        elif (self.filename and self.tile and
+              getattr(self.fp, "name", None) == self.filename and
+              not hasattr(self, "load_read") and
+              not hasattr(self, "load_seek")):
+            # raw data (possibly split into strips): map the file
+            # read-only, and use the mapped pixels as image memory
+            # if the layout allows it
+            for d, e, o, a in self.tile:
+                if d != "raw":
+                    break
+            else:
+                try:
+                    import mmap
+                    file = open(self.filename, "rb")
+                    try:
+                        self.map = mmap.mmap(
+                            file.fileno(), 0, access=mmap.ACCESS_READ
+                            )
+                    finally:
+                        file.close()
+                except (EnvironmentError, ImportError, ValueError):
                     self.map = None
+                tile = self.map and _maptile(self.tile, self.size)
+                if tile:
+                    d, e, o, a = tile
+                    mapmodes = getattr(Image.core, "MAPMODES", Image._MAPMODES)
+                    try:
+                        if a[0] in mapmodes:
+                            im = Image.core.map_buffer(
+                                self.map, self.size, d, e, o, a
+                                )
+                            if im.mode == self.mode:
+                                self.im = im
+                                readonly = 1
+                    except (AttributeError, ValueError):
+                        pass
 
         self.load_prepare()
 
-        # look for read/seek overrides
-        try:
-            read = self.load_read
-        except AttributeError:
-            read = self.fp.read
+        if self.map and not readonly:
+            # could not use the map as is; decode straight from it
+            mapfile = _MapFile(self.map)
+            read, seek = mapfile.read, mapfile.seek
+            blocksize = len(self.map)
+            self.map = None
+        else:
+            # look for read/seek overrides
+            try:
+                read = self.load_read
+            except AttributeError:
+                read = self.fp.read
 
-        try:
-            seek = self.load_seek
-        except AttributeError:
-            seek = self.fp.seek
+            try:
+                seek = self.load_seek
+            except AttributeError:
+                seek = self.fp.seek
+
+            blocksize = self.decodermaxblock
 
         if not self.map:
 
@@ -189,6 +364,7 @@ class ImageFile(Image.Image):
             except AttributeError:
                 prefix = b""
 
+            err = 0
             for d, e, o, a in self.tile:
                 d = Image._getdecoder(self.mode, d, a, self.decoderconfig)
                 seek(o)
@@ -196,27 +372,19 @@ class ImageFile(Image.Image):
                     d.setimage(self.im, e)
                 except ValueError:
                     continue
-                b = prefix
-                t = len(b)
-                while 1:
-                    s = read(self.decodermaxblock)
-                    if not s:
-                        self.tile = []
-                        raise IOError("image file is truncated (%d bytes not processed)" % len(b))
-                    b = b + s
-                    n, e = d.decode(b)
-                    if n < 0:
-                        break
-                    b = b[n:]
-                    t = t + n
+                try:
+                    err = _decode(d, read, blocksize, prefix)
+                except IOError:
+                    self.tile = []
+                    raise
 
         self.tile = []
         self.readonly = readonly
 
         self.fp = None # might be shared
 
-        if not self.map and e < 0:
-            raise_ioerror(e)
+        if not self.map and err < 0:
+            raise_ioerror(err)
 
         # post processing
         if hasattr(self, "tile_post_rotate"):
@@ -240,6 +408,49 @@ class ImageFile(Image.Image):
         # may be overridden
         pass
 
+    # random access to animation frames.  formats that can only be
+    # decoded in order set frameindex to a FrameIndex, and provide
+    # _rewind (go to the first frame), _step (go to the next frame,
+    # or raise EOFError), and _getstate/_setstate (a copy of the
+    # decoder state for the current frame, once loaded).
+
+    frameindex = None
+
+    # formats that draw each frame on top of the previous one set this,
+    # so the frames skipped by a seek are decoded as well
+    framecomposite = 0
+
+    def _seekframe(self, frame):
+        index = self.frameindex
+        if frame < 0 or (index.frames is not None and frame >= index.frames):
+            raise EOFError("no such frame")
+        current = self.tell()
+        if frame == current:
+            return
+        # start from the nearest saved frame, unless the current
+        # frame is closer
+        key = index.keyframe(frame)
+        if frame < current or (key is not None and key > current):
+            if key is None:
+                self._rewind()
+            else:
+                self._setstate(index.keyframes[key])
+        while self.tell() < frame:
+            if self.tile and self.framecomposite:
+                self.load() # needed to draw the next frame
+            try:
+                self._step()
+            except EOFError:
+                index.frames = self.tell() + 1
+                raise
+
+    def _keyframe(self):
+        # save the decoder state, if this frame is due
+        index = self.frameindex
+        frame = self.tell()
+        if frame % index.interval == 0 and frame not in index.keyframes:
+            index.keyframes[frame] = self._getstate()
+
     # may be defined for contained formats
     # def load_seek(self, pos):
     #     pass
@@ -284,7 +495,8 @@ class StubImageFile(ImageFile):
 # (Internal) Support class for the <b>Parser</b> file.
 
 class _ParserFile:
-    # parser support class.
+    # parser support class.  wraps the header data collected so far;
+    # reads return copies of just the requested range.
 
     def __init__(self, data):
         self.data = data
@@ -305,37 +517,41 @@ class _ParserFile:
             # force error in Image.open
             raise IOError("illegal argument to seek")
 
-    def read(self, bytes=0):
+    def read(self, size=-1):
         pos = self.offset
-        if bytes:
-            data = self.data[pos:pos+bytes]
-        else:
+        if size < 0:
             data = self.data[pos:]
+        else:
+            data = self.data[pos:pos+size]
         self.offset = pos + len(data)
-        return data
+        return bytes(data)
 
     def readline(self):
-        # FIXME: this is slow!
-        s = b""
-        while 1:
-            c = self.read(1)
-            if not c:
-                break
-            s = s + c
-            if c == b"\n":
-                break
-        return s
+        pos = self.offset
+        end = self.data.find(b"\n", pos)
+        if end < 0:
+            end = len(self.data)
+        else:
+            end = end + 1
+        return self.read(end - pos)
 
 ##
 # Incremental image parser.  This class implements the standard
 # feed/close consumer interface.
+# <p>
+# Until the image header has been parsed, incoming data is collected
+# in a single growing buffer.  After that, data is handed to the
+# decoder as it arrives, and only the bytes the decoder has not yet
+# consumed are kept, so memory use does not grow with the file size.
 
 class Parser:
 
     incremental = None
     image = None
     data = None
+    chunks = None
     decoder = None
+    offset = 0
     finished = 0
 
     ##
@@ -344,7 +560,8 @@ class Parser:
     # instances cannot be reused.
 
     def reset(self):
-        assert self.data is None, "cannot reuse parsers"
+        assert self.data is None and self.chunks is None, \
+               "cannot reuse parsers"
 
     ##
     # (Consumer) Feed data to the parser.
@@ -358,46 +575,38 @@ class Parser:
         if self.finished:
             return
 
-        if self.data is None:
-            self.data = data
-        else:
-            self.data = self.data + data
+        if not isinstance(data, bytes):
+            # the caller may reuse its buffer; keep a private copy
+            data = bytes(data)
 
         # parse what we have
         if self.decoder:
 
+            data = memoryview(data)
+
             if self.offset > 0:
                 # skip header
-                skip = min(len(self.data), self.offset)
-                self.data = self.data[skip:]
+                skip = min(len(data), self.offset)
+                data = data[skip:]
                 self.offset = self.offset - skip
-                if self.offset > 0 or not self.data:
+                if self.offset > 0 or not (data or self.chunks):
                     return
 
-            n, e = self.decoder.decode(self.data)
-
-            if n < 0:
-                # end of stream
-                self.data = None
-                self.finished = 1
-                if e < 0:
-                    # decoding error
-                    self.image = None
-                    raise_ioerror(e)
-                else:
-                    # end of image
-                    return
-            self.data = self.data[n:]
+            self.__decode(data)
 
         elif self.image:
 
             # if we end up here with no decoder, this file cannot
             # be incrementally parsed.  wait until we've gotten all
             # available data
-            pass
+            self.data += data
 
         else:
 
+            if self.data is None:
+                self.data = bytearray()
+            self.data += data
+
             # attempt to open this file
             try:
                 try:
@@ -422,14 +631,48 @@ class Parser:
                         )
                     self.decoder.setimage(im.im, e)
 
-                    # calculate decoder offset
-                    self.offset = o
-                    if self.offset <= len(self.data):
-                        self.data = self.data[self.offset:]
+                    # the header is done with; keep a view of the
+                    # pixel data it may already contain
+                    if o < len(self.data):
+                        self.chunks = [memoryview(self.data)[o:]]
                         self.offset = 0
+                    else:
+                        self.chunks = []
+                        self.offset = o - len(self.data)
+                    self.data = None
 
                 self.image = im
 
+    def __decode(self, data):
+        # feed pending data to the decoder.  in the usual case only
+        # a partial line is left over from the previous call, so at
+        # most that much is copied; a single chunk is passed as is.
+        chunks = self.chunks
+        if data:
+            chunks.append(data)
+        if len(chunks) == 1:
+            buffer = chunks[0]
+        else:
+            buffer = memoryview(b"".join(chunks))
+
+        n, e = self.decoder.decode(buffer)
+
+        if n < 0:
+            # end of stream
+            self.chunks = None
+            self.finished = 1
+            if e < 0:
+                # decoding error
+                self.image = None
+                raise_ioerror(e)
+            else:
+                # end of image
+                return
+        if n < len(buffer):
+            self.chunks = [buffer[n:]]
+        else:
+            self.chunks = []
+
     ##
     # (Consumer) Close the stream.
     #
@@ -441,7 +684,7 @@ class Parser:
         if self.decoder:
             # get rid of what's left in the buffers
             self.feed(b"")
-            self.data = self.decoder = None
+            self.chunks = self.decoder = None
             if not self.finished:
                 raise IOError("image was incomplete")
         if not self.image:
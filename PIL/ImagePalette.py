@@ -47,7 +47,7 @@ class ImagePalette:
             raise ValueError("palette contains raw palette data")
         if Image.isBytesType(self.palette):
             return self.palette
-        return array.array("B", self.palette).tostring()
+        return array.array("B", self.palette).tobytes()
 
     def getcolor(self, color):
         # experimental: given an rgb tuple, allocate palette entry
@@ -22,12 +22,18 @@
 #
 
 from . import Image
-import operator, math
-from functools import reduce
+import array, math, sys
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from operator import add, mul
+
+_LEVELS = list(range(256))
+_SQUARES = [j * j for j in _LEVELS]
 
 ##
 # The <b>ImageStat</b> module calculates global statistics for an
-# image, or a region of an image.
+# image, or a region of an image.  To get statistics for many regions
+# of the same image, use an <b>IntegralImage</b>.
 ##
 
 ##
@@ -66,52 +72,76 @@ class Stat:
         setattr(self, id, v)
         return v
 
-    def _getextrema(self):
-        "Get min/max values for each band in the image"
+    ##
+    # Get a percentile for each band.  This is the lowest pixel level
+    # such that more than p percent of the pixels are at or below it
+    # (or the highest level in use, for 100).  The median is the 50th
+    # percentile.  For an empty histogram, this is 255.
+    #
+    # @param p Percentile, from 0 to 100.
+    # @return A list with one pixel level per band.
 
-        def minmax(histogram):
-            n = 255
-            x = 0
-            for i in range(256):
-                if histogram[i]:
-                    n = min(n, i)
-                    x = max(x, i)
-            return n, x # returns (255, 0) if there's no data in the histogram
+    def percentile(self, p):
+        "Get percentile for each layer"
 
+        if not 0 <= p <= 100:
+            raise ValueError("percentile must be between 0 and 100")
         v = []
+        for c in self.cumulative:
+            n = c[-1]
+            if not n:
+                v.append(len(c) - 1) # empty histogram
+                continue
+            v.append(bisect_right(c, min(n * p // 100, n - 1)))
+        return v
+
+    def _compute(self):
+        "Get count, sums and cumulative counts for each layer"
+
+        self.count, self.sum, self.sum2, self.cumulative = [], [], [], []
         for i in range(0, len(self.h), 256):
-            v.append(minmax(self.h[i:]))
+            h = self.h[i:i+256]
+            c = list(accumulate(h))
+            self.count.append(c[-1])
+            self.sum.append(float(sum(map(mul, h, _LEVELS))))
+            self.sum2.append(float(sum(map(mul, h, _SQUARES))))
+            self.cumulative.append(c)
+
+    def _getextrema(self):
+        "Get min/max values for each band in the image"
+
+        v = []
+        for c in self.cumulative:
+            n = c[-1]
+            if n:
+                v.append((bisect_right(c, 0), bisect_left(c, n)))
+            else:
+                v.append((255, 0)) # no data in the histogram
         return v
 
     def _getcount(self):
         "Get total number of pixels in each layer"
 
-        v = []
-        for i in range(0, len(self.h), 256):
-            v.append(reduce(operator.add, self.h[i:i+256]))
-        return v
+        self._compute()
+        return self.count
 
     def _getsum(self):
         "Get sum of all pixels in each layer"
 
-        v = []
-        for i in range(0, len(self.h), 256):
-            sum = 0.0
-            for j in range(256):
-                sum = sum + j * self.h[i+j]
-            v.append(sum)
-        return v
+        self._compute()
+        return self.sum
 
     def _getsum2(self):
         "Get squared sum of all pixels in each layer"
 
-        v = []
-        for i in range(0, len(self.h), 256):
-            sum2 = 0.0
-            for j in range(256):
-                sum2 = sum2 + (j ** 2) * float(self.h[i+j])
-            v.append(sum2)
-        return v
+        self._compute()
+        return self.sum2
+
+    def _getcumulative(self):
+        "Get cumulative pixel counts for each layer"
+
+        self._compute()
+        return self.cumulative
 
     def _getmean(self):
         "Get average pixel level for each layer"
@@ -124,24 +154,14 @@ class Stat:
     def _getmedian(self):
         "Get median pixel level for each layer"
 
-        v = []
-        for i in self.bands:
-            s = 0
-            l = self.count[i] // 2
-            b = i * 256
-            for j in range(256):
-                s = s + self.h[b+j]
-                if s > l:
-                    break
-            v.append(j)
-        return v
+        return self.percentile(50)
 
     def _getrms(self):
         "Get RMS for each layer"
 
         v = []
         for i in self.bands:
-            v.append(math.sqrt(self.sum2[i] // self.count[i]))
+            v.append(math.sqrt(self.sum2[i] / self.count[i]))
         return v
 
 
@@ -163,3 +183,179 @@ class Stat:
         return v
 
 Global = Stat # compatibility
+
+def _integral8(data, width, height, bands):
+    # summed-area tables of values and squares, for 8-bit data.  each
+    # band of a line is summed with accumulate, into 32-bit lanes, one
+    # pixel in; the line sums are then widened to 64-bit lanes, and
+    # added to the sums of the lines above with a single big integer
+    # addition.
+    linesize = width * bands
+    count = (width + 1) * bands # lanes per table line
+    lo = 0 if sys.byteorder == "little" else 4
+    line32 = array.array("I", bytes(count * 4))
+    line64 = bytearray(count * 8)
+    tables = []
+    for squares in (False, True):
+        table = bytearray(count * 8) # the first line is all zeros
+        acc = 0
+        for y in range(0, height * linesize, linesize):
+            for band in range(bands):
+                line = data[y+band:y+linesize:bands]
+                if squares:
+                    line = map(_SQUARES.__getitem__, line)
+                line32[bands+band::bands] = array.array("I", accumulate(line))
+            line = line32.tobytes()
+            for i in range(4):
+                line64[lo+i::8] = line[i::4]
+            acc += int.from_bytes(line64, sys.byteorder)
+            table += acc.to_bytes(count * 8, sys.byteorder)
+        tables.append(array.array("q", bytes(table)))
+    return tables
+
+##
+# Summed-area tables for an image.  The tables hold, for each band,
+# the sum of all pixel values (and of their squares) above and to the
+# left of each pixel, so that the sum, mean or variance of any
+# rectangle can be had from four table entries, without looking at the
+# pixels.  Building the tables takes one pass over the image.
+
+class IntegralImage:
+    "Get statistics for regions of an image"
+
+    ##
+    # Create summed-area tables for an image.
+    #
+    # @def __init__(image)
+    # @param image A PIL image.
+
+    def __init__(self, image):
+        if image.mode == "1":
+            image = image.convert("L")
+        self.size = width, height = image.size
+        self.bands = list(range(len(image.getbands())))
+        if image.mode in ("I", "F"):
+            # single band; sum each line, then add up the lines
+            data = array.array(image.mode.lower(), image.tobytes())
+            self.sums = array.array("d", bytes(8 * (width + 1)))
+            self.sums2 = array.array("d", self.sums)
+            row = row2 = self.sums.tolist()
+            for y in range(0, height * width, width):
+                line = data[y:y+width]
+                row = list(map(add, row, accumulate(line, initial=0)))
+                row2 = list(map(
+                    add, row2, accumulate(map(mul, line, line), initial=0)
+                    ))
+                self.sums.extend(row)
+                self.sums2.extend(row2)
+        else:
+            data = image.tobytes()
+            if len(data) != width * height * len(self.bands):
+                raise ValueError("image has wrong mode")
+            self.sums, self.sums2 = _integral8(
+                data, width, height, len(self.bands)
+                )
+
+    def _corners(self, box):
+        # table indexes for the corners of a box, and its area
+        x0, y0, x1, y1 = box
+        width, height = self.size
+        x0 = min(max(int(x0), 0), width); x1 = min(max(int(x1), x0), width)
+        y0 = min(max(int(y0), 0), height); y1 = min(max(int(y1), y0), height)
+        w = width + 1
+        n = len(self.bands)
+        return (
+            (y0*w+x0) * n, (y0*w+x1) * n, (y1*w+x0) * n, (y1*w+x1) * n
+            ), (x1-x0) * (y1-y0)
+
+    def _sums(self, corners, t):
+        # sums over a box, given its corners, for each band
+        a, b, c, d = corners
+        return [t[d+i] - t[b+i] - t[c+i] + t[a+i] for i in self.bands]
+    ##
+    # Get the number of pixels in a region.
+    #
+    # @param box A 4-tuple giving the left, upper, right, and lower
+    #    pixel coordinate of the region.  The region is clipped to the
+    #    image.
+    # @return The number of pixels in the region.
+
+    def count(self, box):
+        "Get number of pixels in a region"
+
+        return self._corners(box)[1]
+
+    ##
+    # Get the sum of all pixels in a region, for each band.
+    #
+    # @param box A 4-tuple giving the region.
+    # @return A list with one sum per band.
+
+    def sum(self, box):
+        "Get sum of all pixels in a region, for each band"
+
+        return self._sums(self._corners(box)[0], self.sums)
+
+    ##
+    # Get the squared sum of all pixels in a region, for each band.
+    #
+    # @param box A 4-tuple giving the region.
+    # @return A list with one sum per band.
+
+    def sum2(self, box):
+        "Get squared sum of all pixels in a region, for each band"
+
+        return self._sums(self._corners(box)[0], self.sums2)
+
+    ##
+    # Get the average pixel level of a region, for each band.
+    #
+    # @param box A 4-tuple giving the region.
+    # @return A list with one mean per band.
+    # @exception ValueError If the region is empty.
+
+    def mean(self, box):
+        "Get average pixel level of a region, for each band"
+
+        corners, n = self._corners(box)
+        if not n:
+            raise ValueError("empty region")
+        return [s / n for s in self._sums(corners, self.sums)]
+
+    ##
+    # Get the variance of a region, for each band.
+    #
+    # @param box A 4-tuple giving the region.
+    # @return A list with one variance per band.
+    # @exception ValueError If the region is empty.
+
+    def var(self, box):
+        "Get variance of a region, for each band"
+
+        corners, n = self._corners(box)
+        if not n:
+            raise ValueError("empty region")
+        return [(s2 - s * s / n) / n for s, s2 in zip(
+            self._sums(corners, self.sums), self._sums(corners, self.sums2)
+            )]
+
+    ##
+    # Get the average pixel levels of many regions at once.
+    #
+    # @param boxes A sequence of 4-tuples giving the regions.
+    # @return A list with one list of means (one per band) for each
+    #    region.
+    # @exception ValueError If a region is empty.
+
+    def means(self, boxes):
+        "Get average pixel levels of many regions"
+
+        corners = [self._corners(box) for box in boxes]
+        if not all([n for c, n in corners]):
+            raise ValueError("empty region")
+        t = self.sums
+        bands = self.bands
+        return [
+            [(t[d+i] - t[b+i] - t[c+i] + t[a+i]) / n for i in bands]
+            for (a, b, c, d), n in corners
+            ]
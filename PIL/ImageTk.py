@@ -166,6 +166,11 @@ class PhotoImage:
         # convert to blittable
         im.load()
         image = im.im
+        if not hasattr(image, "new_block"):
+            # no native image blocks (pure-Python core); let Tk read
+            # the pixels from an in-memory PPM image instead
+            self.__paste_ppm(im, box)
+            return
         if image.isblock() and im.mode == self.__mode:
             block = image
         else:
@@ -188,6 +193,22 @@ class PhotoImage:
             except (ImportError, AttributeError, tkinter.TclError):
                 raise # configuration problem; cannot attach to Tkinter
 
+    def __paste_ppm(self, im, box):
+        # blit the whole image with a single "put" command
+        if self.__mode in ("1", "L"):
+            head, mode = b"P5", "L"
+        else:
+            head, mode = b"P6", "RGB"
+        if im.mode != mode:
+            im = im.convert(mode)
+        data = head + bytes("\n%d %d\n255\n" % im.size, "ascii") + im.tobytes()
+        if box is None:
+            box = (0, 0)
+        self.__photo.tk.call(
+            self.__photo.name, "put", data, "-format", "ppm",
+            "-to", box[0], box[1]
+            )
+
 # --------------------------------------------------------------------
 # BitmapImage
 
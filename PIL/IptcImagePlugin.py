@@ -263,7 +263,7 @@ def getiptcinfo(im):
         # get raw data from the IPTC/NAA tag (PhotoShop tags the data
         # as 4-byte integers, so we cannot use the get method...)
         try:
-            type, data = im.tag.tagdata[TiffImagePlugin.IPTC_NAA_CHUNK]
+            type, data = im.tag.getdata(TiffImagePlugin.IPTC_NAA_CHUNK)
         except (AttributeError, KeyError):
             pass
 
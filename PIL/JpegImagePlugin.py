@@ -433,7 +433,7 @@ def _save(im, fp, filename):
         subsampling = 0
     elif subsampling == "4:2:2":
         subsampling = 1
-    elif subsampling == "4:1:1":
+    elif subsampling in ("4:1:1", "4:2:0"):
         subsampling = 2
 
     extra = b""
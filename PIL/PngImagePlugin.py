@@ -391,11 +391,14 @@ class PngImageFile(ImageFile.ImageFile):
 
             self.fp.read(4) # CRC
 
-            cid, pos, len = self.png.read()
+            try:
+                cid, pos, len = self.png.read()
+            except (IndexError, SyntaxError):
+                return b"" # truncated file
 
             if cid not in [b"IDAT", b"DDAT"]:
                 self.png.push(cid, pos, len)
-                return ""
+                return b""
 
             self.__idat = len # empty chunks are allowed
 
@@ -454,13 +457,27 @@ def putchunk(fp, cid, *data):
     fp.write(o16(hi) + o16(lo))
 
 class _idat:
-    # wrap output from the encoder in IDAT chunks
+    # wrap output from the encoder in IDAT chunks.  if a size is
+    # given, output is collected and written in chunks of that size
 
-    def __init__(self, fp, chunk):
+    def __init__(self, fp, chunk, size=None):
         self.fp = fp
         self.chunk = chunk
+        self.size = size
+        self.data = bytearray()
     def write(self, data):
-        self.chunk(self.fp, b"IDAT", data)
+        if not self.size:
+            if data:
+                self.chunk(self.fp, b"IDAT", data)
+            return
+        self.data += data
+        while len(self.data) >= self.size:
+            self.chunk(self.fp, b"IDAT", bytes(self.data[:self.size]))
+            del self.data[:self.size]
+    def flush(self):
+        if self.data:
+            self.chunk(self.fp, b"IDAT", bytes(self.data))
+            del self.data[:]
 
 def _save(im, fp, filename, chunk=putchunk, check=0):
     # save an image to disk (called by the save method)
@@ -498,10 +515,19 @@ def _save(im, fp, filename, chunk=putchunk, check=0):
     if "dictionary" in im.encoderinfo:
         dictionary = im.encoderinfo["dictionary"]
     else:
-        dictionary = ""
+        dictionary = b""
 
     im.encoderconfig = ("optimize" in im.encoderinfo, dictionary)
 
+    # compression level (0-9) and scanline filter choice; these are
+    # only passed on when given
+    compress_level = im.encoderinfo.get("compress_level", -1)
+    filter_strategy = im.encoderinfo.get("filter_strategy")
+    if filter_strategy is not None:
+        im.encoderconfig = im.encoderconfig + (compress_level, filter_strategy)
+    elif compress_level != -1:
+        im.encoderconfig = im.encoderconfig + (compress_level,)
+
     # get the corresponding PNG mode
     try:
         rawmode, mode = _OUTMODES[mode]
@@ -572,7 +598,9 @@ def _save(im, fp, filename, chunk=putchunk, check=0):
         data = name + b"\0\0" + zlib.compress(im.info["icc_profile"])
         chunk(fp, b"iCCP", data)
 
-    ImageFile._save(im, _idat(fp, chunk), [("zip", (0,0)+im.size, 0, rawmode)])
+    idat = _idat(fp, chunk, im.encoderinfo.get("idat_size"))
+    ImageFile._save(im, idat, [("zip", (0,0)+im.size, 0, rawmode)])
+    idat.flush()
 
     chunk(fp, b"IEND", b"")
 
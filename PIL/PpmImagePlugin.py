@@ -48,10 +48,16 @@ class PpmImageFile(ImageFile.ImageFile):
     format = "PPM"
     format_description = "Pbmplus image"
 
+    # mostly raw pixel data; read in large blocks
+    decodermaxblock = ImageFile.RAWBLOCK
+
     def _token(self, s = b""):
         while 1: # read until next whitespace
             c = self.fp.read(1)
-            if not c or chr(c[0]) in string.whitespace:
+            if not c:
+                # the header always ends with a whitespace character
+                raise SyntaxError("truncated PPM header")
+            if chr(c[0]) in string.whitespace:
                 break
             s = s + c
         return s
@@ -86,6 +92,17 @@ class PpmImageFile(ImageFile.ImageFile):
                 ysize = s
                 if mode == "1":
                     break
+            elif s > 255:
+                # two bytes per sample, most significant first.  the
+                # samples are not scaled, so only full range 16-bit
+                # files are supported
+                if s != 65535:
+                    raise SyntaxError("unsupported PPM maxval %d" % s)
+                if mode == "L":
+                    self.mode = "I"
+                    rawmode = "I;16B"
+                elif mode == "RGB":
+                    rawmode = "RGB;16B"
 
         self.size = xsize, ysize
         self.tile = [("raw",
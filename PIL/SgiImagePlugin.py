@@ -42,6 +42,9 @@ class SgiImageFile(ImageFile.ImageFile):
     format = "SGI"
     format_description = "SGI Image File Format"
 
+    # mostly raw pixel data; read in large blocks
+    decodermaxblock = ImageFile.RAWBLOCK
+
     def _open(self):
 
         # HEAD
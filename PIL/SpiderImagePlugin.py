@@ -87,6 +87,9 @@ class SpiderImageFile(ImageFile.ImageFile):
     format = "SPIDER"
     format_description = "Spider 2D image"
 
+    # mostly raw pixel data; read in large blocks
+    decodermaxblock = ImageFile.RAWBLOCK
+
     def _open(self):
         # check header
         n = 27 * 4  # read 27 float values
@@ -38,7 +38,7 @@
 
 __version__ = "1.3.6"
 
-import array, sys
+import array, io, os, sys
 
 
 from . import Image
@@ -104,6 +104,7 @@ ARTIST = 315
 PREDICTOR = 317
 COLORMAP = 320
 TILEOFFSETS = 324
+TILEBYTECOUNTS = 325
 EXTRASAMPLES = 338
 SAMPLEFORMAT = 339
 JPEGTABLES = 347
@@ -123,8 +124,10 @@ COMPRESSION_INFO = {
     5: "tiff_lzw",
     6: "tiff_jpeg", # obsolete
     7: "jpeg",
+    8: "tiff_deflate",
     32771: "tiff_raw_16", # 16-bit padding
-    32773: "packbits"
+    32773: "packbits",
+    32946: "tiff_deflate", # obsolete
 }
 
 OPEN_INFO = {
@@ -211,7 +214,8 @@ def _accept(prefix):
 class ImageFileDirectory:
 
     # represents a TIFF tag directory.  to speed things up,
-    # we don't decode tags unless they're asked for.
+    # we don't decode tags unless they're asked for, and values
+    # stored outside the directory aren't even read until then.
 
     def __init__(self, prefix):
         self.prefix = prefix[:2]
@@ -228,33 +232,65 @@ class ImageFileDirectory:
     def reset(self):
         self.tags = {}
         self.tagdata = {}
+        self.tagref = {} # tag => type, count, offset (not yet read)
         self.tagtype = {} # added 2008-06-05 by Florian Hoech
         self.next = None
+        self.fp = None
 
     # dictionary API (sort of)
 
     def keys(self):
-        return list(self.tagdata.keys()) + list(self.tags.keys())
+        return (list(self.tagdata.keys()) + list(self.tagref.keys()) +
+                list(self.tags.keys()))
 
     def items(self):
         items = list(self.tags.items())
-        for tag in list(self.tagdata.keys()):
+        for tag in list(self.tagdata.keys()) + list(self.tagref.keys()):
             items.append((tag, self[tag]))
         return items
 
     def __len__(self):
-        return len(self.tagdata) + len(self.tags)
+        return len(self.tagdata) + len(self.tagref) + len(self.tags)
 
     def __getitem__(self, tag):
         try:
             return self.tags[tag]
         except KeyError:
-            type, data = self.tagdata[tag] # unpack on the fly
+            type, data = self.getdata(tag) # unpack on the fly
             size, handler = self.load_dispatch[type]
             self.tags[tag] = data = handler(self, data)
             del self.tagdata[tag]
             return data
 
+    def getdata(self, tag):
+        "Get the type and raw data for a tag that hasn't been unpacked"
+        try:
+            return self.tagdata[tag]
+        except KeyError:
+            pass
+        type, count, offset = self.tagref[tag]
+        size = self.load_dispatch[type][0] * count
+        fp = self.fp
+        if fp is None or getattr(fp, "closed", False):
+            raise IOError("cannot read tag %d, the file is closed" % tag)
+        here = fp.tell()
+        try:
+            fp.seek(offset)
+            data = ImageFile._safe_read(fp, size)
+        finally:
+            fp.seek(here)
+        if len(data) != size:
+            raise IOError("not enough data")
+        self.tagdata[tag] = type, data
+        del self.tagref[tag]
+        return type, data
+
+    def resolve(self):
+        "Read all tag values still in the file, and release the file"
+        for tag in list(self.tagref.keys()):
+            self.getdata(tag)
+        self.fp = None
+
     def get(self, tag, default=None):
         try:
             return self[tag]
@@ -277,10 +313,11 @@ class ImageFileDirectory:
             return default
 
     def has_key(self, tag):
-        return (tag in self.tags) or (tag in self.tagdata)
+        return tag in self
 
     def __contains__(self, tag):
-        return (tag in self.tags) or (tag in self.tagdata)
+        return (tag in self.tags) or (tag in self.tagdata) or \
+               (tag in self.tagref)
 
     def __setitem__(self, tag, value):
         if type(value) is not type(()):
@@ -345,16 +382,23 @@ class ImageFileDirectory:
     load_dispatch[7] = (1, load_undefined)
 
     def load(self, fp):
-        # load tag dictionary
+        # load tag dictionary.  values that don't fit in the directory
+        # entry are read from the file on first access.
 
         self.reset()
+        self.fp = fp
 
         i16 = self.i16
         i32 = self.i32
 
-        for i in range(i16(fp.read(2))):
+        count = i16(fp.read(2))
+        directory = fp.read(count * 12 + 4)
+        if len(directory) != count * 12 + 4:
+            raise IOError("not enough data")
+
+        for i in range(0, count * 12, 12):
 
-            ifd = fp.read(12)
+            ifd = directory[i:i+12]
 
             tag, typ = i16(ifd), i16(ifd, 2)
 
@@ -376,19 +420,12 @@ class ImageFileDirectory:
 
             size = size * i32(ifd, 4)
 
-            # Get and expand tag value
+            # Get tag value, or where to find it
             if size > 4:
-                here = fp.tell()
-                fp.seek(i32(ifd, 8))
-                data = ImageFile._safe_read(fp, size)
-                fp.seek(here)
+                self.tagref[tag] = typ, i32(ifd, 4), i32(ifd, 8)
             else:
-                data = ifd[8:8+size]
-
-            if len(data) != size:
-                raise IOError("not enough data")
+                self.tagdata[tag] = typ, ifd[8:8+size]
 
-            self.tagdata[tag] = typ, data
             self.tagtype[tag] = typ
 
             if Image.DEBUG:
@@ -397,7 +434,7 @@ class ImageFileDirectory:
                 else:
                     print("- value:", self[tag])
 
-        self.next = i32(fp.read(4))
+        self.next = i32(directory, count * 12)
 
     # save primitives
 
@@ -513,6 +550,15 @@ class TiffImageFile(ImageFile.ImageFile):
     format = "TIFF"
     format_description = "Adobe TIFF"
 
+    # mostly raw pixel data; read in large blocks
+    decodermaxblock = ImageFile.RAWBLOCK
+
+    # number of threads used to decode deflate compressed strips and
+    # tiles (None for one per CPU, 0 or 1 to decode them in order).
+    # only zlib releases the interpreter lock while decoding, so other
+    # compression methods are always decoded in order.
+    decoderthreads = 1
+
     def _open(self):
         "Open the first image in a TIFF file"
 
@@ -525,8 +571,10 @@ class TiffImageFile(ImageFile.ImageFile):
         # image file directory (tag dictionary)
         self.tag = self.ifd = ImageFileDirectory(ifh[:2])
 
-        # setup frame pointers
-        self.__first = self.__next = self.ifd.i32(ifh, 4)
+        # setup frame pointers.  the index holds the offset of each
+        # image file directory seen so far.
+        self.frameindex = ImageFile.FrameIndex()
+        self.frameindex.offsets.append(self.ifd.i32(ifh, 4))
         self.__frame = -1
         self.__fp = self.fp
 
@@ -548,23 +596,122 @@ class TiffImageFile(ImageFile.ImageFile):
     def _seek(self, frame):
 
         self.fp = self.__fp
-        if frame < self.__frame:
-            # rewind file
-            self.__frame = -1
-            self.__next = self.__first
-        while self.__frame < frame:
-            if not self.__next:
-                raise EOFError("no more images in TIFF file")
-            self.fp.seek(self.__next)
+        index = self.frameindex
+        offsets = index.offsets
+        while len(offsets) <= frame:
+            # follow the chain from the last directory we know about,
+            # reading just the link to the next one
+            if index.frames is None:
+                if len(offsets) == self.__frame + 1:
+                    next = self.tag.next
+                else:
+                    next = self._nextifd(offsets[-1])
+                if next:
+                    offsets.append(next)
+                    continue
+                index.frames = len(offsets)
+            raise EOFError("no more images in TIFF file")
+        if frame != self.__frame:
+            self.fp.seek(offsets[frame])
             self.tag.load(self.fp)
-            self.__next = self.tag.next
-            self.__frame = self.__frame + 1
+            self.__frame = frame
         self._setup()
 
+    def _nextifd(self, offset):
+        # get the offset of the directory following the one at offset
+        self.fp.seek(offset)
+        s = self.fp.read(2)
+        if len(s) < 2:
+            return 0 # truncated file
+        self.fp.seek(offset + 2 + self.tag.i16(s) * 12)
+        s = self.fp.read(4)
+        if len(s) < 4:
+            return 0
+        return self.tag.i32(s)
+
     def _tell(self):
 
         return self.__frame
 
+    def load(self):
+        "Load image data, decoding strips in parallel if possible"
+
+        # the file may be closed once the image is loaded, so read the
+        # tag values that are still in it
+        if self.tag.fp is not None:
+            self.tag.resolve()
+
+        if (self.tile and len(self.tile) > 1
+            and self._compression == "tiff_deflate"
+            and self._planar_configuration == 1):
+            threads = self.decoderthreads
+            if threads is None:
+                threads = os.cpu_count() or 1
+            if threads > 1:
+                bytecounts = self._bytecounts()
+                if bytecounts:
+                    return self._load_threaded(threads, bytecounts)
+        return ImageFile.ImageFile.load(self)
+
+    def _bytecounts(self):
+        # get the compressed size of each strip or tile, by offset
+        if STRIPOFFSETS in self.tag:
+            offsets, bytecounts = STRIPOFFSETS, STRIPBYTECOUNTS
+        else:
+            offsets, bytecounts = TILEOFFSETS, TILEBYTECOUNTS
+        if bytecounts not in self.tag:
+            return None
+        return dict(zip(self.tag[offsets], self.tag[bytecounts]))
+
+    def _load_threaded(self, threads, bytecounts):
+        # strips (and tiles) are compressed independently, and cover
+        # disjoint regions of the image.  read them in file order, and
+        # let a pool of threads decode them straight into the image
+        # memory.  this scales with the number of CPUs as long as the
+        # codec releases the interpreter lock, so it is only used for
+        # deflate compression (zlib does).
+        from concurrent.futures import ThreadPoolExecutor
+
+        Image.Image.load(self)
+        self.load_prepare()
+
+        try:
+            prefix = self.tile_prefix
+        except AttributeError:
+            prefix = b""
+
+        self.tile.sort(key=ImageFile._tilesort)
+        jobs = []
+        for d, e, o, a in self.tile:
+            self.fp.seek(o)
+            jobs.append((d, e, a, self.fp.read(bytecounts[o])))
+
+        def decode(job):
+            d, e, a, data = job
+            decoder = Image._getdecoder(self.mode, d, a, self.decoderconfig)
+            try:
+                decoder.setimage(self.im, e)
+            except ValueError:
+                return 0
+            read = io.BytesIO(data).read
+            return ImageFile._decode(decoder, read, len(data) or 1, prefix)
+
+        try:
+            with ThreadPoolExecutor(min(threads, len(jobs))) as executor:
+                errors = list(executor.map(decode, jobs))
+        finally:
+            self.tile = []
+            self.readonly = 0
+            self.fp = None # might be shared
+
+        for err in errors:
+            if err < 0:
+                ImageFile.raise_ioerror(err)
+
+        self.load_end()
+
+        return Image.Image.load(self)
+
     def _decoder(self, rawmode, layer, tile=None):
         "Setup decoder contexts"
 
@@ -580,14 +727,14 @@ class TiffImageFile(ImageFile.ImageFile):
 
                 # Hack to handle abbreviated JPEG headers
                 self.tile_prefix = self.tag[JPEGTABLES]
-        elif compression == "packbits":
-            args = rawmode
-        elif compression == "tiff_lzw":
+        elif compression in ["packbits", "tiff_lzw", "tiff_deflate"]:
             args = rawmode
-            if 317 in self.tag:
+            # like libtiff, only undo the predictor for LZW and deflate
+            predictor = self.tag.getscalar(PREDICTOR, 1)
+            if predictor != 1 and compression != "packbits":
 
                 # Section 14: Differencing Predictor
-                self.decoderconfig = (self.tag[PREDICTOR][0],)
+                self.decoderconfig = (predictor,)
         elif compression in ["tiff_ccitt", "group3", "group4", "tiff_raw_16"]:
             args = (rawmode,
                     compression,
@@ -612,6 +759,7 @@ class TiffImageFile(ImageFile.ImageFile):
         # extract relevant tags
         self._compression = COMPRESSION_INFO[getscalar(COMPRESSION, 1)]
         self._planar_configuration = getscalar(PLANAR_CONFIGURATION, 1)
+        self.decoderconfig = () # set by _decoder
 
         # photometric is a required tag, but not everyone is reading
         # the specification
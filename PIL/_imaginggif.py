@@ -0,0 +1,335 @@
+#
+# The Python Imaging Library.
+# $Id$
+#
+# GIF ("gif") codecs for the pure-Python core
+#
+# The decoder strips the sub-block framing from the image data as it
+# arrives, and expands the LZW codes straight into the pixel buffer.
+#
+# Every LZW string is the previous string plus the first byte of the
+# current one, and both of those are already in the output, next to
+# each other.  So instead of prefix/suffix chains (or a bytes object
+# per code), the string table holds the offset and length of each
+# string within the decoded pixels, and every code is expanded with a
+# single slice copy.
+#
+# The encoder keys its string table on (prefix code, next byte) packed
+# into one integer, and collects codes in a bit buffer that is flushed
+# 64 bits at a time.
+#
+# See the README file for information on usage and redistribution.
+#
+
+from . import _imagingpack
+from ._imagingpure import _Codec
+
+# GIF codes are at most 12 bits wide
+_MAXCODE = 4096
+
+def _interlace(ysize):
+    # row order of an interlaced image
+    order = []
+    for y0, dy in ((0, 8), (4, 8), (2, 4), (1, 2)):
+        order.extend(range(y0, ysize, dy))
+    return order
+
+# --------------------------------------------------------------------
+# Decoder
+
+##
+# GIF image data decoder.  Consumes the data sub-blocks following the
+# code size byte of an image descriptor.
+
+class GifDecoder(_Codec):
+
+    def __init__(self, mode, bits=8, interlace=0):
+        _Codec.__init__(self, mode)
+        self.bits = bits
+        self.interlace = interlace
+
+    def setup(self):
+        if self.im.pixelsize != 1:
+            raise ValueError("bad image mode")
+        if not 1 <= self.bits <= 11:
+            raise ValueError("bad code size")
+        im = self.im
+        if (not self.interlace and self.xsize == im.size[0] and
+            isinstance(im.buffer, bytearray)):
+            # consecutive full lines: expand into the image memory
+            self.out = im.buffer
+            self.base = self.yoff * im.linesize
+        else:
+            self.out = bytearray(self.xsize * self.ysize)
+            self.base = 0
+        self.direct = self.out is im.buffer
+        if self.interlace:
+            self.order = _interlace(self.ysize)
+        else:
+            self.order = range(self.ysize)
+        self.data = bytearray() # code stream, without block framing
+        self.block = 0 # bytes left in the current sub-block
+        self.acc = self.count = 0 # bit buffer
+        self.offs = [0] * _MAXCODE # where each string is in the output
+        self.lens = [0] * _MAXCODE
+        self.pos = self.base # end of output
+        self.total = self.base + self.xsize * self.ysize
+        self.lines = 0 # lines stored in the image
+        self.clear()
+
+    def clear(self):
+        self.size = self.bits + 1
+        self.next = (1 << self.bits) + 2
+        self.prev = -1 # length of previous string, if any
+        self.prevpos = 0
+
+    def decode(self, data):
+        if self.im is None:
+            raise ValueError("decoder not initialized")
+        data = memoryview(data)
+        ptr = 0
+        end = 0
+        # strip the block framing
+        while ptr < len(data):
+            if self.block:
+                n = min(self.block, len(data) - ptr)
+                self.data += data[ptr:ptr+n]
+                self.block -= n
+                ptr += n
+            elif data[ptr]:
+                self.block = data[ptr]
+                ptr += 1
+            else:
+                end = 1 # block terminator
+                ptr += 1
+                break
+        try:
+            done = self.expand()
+        except ValueError:
+            return -1, -2 # code out of range
+        self.store()
+        if done or end:
+            return -1, 0
+        return ptr, 0
+
+    def expand(self):
+        # expand all complete codes in the buffer.  returns true when
+        # the image is complete, or the end code has been seen.
+        clear = 1 << self.bits
+        data = self.data
+        out = self.out
+        offs = self.offs
+        lens = self.lens
+        total = self.total
+        acc, count, size = self.acc, self.count, self.size
+        next, prev, prevpos, pos = self.next, self.prev, self.prevpos, self.pos
+        mask = (1 << size) - 1
+        limit = 1 << size
+        ptr = 0
+        n = len(data)
+        done = 1
+        while pos < total:
+            if count < size:
+                # refill the bit buffer; a code spans at most two bytes
+                if ptr + 3 <= n:
+                    acc |= (data[ptr] | data[ptr+1] << 8 |
+                            data[ptr+2] << 16) << count
+                    ptr += 3
+                    count += 24
+                else:
+                    while count < size and ptr < n:
+                        acc |= data[ptr] << count
+                        ptr += 1
+                        count += 8
+                    if count < size:
+                        done = 0
+                        break
+            code = acc & mask
+            acc >>= size
+            count -= size
+            if code < clear:
+                # literal
+                out[pos] = code
+                length = 1
+            elif code == clear:
+                size = self.bits + 1
+                mask = (1 << size) - 1
+                limit = 1 << size
+                next = clear + 2
+                prev = -1
+                continue
+            elif code == clear + 1:
+                break
+            elif prev < 0:
+                raise ValueError("bad code")
+            elif code < next:
+                length = lens[code]
+                if pos + length > total:
+                    length = total - pos
+                off = offs[code]
+                out[pos:pos+length] = out[off:off+length]
+            elif code == next:
+                # the string being defined: the previous string plus
+                # its own first byte
+                length = prev + 1
+                if pos + length > total:
+                    length = total - pos
+                out[pos:pos+length-1] = out[prevpos:prevpos+length-1]
+                out[pos+length-1] = out[prevpos]
+            else:
+                raise ValueError("bad code")
+            if prev >= 0 and next < _MAXCODE:
+                # new string: the previous one followed by the first
+                # byte of this one, which is where the previous one
+                # ends in the output
+                offs[next] = prevpos
+                lens[next] = prev + 1
+                next += 1
+                if next >= limit and size < 12:
+                    size += 1
+                    mask = (1 << size) - 1
+                    limit = 1 << size
+            prev = length
+            prevpos = pos
+            pos += length
+        del data[:ptr]
+        self.acc, self.count, self.size = acc, count, size
+        self.next, self.prev, self.prevpos, self.pos = next, prev, prevpos, pos
+        return done
+
+    def store(self):
+        # copy completed lines to the image
+        lines = (self.pos - self.base) // self.xsize
+        if not self.direct:
+            im = self.im
+            out = self.out
+            xsize = self.xsize
+            for i in range(self.lines, lines):
+                start = (self.yoff + self.order[i]) * im.linesize + self.xoff
+                im.buffer[start:start+xsize] = out[i*xsize:(i+1)*xsize]
+        self.lines = lines
+
+# --------------------------------------------------------------------
+# Encoder
+
+##
+# GIF image data encoder.  Produces the data sub-blocks for an image
+# descriptor, without the block terminator.
+
+class GifEncoder(_Codec):
+
+    def __init__(self, mode, rawmode=None, bits=8, interlace=0):
+        _Codec.__init__(self, mode, rawmode)
+        self.bits = bits
+        self.interlace = interlace
+
+    def setup(self):
+        if not 2 <= self.bits <= 8:
+            raise ValueError("bad code size")
+        bits, self.pack = _imagingpack.getpacker(self.im.mode, self.rawmode)
+        if bits != 8:
+            raise ValueError("bad raw mode")
+        if self.interlace:
+            self.order = _interlace(self.ysize)
+        else:
+            self.order = range(self.ysize)
+        self.line = 0
+        self.data = bytearray() # code stream, without block framing
+        self.table = {}
+        self.next = (1 << self.bits) + 2
+        self.size = self.bits + 1
+        self.code = -1 # current prefix, if any
+        # bit buffer, starting with a clear code
+        self.acc, self.count = 1 << self.bits, self.size
+        self.done = 0
+
+    def encode(self, bufsize):
+        if self.im is None:
+            raise ValueError("encoder not initialized")
+        if self.done:
+            return 0, 1, b""
+        buffer = self.im.buffer
+        while len(self.data) < bufsize and self.line < self.ysize:
+            start, stop = self._line(self.order[self.line])
+            self.compress(self.pack(buffer[start:stop], self.xsize))
+            self.line += 1
+        if self.line >= self.ysize:
+            self.finish()
+            self.done = 1
+        # frame the code stream in sub-blocks of up to 255 bytes
+        data = self.data
+        size = len(data)
+        if not self.done:
+            size = size - size % 255
+        out = bytearray()
+        for i in range(0, size, 255):
+            block = data[i:i+255]
+            out.append(len(block))
+            out += block
+        del data[:size]
+        return len(out), self.done, bytes(out)
+
+    def encode_to_file(self, fh, bufsize):
+        import os
+        while 1:
+            l, s, d = self.encode(bufsize)
+            os.write(fh, d)
+            if s:
+                return s
+
+    def compress(self, row):
+        clear = 1 << self.bits
+        table = self.table
+        get = table.get
+        out = self.data
+        code, next, size = self.code, self.next, self.size
+        acc, count = self.acc, self.count
+        limit = 1 << size
+        if code < 0:
+            code = row[0]
+            row = row[1:]
+        for c in row:
+            key = code << 8 | c
+            x = get(key)
+            if x is not None:
+                # extend the current string
+                code = x
+                continue
+            acc |= code << count
+            count += size
+            if next < _MAXCODE:
+                table[key] = next
+                next += 1
+                if next > limit and size < 12:
+                    size += 1
+                    limit <<= 1
+            else:
+                # table full; start over
+                acc |= clear << count
+                count += size
+                table.clear()
+                next = clear + 2
+                size = self.bits + 1
+                limit = 1 << size
+            if count >= 64:
+                out += (acc & 0xffffffffffffffff).to_bytes(8, "little")
+                acc >>= 64
+                count -= 64
+            code = c
+        self.code, self.next, self.size = code, next, size
+        self.acc, self.count = acc, count
+
+    def finish(self):
+        # emit the current string and an end code, and flush
+        acc, count, size = self.acc, self.count, self.size
+        if self.code >= 0:
+            acc |= self.code << count
+            count += size
+            # the decoder adds a string for this code, and may switch
+            # to a larger code size before reading the end code
+            if self.next >= 1 << size and size < 12:
+                size += 1
+        acc |= ((1 << self.bits) + 1) << count
+        count += size
+        self.data += acc.to_bytes((count + 7) // 8, "little")
+        self.acc = self.count = 0
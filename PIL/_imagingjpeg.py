@@ -0,0 +1,1474 @@
+#
+# The Python Imaging Library.
+# $Id$
+#
+# JPEG ("jpeg") decoder and encoder for the pure-Python core
+#
+# Handles baseline, extended (8-bit) and progressive Huffman-coded
+# files, with any sampling factors and restart intervals, in
+# greyscale, YCbCr, RGB, CMYK and YCCK.
+#
+# The decoder collects the file as it arrives, and decodes one scan
+# at a time once all of it is available.  Restart markers split a
+# scan into segments, and each segment is unstuffed with a single
+# bytes.replace and read 32 bits at a time.  Huffman codes of up to
+# 9 bits are decoded with a single table lookup; for AC coefficients
+# whose code and value both fit in 9 bits, the same lookup also gives
+# the run length and the (sign-extended) value.
+#
+# The inverse DCT is done with big integers as SIMD registers: each
+# output pixel of a block is a 40-bit lane, and each coefficient adds
+# its dequantized basis image to all lanes with a single multiply-add.
+# Blocks with only a DC coefficient are filled with a constant.
+#
+# For draft mode, the decoder can produce 1/2, 1/4 or 1/8 scale
+# images.  Each block is then reduced to 4x4, 2x2 or 1x1 pixels.  The
+# reduced basis images are box averages of the full ones, so (up to
+# rounding and clamping) a reduced image is the block-wise average of
+# the full one.  At 1/8 scale, only the DC coefficient has a nonzero
+# average; AC coefficients are then skipped without dequantizing, and
+# the AC scans of progressive files are not decoded at all.
+#
+# Chroma is upsampled by pixel replication.
+#
+# The encoder writes baseline files, with 4:2:0, 4:2:2 or 4:4:4
+# sampling.  Quantization tables are scaled once per quality setting.
+# The forward DCT is the AAN algorithm (as in libjpeg's jfdctfst),
+# run on a whole row of blocks at a time with one 64-bit lane per
+# block, and quantization multiplies by precomputed reciprocals.
+# Blocks that have a single value (as in pixelized images) skip the
+# DCT altogether.  With the optimize option, the symbols are counted
+# first, and the file gets Huffman tables built for it.
+#
+# See the README file for information on usage and redistribution.
+#
+
+import array
+import collections
+import heapq
+import math
+import re
+import struct
+import sys
+from itertools import compress
+
+from . import _imagingpack
+from ._imagingpure import _Codec, _luma
+
+_LE = sys.byteorder == "little"
+
+# 32-bit words, for the bit reader
+for _WORD in "ILH":
+    if array.array(_WORD).itemsize == 4:
+        break
+
+# natural (row-major) index of each coefficient, in zigzag order
+_ZIGZAG = [
+    0, 1, 8, 16, 9, 2, 3, 10, 17, 24, 32, 25, 18, 11, 4, 5,
+    12, 19, 26, 33, 40, 48, 41, 34, 27, 20, 13, 6, 7, 14, 21, 28,
+    35, 42, 49, 56, 57, 50, 43, 36, 29, 22, 15, 23, 30, 37, 44, 51,
+    58, 59, 52, 45, 38, 31, 39, 46, 53, 60, 61, 54, 47, 55, 62, 63,
+    ]
+
+_MASK = [(1 << i) - 1 for i in range(64)]
+_HALF = [0] + [1 << (i - 1) for i in range(1, 17)]
+
+# scan data ends at the first marker that isn't a restart marker
+_SCANEND = re.compile(rb"\xff[^\x00\xd0-\xd7]")
+_RESTART = re.compile(rb"\xff[\xd0-\xd7]")
+
+# zero bytes appended to each entropy-coded segment; the bit reader
+# reads ahead, and libjpeg also pads short segments with zeros
+_PAD = bytes(64)
+
+# --------------------------------------------------------------------
+# Inverse DCT
+
+# lanes are 40 bits wide, and hold 16.16 fixed point pixel values
+# offset by 2**39, so that all lanes stay positive
+_LANE = 40
+_BIAS = (1 << 39) + (128 << 16) + (1 << 15) # offset, level shift, rounding
+
+# clamping, from the byte above the integer part of each lane
+_KEEP = bytes([255] + [0] * 255) # in range
+_OVER = bytes([0] + [255] * 127 + [0] * 128) # above 255
+
+_BASIS = {}
+
+def _basis(n):
+    # basis images for an n x n output block, in zigzag order.  each
+    # output pixel is the average of (8/n)**2 pixels of the full basis
+    # image.  unlike libjpeg's reduced-size IDCTs, high frequencies
+    # are kept; a block is averaged, not truncated to n x n frequencies.
+    try:
+        return _BASIS[n]
+    except KeyError:
+        pass
+    s = 8 // n
+    a = []
+    for u in range(8):
+        c = math.sqrt(0.5) if u == 0 else 1.0
+        a.append([c * sum(math.cos((2 * (y * s + t) + 1) * u * math.pi / 16)
+                          for t in range(s)) / s for y in range(n)])
+    basis = []
+    for k in range(64):
+        i, j = divmod(_ZIGZAG[k], 8)
+        if n > 1 or k == 0:
+            basis.append([a[i][y] * a[j][x] / 4
+                          for y in range(n) for x in range(n)])
+        else:
+            basis.append(None) # averages to zero
+    _BASIS[n] = basis
+    return basis
+
+def _dequantize(table, n):
+    # dequantized basis images, one big integer per coefficient.  the
+    # list is padded, so corrupt run lengths don't need checking.
+    out = []
+    for k, b in enumerate(_basis(n)):
+        v = 0
+        if b is not None:
+            q = table[k] * 65536.0
+            for i in range(len(b) - 1, -1, -1):
+                v = (v << _LANE) + int(round(q * b[i]))
+        out.append(v)
+    return out + [0] * 16
+
+def _lanes(n):
+    # the bias for all lanes of an n x n block
+    v = 0
+    for i in range(n * n):
+        v = (v << _LANE) | _BIAS
+    return v
+
+# --------------------------------------------------------------------
+# Colour conversion
+
+# YCbCr to RGB, with 6 fractional bits.  each pixel gets a 16-bit lane
+# in a big integer; the chroma tables carry the offsets that keep the
+# lanes positive (256) and the rounding, and the results fit in 10 bits.
+
+def _split(values):
+    # 16-bit table values as a (low bytes, high bytes) pair of tables
+    return (bytes(v & 255 for v in values), bytes(v >> 8 for v in values))
+
+_Y = _split([y * 64 for y in range(256)])
+_CR_R = _split([int(round(1.402 * (c - 128) * 64)) + 16416
+                for c in range(256)])
+_CB_G = _split([-int(round(0.344136 * (c - 128) * 64)) + 8192
+                for c in range(256)])
+_CR_G = _split([-int(round(0.714136 * (c - 128) * 64)) + 8224
+                for c in range(256)])
+_CB_B = _split([int(round(1.772 * (c - 128) * 64)) + 16416
+                for c in range(256)])
+
+_INVERT = bytes(range(255, -1, -1))
+_IN_RANGE = bytes([0, 255] + [0] * 254) # high byte 1: 0..255
+_ABOVE = bytes([0, 0] + [255] * 254) # high byte 2: above 255
+
+def _wide(plane, table, buf):
+    # look up a plane in a 16-bit table, as a big integer
+    buf[0::2] = plane.translate(table[0])
+    buf[1::2] = plane.translate(table[1])
+    return int.from_bytes(buf, "little")
+
+def _narrow(v, n, mask):
+    # drop the fractional bits of n lanes, and clamp to 0..255
+    v = ((v >> 6) & mask).to_bytes(n * 2, "little")
+    lo = v[0::2]
+    hi = v[1::2]
+    if hi.count(1) == n:
+        return lo
+    v = int.from_bytes(lo, "little") & int.from_bytes(
+        hi.translate(_IN_RANGE), "little"
+        ) | int.from_bytes(hi.translate(_ABOVE), "little")
+    return v.to_bytes(n, "little")
+
+def _ycc2rgb(y, cb, cr):
+    n = len(y)
+    buf = bytearray(n * 2)
+    mask = int.from_bytes(b"\xff\x03" * n, "little")
+    y = _wide(y, _Y, buf)
+    r = _narrow(y + _wide(cr, _CR_R, buf), n, mask)
+    g = _narrow(y + _wide(cb, _CB_G, buf) + _wide(cr, _CR_G, buf), n, mask)
+    b = _narrow(y + _wide(cb, _CB_B, buf), n, mask)
+    return r, g, b
+
+# pixels per slice when converting
+_CHUNK = 1 << 16
+
+# --------------------------------------------------------------------
+# Huffman decoding
+
+class _Huffman:
+    # a Huffman table.  look maps the next 9 bits to (length << 8 |
+    # symbol), or to 0 if the code is longer; fast maps them to
+    # (bits used, run, value) for AC coefficients that fit, (bits
+    # used, -1, 0) for the end of block code, or None.
+
+    def __init__(self, counts, symbols):
+        look = [0] * 512
+        self.maxcode = maxcode = [-1] * 17
+        self.delta = delta = [0] * 17
+        self.symbols = symbols
+        code = k = 0
+        for l in range(1, 17):
+            n = counts[l - 1]
+            delta[l] = k - code
+            for i in range(n):
+                if l <= 9:
+                    shift = 9 - l
+                    entry = l << 8 | symbols[k]
+                    for j in range(code << shift, (code + 1) << shift):
+                        look[j] = entry
+                code += 1
+                k += 1
+            if n:
+                maxcode[l] = code - 1
+            code <<= 1
+        self.look = look
+        fast = [None] * 512
+        for i, e in enumerate(look):
+            l = e >> 8
+            r, s = (e & 255) >> 4, e & 15
+            if e and s and l + s <= 9:
+                v = (i >> (9 - l - s)) & _MASK[s]
+                if v < _HALF[s]:
+                    v -= _MASK[s]
+                fast[i] = l + s, r, v
+            elif e and not (e & 255):
+                fast[i] = l, -1, 0
+        self.fast = fast
+
+    def slow(self, acc, count):
+        # (length, symbol) for a code longer than 9 bits
+        code = (acc >> (count - 16)) & 0xffff
+        maxcode = self.maxcode
+        for l in range(10, 17):
+            c = code >> (16 - l)
+            if c <= maxcode[l]:
+                return l, self.symbols[c + self.delta[l]]
+        raise ValueError("bad huffman code")
+
+class _Bits:
+    # bit reader for progressive scans
+
+    def __init__(self, segment):
+        self.words = _words(segment)
+        self.wp = self.acc = self.count = 0
+
+    def fill(self):
+        self.acc = ((self.acc & _MASK[self.count]) << 32) | \
+                   self.words[self.wp]
+        self.wp += 1
+        self.count += 32
+
+    def get(self, n):
+        if self.count < n:
+            self.fill()
+        self.count -= n
+        return (self.acc >> self.count) & _MASK[n]
+
+    def receive(self, s):
+        # an s-bit signed value
+        if not s:
+            return 0
+        v = self.get(s)
+        if v < _HALF[s]:
+            v -= _MASK[s]
+        return v
+
+    def decode(self, table):
+        if self.count < 16:
+            self.fill()
+        e = table.look[(self.acc >> (self.count - 9)) & 511]
+        if e:
+            self.count -= e >> 8
+            return e & 255
+        n, s = table.slow(self.acc, self.count)
+        self.count -= n
+        return s
+
+def _words(segment):
+    # unstuff an entropy-coded segment, as big-endian 32-bit words
+    data = segment.replace(b"\xff\x00", b"\xff")
+    data += bytes((-len(data)) % 4) + _PAD
+    words = array.array(_WORD, data)
+    if _LE:
+        words.byteswap()
+    return words
+
+def _store(plane, width, n, y, blocks):
+    # copy a row of n x n blocks to block row y of a plane
+    s = b"".join(blocks)
+    if n == 1:
+        plane[y*width:y*width+len(s)] = s
+        return
+    size = n * n
+    stop = len(blocks) * n
+    for r in range(n):
+        start = (y * n + r) * width
+        for c in range(n):
+            plane[start+c:start+stop:n] = s[r*n+c::size]
+
+# --------------------------------------------------------------------
+# Decoder
+
+_RAWMODES = {
+    # raw mode => bands
+    "L": 1, "RGB": 3, "YCbCr": 3, "CMYK": 4, "CMYK;I": 4,
+    }
+
+class JpegDecoder(_Codec):
+
+    def __init__(self, mode, rawmode=None, jpegmode="", scale=1, draft=0):
+        _Codec.__init__(self, mode, rawmode)
+        if self.rawmode not in _RAWMODES:
+            raise ValueError("unsupported raw mode %s" % self.rawmode)
+        scale = scale or 1
+        if scale not in (1, 2, 4, 8):
+            raise ValueError("unsupported scale %d" % scale)
+        self.jpegmode = jpegmode
+        self.n = 8 // scale # output pixels per block side
+
+    def setup(self):
+        if self.im.pixelsize != _RAWMODES[self.rawmode]:
+            raise ValueError("raw mode doesn't match image")
+        self.data = bytearray()
+        self.pos = 0
+        self.pending = None # scan header, while waiting for scan data
+        self.scanpos = 0
+        self.frame = None
+        self.progressive = 0
+        self.huffman = {}
+        self.qt = {}
+        self.ri = 0
+        self.jfif = 0
+        self.adobe = None
+        self.eobrun = 0
+
+    def decode(self, data):
+        if self.im is None:
+            raise ValueError("decoder not initialized")
+        self.data += data
+        try:
+            if self.parse():
+                self.finish()
+                return -1, 0
+        except (ValueError, IndexError, KeyError, OverflowError):
+            return -1, -2
+        # drop what has been parsed
+        del self.data[:self.pos]
+        self.scanpos -= self.pos
+        self.pos = 0
+        return len(data), 0
+
+    def parse(self):
+        # handle complete markers and scans.  returns true at the
+        # end of the image.
+        data = self.data
+        pos = self.pos
+        n = len(data)
+        try:
+            while 1:
+                if self.pending:
+                    m = _SCANEND.search(data, self.scanpos)
+                    if not m:
+                        self.scanpos = max(pos, n - 1)
+                        break
+                    self.scan(self.pending, data[pos:m.start()])
+                    self.pending = None
+                    pos = m.start()
+                if pos + 1 >= n:
+                    break
+                if data[pos] != 255:
+                    # junk; skip to the next marker
+                    pos = data.find(b"\xff", pos)
+                    if pos < 0:
+                        pos = n
+                    continue
+                marker = data[pos+1]
+                if marker == 255:
+                    pos += 1 # fill byte
+                    continue
+                if marker == 0xd8 or marker == 0x01 or \
+                   0xd0 <= marker <= 0xd7:
+                    pos += 2 # SOI, TEM, stray restart marker
+                    continue
+                if marker == 0xd9:
+                    if self.frame is None:
+                        raise ValueError("no image in file")
+                    return 1 # EOI
+                if pos + 4 > n:
+                    break
+                end = pos + 2 + (data[pos+2] << 8 | data[pos+3])
+                if end > n:
+                    break
+                segment = bytes(data[pos+4:end])
+                pos = end
+                if marker == 0xc4:
+                    self.dht(segment)
+                elif marker == 0xdb:
+                    self.dqt(segment)
+                elif marker in (0xc0, 0xc1, 0xc2):
+                    self.sof(marker, segment)
+                elif 0xc3 <= marker <= 0xcf and marker != 0xcc:
+                    raise ValueError("unsupported JPEG process")
+                elif marker == 0xdd:
+                    self.ri = segment[0] << 8 | segment[1]
+                elif marker == 0xda:
+                    self.pending = self.sos(segment)
+                    self.scanpos = pos
+                elif marker == 0xe0:
+                    if segment[:5] == b"JFIF\0":
+                        self.jfif = 1
+                elif marker == 0xee:
+                    if segment[:5] == b"Adobe" and len(segment) >= 12:
+                        self.adobe = segment[11]
+        finally:
+            self.pos = pos
+        return 0
+
+    # ----------------------------------------------------------------
+    # Markers
+
+    def dht(self, s):
+        i = 0
+        while i < len(s):
+            kind = s[i]
+            counts = s[i+1:i+17]
+            k = i + 17 + sum(counts)
+            self.huffman[kind >> 4, kind & 15] = _Huffman(
+                counts, list(s[i+17:k])
+                )
+            i = k
+
+    def dqt(self, s):
+        i = 0
+        while i < len(s):
+            t = s[i]
+            if t >> 4:
+                table = array.array("H", s[i+1:i+129])
+                if _LE:
+                    table.byteswap()
+                i += 129
+            else:
+                table = s[i+1:i+65]
+                i += 65
+            self.qt[t & 15] = list(table)
+
+    def sof(self, marker, s):
+        if self.frame is not None:
+            raise ValueError("multiple frames")
+        if s[0] != 8:
+            raise ValueError("unsupported sample precision")
+        self.progressive = marker == 0xc2
+        height, width = s[1] << 8 | s[2], s[3] << 8 | s[4]
+        if not height or not width:
+            raise ValueError("bad image size")
+        comps = []
+        for i in range(s[5]):
+            c = s[6+i*3:9+i*3]
+            comps.append((c[0], c[1] >> 4, c[1] & 15, c[2]))
+        hmax = max(c[1] for c in comps)
+        vmax = max(c[2] for c in comps)
+        for c in comps:
+            if not c[1] or not c[2] or hmax % c[1] or vmax % c[2]:
+                raise ValueError("unsupported sampling factors")
+        self.width, self.height = width, height
+        self.hmax, self.vmax = hmax, vmax
+        self.mcux = -(-width // (8 * hmax))
+        self.mcuy = -(-height // (8 * vmax))
+        self.frame = comps
+        n = self.n
+        # pixel planes, covering all MCUs, and for progressive files
+        # the coefficients (just the DC ones at 1/8 scale)
+        self.planes = []
+        self.coefs = []
+        self.stride = 64 if n > 1 else 1
+        for id, h, v, tq in comps:
+            nbx, nby = self.mcux * h, self.mcuy * v
+            self.planes.append(bytearray(nbx * n * nby * n))
+            if self.progressive:
+                self.coefs.append(
+                    array.array("h", bytes(2 * self.stride * nbx * nby))
+                    )
+        self.needed = [1] * len(comps)
+        if self.rawmode == "L" and len(comps) > 1 and not self.isrgb():
+            self.needed = [1] + [0] * (len(comps) - 1) # just luma
+
+    def sos(self, s):
+        if self.frame is None:
+            raise ValueError("scan before frame")
+        ids = [c[0] for c in self.frame]
+        scan = []
+        for i in range(s[0]):
+            c = s[1+i*2:3+i*2]
+            scan.append((ids.index(c[0]), c[1] >> 4, c[1] & 15))
+        i = 1 + 2 * s[0]
+        return scan, s[i], s[i+1], s[i+2] >> 4, s[i+2] & 15
+
+    def isrgb(self):
+        # libjpeg's guess: no colour transform, or components R, G, B
+        if self.jpegmode:
+            return self.jpegmode == "RGB"
+        if self.jfif:
+            return 0
+        if self.adobe is not None:
+            return self.adobe == 0
+        return [c[0] for c in self.frame] == [82, 71, 66]
+
+    # ----------------------------------------------------------------
+    # Scans
+
+    def scan(self, header, data):
+        comps, ss, se, ah, al = header
+        segments = _RESTART.split(data)
+        if not self.progressive:
+            self.sequential(comps, segments)
+        elif ss == 0:
+            self.dcscan(comps, segments, ah, al)
+        elif len(comps) != 1 or se > 63 or ss > se:
+            raise ValueError("bad progressive scan")
+        elif self.n > 1:
+            # (at 1/8 scale, only the DC coefficients are needed)
+            self.acscan(comps[0], segments, ss, se, ah, al)
+
+    def layout(self, comps):
+        # MCU columns and rows, and (component, h, v) for each block
+        # group in an MCU.  a single component scan has one block per
+        # MCU, and covers only the blocks inside the image.
+        if len(comps) == 1:
+            c = comps[0][0]
+            id, h, v, tq = self.frame[c]
+            w = -(-(-(-self.width * h // self.hmax)) // 8)
+            h = -(-(-(-self.height * v // self.vmax)) // 8)
+            return w, h, [(c, 1, 1)]
+        return self.mcux, self.mcuy, [
+            (c, self.frame[c][1], self.frame[c][2]) for c, td, ta in comps
+            ]
+
+    def sequential(self, comps, segments):
+        # decode and render a baseline (or extended) scan
+        mcux, mcuy, layout = self.layout(comps)
+        n = self.n
+        flat = [bytes((i,)) * (n * n) for i in range(256)]
+        bias = _lanes(n)
+        nbytes = n * n * 5
+        zeros = bytes(n * n)
+        units = []
+        for (c, h, v), (ci, td, ta) in zip(layout, comps):
+            tq = self.frame[c][3]
+            q = self.qt[tq]
+            qb = _dequantize(q, n) if self.needed[c] else [0] * 80
+            units.append((
+                self.huffman[0, td], self.huffman[1, ta], qb, q[0],
+                self.needed[c], h, v, c
+                ))
+        masks, half = _MASK, _HALF
+        ri = self.ri
+        left = ri or mcux * mcuy
+        segments = iter(segments)
+        words = _words(next(segments))
+        wp = acc = count = 0
+        preds = [0] * len(units)
+        for my in range(mcuy):
+            rows = [[[] for j in range(u[6])] for u in units]
+            for mx in range(mcux):
+                if not left:
+                    # restart interval
+                    words = _words(next(segments, b""))
+                    wp = acc = count = 0
+                    preds = [0] * len(units)
+                    left = ri
+                left -= 1
+                for ui in range(len(units)):
+                    dct, act, qb, q0, render, h, v, c = units[ui]
+                    dclook, aclook, acfast = dct.look, act.look, act.fast
+                    for by in range(v):
+                        row = rows[ui][by]
+                        for bx in range(h):
+                            # DC difference
+                            if count < 27:
+                                acc = ((acc & masks[count]) << 32) | \
+                                      words[wp]
+                                wp += 1
+                                count += 32
+                            e = dclook[(acc >> (count - 9)) & 511]
+                            if e:
+                                count -= e >> 8
+                                s = e & 255
+                            else:
+                                e, s = dct.slow(acc, count)
+                                count -= e
+                            if s:
+                                count -= s
+                                d = (acc >> count) & masks[s]
+                                if d < half[s]:
+                                    d -= masks[s]
+                                preds[ui] += d
+                            # AC coefficients
+                            t = 0
+                            k = 1
+                            while k < 64:
+                                if count < 27:
+                                    acc = ((acc & masks[count]) << 32) | \
+                                          words[wp]
+                                    wp += 1
+                                    count += 32
+                                look = (acc >> (count - 9)) & 511
+                                f = acfast[look]
+                                if f is not None:
+                                    count -= f[0]
+                                    if f[1] < 0:
+                                        break # end of block
+                                    k += f[1]
+                                    t += f[2] * qb[k]
+                                    k += 1
+                                    continue
+                                e = aclook[look]
+                                if e:
+                                    count -= e >> 8
+                                    s = e & 255
+                                else:
+                                    e, s = act.slow(acc, count)
+                                    count -= e
+                                r = s >> 4
+                                s &= 15
+                                if s:
+                                    count -= s
+                                    d = (acc >> count) & masks[s]
+                                    if d < half[s]:
+                                        d -= masks[s]
+                                    k += r
+                                    t += d * qb[k]
+                                    k += 1
+                                elif r == 15:
+                                    k += 16
+                                else:
+                                    break # end of block
+                            if not render:
+                                continue
+                            dc = preds[ui]
+                            if t:
+                                t += dc * qb[0] + bias
+                                b = t.to_bytes(nbytes, "little")
+                                hi = b[3::5]
+                                if hi == zeros:
+                                    row.append(b[2::5])
+                                else:
+                                    row.append(_clamp(b[2::5], hi))
+                            else:
+                                d = ((dc * q0 + 4) >> 3) + 128
+                                if d & -256:
+                                    d = 0 if d < 0 else 255
+                                row.append(flat[d])
+            for (dct, act, qb, q0, render, h, v, c), r in zip(units, rows):
+                if render:
+                    width = self.mcux * self.frame[c][1] * n
+                    for by in range(v):
+                        _store(self.planes[c], width, n, my * v + by, r[by])
+
+    def blocks(self, mcux, mcuy, layout, segments):
+        # (bit reader, [(unit, block index), ...]) for each MCU
+        ri = self.ri
+        left = ri or mcux * mcuy
+        bits = _Bits(next(segments))
+        self.eobrun = 0
+        nbx = [self.mcux * self.frame[c][1] for c, h, v in layout]
+        for my in range(mcuy):
+            for mx in range(mcux):
+                if not left:
+                    bits = _Bits(next(segments, b""))
+                    self.preds = [0] * len(layout)
+                    self.eobrun = 0
+                    left = ri
+                left -= 1
+                mcu = []
+                for ui, (c, h, v) in enumerate(layout):
+                    for by in range(v):
+                        for bx in range(h):
+                            i = (my * v + by) * nbx[ui] + mx * h + bx
+                            mcu.append((ui, i))
+                yield bits, mcu
+
+    def dcscan(self, comps, segments, ah, al):
+        # progressive DC scan, first pass or refinement
+        mcux, mcuy, layout = self.layout(comps)
+        tables = [self.huffman[0, td] for c, td, ta in comps]
+        coefs = [self.coefs[c] for c, h, v in layout]
+        stride = self.stride
+        self.preds = [0] * len(layout)
+        for bits, mcu in self.blocks(mcux, mcuy, layout, iter(segments)):
+            for ui, i in mcu:
+                if ah:
+                    if bits.get(1):
+                        coefs[ui][i*stride] |= 1 << al
+                else:
+                    d = bits.receive(bits.decode(tables[ui]))
+                    self.preds[ui] += d
+                    coefs[ui][i*stride] = self.preds[ui] << al
+
+    def acscan(self, comp, segments, ss, se, ah, al):
+        # progressive AC scan, first pass or refinement
+        mcux, mcuy, layout = self.layout([comp])
+        table = self.huffman[1, comp[2]]
+        coef = self.coefs[comp[0]]
+        p1 = 1 << al
+        m1 = -1 << al
+        for bits, mcu in self.blocks(mcux, mcuy, layout, iter(segments)):
+            base = mcu[0][1] * 64
+            if not ah:
+                # first pass
+                if self.eobrun:
+                    self.eobrun -= 1
+                    continue
+                k = ss
+                while k <= se:
+                    s = bits.decode(table)
+                    r = s >> 4
+                    s &= 15
+                    if s:
+                        k += r
+                        coef[base+k] = bits.receive(s) * p1
+                    elif r == 15:
+                        k += 15
+                    else:
+                        self.eobrun = (1 << r) - 1
+                        if r:
+                            self.eobrun += bits.get(r)
+                        break
+                    k += 1
+                continue
+            # refinement, as in libjpeg's decode_mcu_AC_refine
+            k = ss
+            if not self.eobrun:
+                while k <= se:
+                    s = bits.decode(table)
+                    r = s >> 4
+                    s &= 15
+                    if s:
+                        s = p1 if bits.get(1) else m1
+                    elif r != 15:
+                        self.eobrun = 1 << r
+                        if r:
+                            self.eobrun += bits.get(r)
+                        break
+                    while k <= se:
+                        v = coef[base+k]
+                        if v:
+                            if bits.get(1) and not v & p1:
+                                coef[base+k] = v + p1 if v >= 0 else v + m1
+                        else:
+                            r -= 1
+                            if r < 0:
+                                break
+                        k += 1
+                    if s and k <= se:
+                        coef[base+k] = s
+                    k += 1
+            if self.eobrun:
+                # refine the remaining nonzero coefficients
+                while k <= se:
+                    v = coef[base+k]
+                    if v and bits.get(1) and not v & p1:
+                        coef[base+k] = v + p1 if v >= 0 else v + m1
+                    k += 1
+                self.eobrun -= 1
+
+    def render(self, c):
+        # render the coefficients of a progressive file
+        n = self.n
+        stride = self.stride
+        kmax = stride - 1 # AC coefficients per block
+        id, h, v, tq = self.frame[c]
+        q = self.qt[tq]
+        qb = _dequantize(q, n)
+        q0 = q[0]
+        flat = [bytes((i,)) * (n * n) for i in range(256)]
+        bias = _lanes(n)
+        nbytes = n * n * 5
+        zeros = bytes(n * n)
+        none = array.array("h", bytes(2 * kmax))
+        coef = self.coefs[c]
+        nbx, nby = self.mcux * h, self.mcuy * v
+        plane = self.planes[c]
+        for by in range(nby):
+            row = []
+            for i in range((by * nbx) * stride, (by + 1) * nbx * stride,
+                           stride):
+                dc = coef[i]
+                block = coef[i+1:i+kmax+1]
+                if block == none:
+                    d = ((dc * q0 + 4) >> 3) + 128
+                    if d & -256:
+                        d = 0 if d < 0 else 255
+                    row.append(flat[d])
+                    continue
+                t = dc * qb[0] + bias
+                for k in range(kmax):
+                    if block[k]:
+                        t += block[k] * qb[k+1]
+                b = t.to_bytes(nbytes, "little")
+                hi = b[3::5]
+                if hi == zeros:
+                    row.append(b[2::5])
+                else:
+                    row.append(_clamp(b[2::5], hi))
+            _store(plane, nbx * n, n, by, row)
+
+    # ----------------------------------------------------------------
+    # Output
+
+    def finish(self):
+        comps = self.frame
+        n = self.n
+        xsize, ysize = self.xsize, self.ysize
+        bands = []
+        for c, (id, h, v, tq) in enumerate(comps):
+            if not self.needed[c]:
+                continue
+            if self.progressive:
+                self.render(c)
+            plane = self.planes[c]
+            width = self.mcux * h * n
+            fx, fy = self.hmax // h, self.vmax // v
+            if fx > 1:
+                # replicating each byte widens every line
+                wide = bytearray(len(plane) * fx)
+                for i in range(fx):
+                    wide[i::fx] = plane
+                plane = wide
+                width *= fx
+            # crop, and replicate lines
+            if width < xsize or len(plane) // width * fy < ysize:
+                raise ValueError("image too large")
+            lines = [plane[y*width:y*width+xsize]
+                     for y in range(-(-ysize // fy))]
+            if fy > 1:
+                lines = [line for line in lines for i in range(fy)]
+            bands.append(b"".join(lines[:ysize]))
+        step = max(_CHUNK // xsize, 1)
+        for y in range(0, ysize, step):
+            start, stop = y * xsize, min(y + step, ysize) * xsize
+            out = self.convert([band[start:stop] for band in bands])
+            if self.rawmode == "CMYK;I":
+                out = [band.translate(_INVERT) for band in out]
+            self.store(y, out)
+
+    def convert(self, bands):
+        # convert a slice of the image to the raw mode
+        rawmode = self.rawmode
+        if len(self.frame) == 1:
+            if rawmode != "L":
+                raise ValueError("raw mode doesn't match image")
+            return bands
+        if len(bands) == 1:
+            return bands # luma only
+        if len(bands) == 3:
+            if rawmode == "YCbCr":
+                return bands
+            if not self.isrgb():
+                bands = _ycc2rgb(*bands)
+            if rawmode == "L":
+                return [_luma(*bands)]
+            if rawmode == "RGB":
+                return bands
+        elif len(bands) == 4 and rawmode[:4] == "CMYK":
+            ycck = self.adobe == 2
+            if self.jpegmode:
+                ycck = self.jpegmode == "YCCK"
+            if ycck:
+                bands = [band.translate(_INVERT)
+                         for band in _ycc2rgb(*bands[:3])] + [bands[3]]
+            return bands
+        raise ValueError("raw mode doesn't match image")
+
+    def store(self, y, bands):
+        # copy interleaved lines to the image, starting at line y
+        im = self.im
+        nb = len(bands)
+        xsize = self.xsize
+        lines = len(bands[0]) // xsize
+        if nb == 1:
+            pixels = bands[0]
+        else:
+            pixels = bytearray(len(bands[0]) * nb)
+            for i, band in enumerate(bands):
+                pixels[i::nb] = band
+        if self.xoff == 0 and xsize == im.size[0]:
+            start = self._line(y)[0]
+            im.buffer[start:start+len(pixels)] = pixels
+        else:
+            size = xsize * nb
+            for i in range(lines):
+                start, stop = self._line(y + i)
+                im.buffer[start:stop] = pixels[i*size:(i+1)*size]
+
+def _clamp(lo, hi):
+    # clamp a block of pixels, given the integer parts of the lanes
+    v = int.from_bytes(lo, "little") & int.from_bytes(
+        hi.translate(_KEEP), "little"
+        ) | int.from_bytes(hi.translate(_OVER), "little")
+    return v.to_bytes(len(lo), "little")
+
+# --------------------------------------------------------------------
+# Encoder tables
+
+# quantization tables from Annex K of the standard, in zigzag order
+_QUANT = (
+    bytes([
+        16, 11, 12, 14, 12, 10, 16, 14, 13, 14, 18, 17, 16, 19, 24, 40,
+        26, 24, 22, 22, 24, 49, 35, 37, 29, 40, 58, 51, 61, 60, 57, 51,
+        56, 55, 64, 72, 92, 78, 64, 68, 87, 69, 55, 56, 80, 109, 81, 87,
+        95, 98, 103, 104, 103, 62, 77, 113, 121, 112, 100, 120, 92, 101,
+        103, 99,
+        ]),
+    bytes([17, 18, 18, 24, 21, 24, 47, 26, 26, 47, 99, 66, 56, 66] +
+          [99] * 50),
+    )
+
+# Huffman tables from Annex K: (counts, symbols) for luminance DC and
+# AC, and chrominance DC and AC
+_HUFFMAN = (
+    (bytes.fromhex("00010501010101010100000000000000"), bytes(range(12))),
+    (bytes.fromhex("0002010303020403050504040000017d"), bytes.fromhex(
+        "01020300041105122131410613516107227114328191a1082342b1c11552d1f0"
+        "2433627282090a161718191a25262728292a3435363738393a43444546474849"
+        "4a535455565758595a636465666768696a737475767778797a83848586878889"
+        "8a92939495969798999aa2a3a4a5a6a7a8a9aab2b3b4b5b6b7b8b9bac2c3c4c5"
+        "c6c7c8c9cad2d3d4d5d6d7d8d9dae1e2e3e4e5e6e7e8e9eaf1f2f3f4f5f6f7f8"
+        "f9fa")),
+    (bytes.fromhex("00030101010101010101010000000000"), bytes(range(12))),
+    (bytes.fromhex("00020102040403040705040400010277"), bytes.fromhex(
+        "000102031104052131061241510761711322328108144291a1b1c109233352f0"
+        "156272d10a162434e125f11718191a262728292a35363738393a434445464748"
+        "494a535455565758595a636465666768696a737475767778797a828384858687"
+        "88898a92939495969798999aa2a3a4a5a6a7a8a9aab2b3b4b5b6b7b8b9bac2c3"
+        "c4c5c6c7c8c9cad2d3d4d5d6d7d8d9dae2e3e4e5e6e7e8e9eaf2f3f4f5f6f7f8"
+        "f9fa")),
+    )
+
+# the AAN DCT leaves each output scaled by 8 times these factors
+# (for the row and the column frequency)
+_AANSCALE = [
+    1.0, 1.387039845, 1.306562965, 1.175875602,
+    1.0, 0.785694958, 0.541196100, 0.275899379,
+    ]
+
+# AAN multipliers, with 12 fractional bits.  instead of scaling the
+# products back down, the other terms are scaled up, so each pass of
+# the DCT scales all outputs by 2**12.
+_FIX = 12
+_C0_382 = 1567
+_C0_541 = 2217
+_C0_707 = 2896
+_C1_306 = 5352
+
+# quantized coefficients end up in bits 48-63 of 64-bit lanes
+_QLANE = 64
+_QBIAS = (1 << 63) + (1 << 47) # offset, rounding
+_FLIP = bytes(i ^ 128 for i in range(256)) # undo the offset
+
+# coefficient sizes and value bits, indexed by value & 4095.  AC
+# coefficients are limited to 10 bits.
+_DCSIZE = [0] * 4096
+_DCBITS = [0] * 4096
+_ACSIZE = [0] * 4096
+_ACBITS = [0] * 4096
+for _v in range(-2047, 2048):
+    _s = abs(_v).bit_length()
+    _DCSIZE[_v & 4095] = _s
+    _DCBITS[_v & 4095] = _v if _v >= 0 else _v + _MASK[_s]
+    _a = min(max(_v, -1023), 1023)
+    _s = abs(_a).bit_length()
+    _ACSIZE[_v & 4095] = _s
+    _ACBITS[_v & 4095] = _a if _a >= 0 else _a + _MASK[_s]
+del _v, _s, _a
+
+_AC = range(1, 64)
+
+_QTABLES = {}
+
+def _qtables(quality):
+    # quality-scaled quantization tables, as in libjpeg, and the
+    # reciprocals used to quantize the DCT outputs.  cached per
+    # quality setting.
+    try:
+        return _QTABLES[quality]
+    except KeyError:
+        pass
+    if quality < 50:
+        scale = 5000 // quality
+    else:
+        scale = 200 - quality * 2
+    tables = []
+    for table in _QUANT:
+        q = [min(max((v * scale + 50) // 100, 1), 255) for v in table]
+        recips = []
+        for k in range(64):
+            v, u = divmod(_ZIGZAG[k], 8)
+            recips.append(int(round(
+                (1 << (_QLANE - 16 - 2 * _FIX - 3)) /
+                (q[k] * _AANSCALE[u] * _AANSCALE[v])
+                )))
+        # flat blocks: DC values straight from pixel values
+        flat = [int(math.floor(8.0 * (p - 128) / q[0] + 0.5))
+                for p in range(256)]
+        tables.append((bytes(q), recips, flat))
+    _QTABLES[quality] = tables
+    return tables
+
+def _codes(counts, symbols, base):
+    # code lengths and codes for a Huffman table, with the size of the
+    # value bits folded in, indexed by base + symbol
+    lens = {}
+    codes = {}
+    code = k = 0
+    for l in range(1, 17):
+        for i in range(counts[l - 1]):
+            s = symbols[k]
+            lens[base + s] = l + (s & 15)
+            codes[base + s] = code << (s & 15)
+            code += 1
+            k += 1
+        code <<= 1
+    return lens, codes
+
+def _optimal(freq):
+    # an optimal Huffman table (counts, symbols) for the given symbol
+    # frequencies, limited to 16-bit codes (Annex K.2).  a dummy
+    # symbol with the lowest frequency makes sure that no code is all
+    # ones.
+    freq = [(f, s) for s, f in freq.items() if f] + [(0, 256)]
+    heap = [(f, i, [s]) for i, (f, s) in enumerate(freq)]
+    heapq.heapify(heap)
+    size = {}
+    while len(heap) > 1:
+        f1, i, a = heapq.heappop(heap)
+        f2, j, b = heapq.heappop(heap)
+        for s in a + b:
+            size[s] = size.get(s, 0) + 1
+        heapq.heappush(heap, (f1 + f2, max(i, j), a + b))
+    bits = [0] * 33
+    for s, n in size.items():
+        bits[n] += 1
+    for i in range(32, 16, -1):
+        while bits[i] > 0:
+            j = i - 2
+            while bits[j] == 0:
+                j -= 1
+            bits[i] -= 2
+            bits[i - 1] += 1
+            bits[j + 1] += 2
+            bits[j] -= 1
+    i = 16
+    while bits[i] == 0:
+        i -= 1
+    bits[i] -= 1 # drop the dummy symbol
+    symbols = sorted((n, s) for s, n in size.items() if s != 256)
+    return bytes(bits[1:17]), bytes(s for n, s in symbols)
+
+def _fdct(d):
+    # AAN forward DCT of 8 vectors, after libjpeg's jfdctfst
+    tmp0 = d[0] + d[7]
+    tmp7 = d[0] - d[7]
+    tmp1 = d[1] + d[6]
+    tmp6 = d[1] - d[6]
+    tmp2 = d[2] + d[5]
+    tmp5 = d[2] - d[5]
+    tmp3 = d[3] + d[4]
+    tmp4 = d[3] - d[4]
+    # even part
+    tmp10 = tmp0 + tmp3
+    tmp13 = tmp0 - tmp3
+    tmp11 = tmp1 + tmp2
+    tmp12 = tmp1 - tmp2
+    z1 = (tmp12 + tmp13) * _C0_707
+    tmp13 <<= _FIX
+    out0 = (tmp10 + tmp11) << _FIX
+    out4 = (tmp10 - tmp11) << _FIX
+    out2 = tmp13 + z1
+    out6 = tmp13 - z1
+    # odd part
+    tmp10 = tmp4 + tmp5
+    tmp11 = tmp5 + tmp6
+    tmp12 = tmp6 + tmp7
+    z5 = (tmp10 - tmp12) * _C0_382
+    z2 = _C0_541 * tmp10 + z5
+    z4 = _C1_306 * tmp12 + z5
+    z3 = tmp11 * _C0_707
+    tmp7 <<= _FIX
+    z11 = tmp7 + z3
+    z13 = tmp7 - z3
+    return [out0, z11 + z4, out2, z13 - z2, out4, z13 + z2, out6, z11 - z4]
+
+def _rgb2ycc(r, g, b):
+    # RGB to YCbCr, with libjpeg's 16-bit weights.  each pixel gets a
+    # 32-bit lane in a big integer, as in the luma conversion.
+    n = len(r)
+    y = _luma(r, g, b)
+    wide = bytearray(n * 4)
+    planes = []
+    for plane in (r, g, b):
+        wide[0::4] = plane
+        planes.append(int.from_bytes(wide, "little"))
+    r, g, b = planes
+    bias = int.from_bytes(b"\xff\x7f\x80\0" * n, "little") # 128.5 - eps
+    cb = bias - 11059 * r - 21709 * g + 32768 * b
+    cr = bias + 32768 * r - 27439 * g - 5329 * b
+    return (y, cb.to_bytes(n * 4, "little")[2::4],
+            cr.to_bytes(n * 4, "little")[2::4])
+
+def _downsample(plane, width, height, fx, fy):
+    # average fx by fy pixels (each 1 or 2), for all lines at once
+    if fy > 1:
+        lines = [plane[y*width:(y+1)*width] for y in range(height)]
+        parts = [b"".join(lines[0::2]), b"".join(lines[1::2])]
+    else:
+        parts = [plane]
+    if fx > 1:
+        parts = [p[i::2] for p in parts for i in range(2)]
+    if len(parts) == 1:
+        return bytes(plane)
+    n = len(parts[0])
+    wide = bytearray(n * 2)
+    # alternating rounding, as in libjpeg
+    if len(parts) == 4:
+        acc = int.from_bytes(b"\x01\0\x02\0" * (n // 2 + 1), "little")
+    else:
+        acc = int.from_bytes(b"\0\0\x01\0" * (n // 2 + 1), "little")
+    acc &= (1 << (16 * n)) - 1
+    for part in parts:
+        wide[0::2] = part
+        acc += int.from_bytes(wide, "little")
+    shift = len(parts) // 2
+    return (acc >> shift).to_bytes(n * 2, "little")[0::2]
+
+def _isflat(strip, width):
+    # true if every 8x8 block of an 8-line strip has a single value
+    first = strip[:width]
+    if strip != first * 8:
+        return 0
+    expanded = bytearray(width)
+    for i in range(8):
+        expanded[i::8] = first[0::8]
+    return first == expanded
+
+# --------------------------------------------------------------------
+# Encoder
+
+##
+# Baseline JPEG encoder.  Writes a complete JFIF (or Adobe, for CMYK)
+# file.
+
+class JpegEncoder(_Codec):
+
+    def __init__(self, mode, rawmode=None, quality=0, progressive=0,
+                 smooth=0, optimize=0, streamtype=0, xdpi=0, ydpi=0,
+                 subsampling=-1, extra=b""):
+        _Codec.__init__(self, mode, rawmode)
+        if self.rawmode not in _RAWMODES:
+            raise ValueError("unsupported raw mode %s" % self.rawmode)
+        # progressive and smoothed output are not supported; such
+        # files are written as plain baseline files
+        self.quality = min(max(quality or 75, 1), 100)
+        self.optimize = optimize
+        self.streamtype = streamtype
+        self.dpi = xdpi, ydpi
+        if subsampling in (-1, 2):
+            self.sampling = 2, 2 # 4:2:0
+        elif subsampling == 1:
+            self.sampling = 2, 1 # 4:2:2
+        elif subsampling == 0:
+            self.sampling = 1, 1 # 4:4:4
+        else:
+            raise ValueError("unsupported subsampling %r" % subsampling)
+        self.extra = extra
+
+    def setup(self):
+        rawmode = self.rawmode
+        self.bits, self.pack = _imagingpack.getpacker(
+            self.im.mode, rawmode.split(";")[0]
+            )
+        tables = _qtables(self.quality)
+        h, v = self.sampling
+        # components: id, sampling factors, table index
+        if rawmode == "L":
+            comps = [(1, 1, 1, 0)]
+        elif rawmode[:4] == "CMYK":
+            comps = [(1, 1, 1, 0), (2, 1, 1, 0), (3, 1, 1, 0), (4, 1, 1, 0)]
+        else:
+            comps = [(1, h, v, 0), (2, 1, 1, 1), (3, 1, 1, 1)]
+        self.comps = comps
+        self.tables = [tables[c[3]] for c in comps]
+        self.hmax = max(c[1] for c in comps)
+        self.vmax = max(c[2] for c in comps)
+        self.mcux = -(-self.xsize // (8 * self.hmax))
+        self.mcuy = -(-self.ysize // (8 * self.vmax))
+        self.my = 0
+        self.preds = [0] * len(comps)
+        self.acc = self.count = 0 # bit buffer
+        self.words = array.array(_WORD)
+        self.data = bytearray()
+        self.done = 0
+        # level shift, and quantizer rounding, for a row of blocks
+        self.bias = {}
+        self.setcodes(_HUFFMAN[:len(set(c[3] for c in comps)) * 2])
+        if self.streamtype == 1:
+            # tables only
+            self.data += b"\xff\xd8"
+            self.markers(1)
+            self.data += b"\xff\xd9"
+            self.done = 1
+        elif not self.optimize:
+            self.data += b"\xff\xd8"
+            self.markers()
+
+    def setcodes(self, huffman):
+        # set the Huffman tables: (counts, symbols) for DC and AC, per
+        # table index
+        self.huffman = huffman
+        self.lens = {}
+        self.codes = {}
+        for i, (counts, symbols) in enumerate(huffman):
+            lens, codes = _codes(counts, symbols, i << 8)
+            self.lens.update(lens)
+            self.codes.update(codes)
+
+    def markers(self, tables_only=0):
+        # everything between SOI and the scan data
+        out = self.data
+        if not tables_only:
+            if self.rawmode[:4] == "CMYK":
+                # Adobe marker, no colour transform
+                out += b"\xff\xee\0\x0eAdobe\0\x64\0\0\0\0\0"
+            else:
+                xdpi, ydpi = self.dpi
+                out += b"\xff\xe0\0\x10JFIF\0\x01\x01" + struct.pack(
+                    ">BHH", 1 if xdpi else 0, xdpi or 1, ydpi or xdpi or 1
+                    ) + b"\0\0"
+            out += self.extra
+        if self.streamtype != 2:
+            count = len(set(c[3] for c in self.comps))
+            tables = _qtables(self.quality)[:count]
+            out += b"\xff\xdb" + struct.pack(">H", 2 + 65 * count)
+            for i, (q, recips, flat) in enumerate(tables):
+                out += bytes([i]) + q
+        if not tables_only:
+            out += b"\xff\xc0" + struct.pack(
+                ">HBHHB", 8 + 3 * len(self.comps), 8, self.ysize,
+                self.xsize, len(self.comps)
+                )
+            for id, h, v, t in self.comps:
+                out += bytes([id, h << 4 | v, t])
+        if self.streamtype != 2:
+            for i, (counts, symbols) in enumerate(self.huffman):
+                out += b"\xff\xc4" + struct.pack(
+                    ">HB", 19 + len(symbols), (i & 1) << 4 | i >> 1
+                    ) + counts + symbols
+        if not tables_only:
+            out += b"\xff\xda" + struct.pack(">HB", 6 + 2 * len(self.comps),
+                                            len(self.comps))
+            for id, h, v, t in self.comps:
+                out += bytes([id, t << 4 | t])
+            out += b"\0\x3f\0"
+
+    def encode(self, bufsize):
+        if self.im is None:
+            raise ValueError("encoder not initialized")
+        if self.done and not self.data:
+            return 0, 1, b""
+        if self.optimize and not self.done:
+            # gather the symbol statistics first
+            syms, vals = array.array("H"), array.array("H")
+            for my in range(self.mcuy):
+                s, v = self.tokens(my)
+                syms.extend(s)
+                vals.extend(v)
+            counts = [collections.Counter() for t in self.huffman]
+            for sym, n in collections.Counter(syms).items():
+                counts[sym >> 8][sym & 255] = n
+            self.setcodes([_optimal(c) for c in counts])
+            self.data += b"\xff\xd8"
+            self.markers()
+            self.emit(syms, vals)
+            self.my = self.mcuy
+        while not self.done and len(self.data) < bufsize and \
+              self.my < self.mcuy:
+            self.emit(*self.tokens(self.my))
+            self.my += 1
+        if not self.done and self.my >= self.mcuy:
+            # pad the last byte with ones
+            pad = -self.count % 8
+            self.acc = (self.acc << pad) | _MASK[pad]
+            self.count += pad
+            self.flush(1)
+            self.data += b"\xff\xd9"
+            self.done = 1
+        data = bytes(self.data)
+        del self.data[:]
+        return len(data), self.done, data
+
+    def encode_to_file(self, fh, bufsize):
+        import os
+        while 1:
+            l, s, d = self.encode(bufsize)
+            os.write(fh, d)
+            if s:
+                return s
+
+    def planes(self, my):
+        # the component planes for a row of MCUs, padded to whole
+        # MCUs by repeating the last column and line
+        height = self.vmax * 8
+        width = self.mcux * self.hmax * 8
+        buffer = self.im.buffer
+        nb = len(self.comps)
+        lines = []
+        for y in range(my * height, (my + 1) * height):
+            start, stop = self._line(min(y, self.ysize - 1))
+            lines.append(self.pack(buffer[start:stop], self.xsize))
+        data = b"".join(lines)
+        pad = width - self.xsize
+        planes = []
+        for i in range(nb):
+            plane = data[i::nb]
+            if pad:
+                plane = b"".join(
+                    plane[y*self.xsize:(y+1)*self.xsize] +
+                    plane[(y+1)*self.xsize-1:(y+1)*self.xsize] * pad
+                    for y in range(height)
+                    )
+            planes.append(plane)
+        if self.rawmode == "RGB":
+            planes = list(_rgb2ycc(*planes))
+        elif self.rawmode == "CMYK;I":
+            planes = [plane.translate(_INVERT) for plane in planes]
+        for i, (id, h, v, t) in enumerate(self.comps):
+            if h < self.hmax or v < self.vmax:
+                planes[i] = _downsample(planes[i], width, height,
+                                        self.hmax // h, self.vmax // v)
+        return planes
+
+    def transform(self, strip, width, table):
+        # quantized coefficients for a strip of blocks: a list of DC
+        # values, and a tuple of AC values per block (or None if all
+        # AC values are zero)
+        q, recips, flat = table
+        if _isflat(strip, width):
+            return [flat[p] for p in strip[:width:8]], None
+        nb = width // 8
+        try:
+            shift, bias = self.bias[nb]
+        except KeyError:
+            lanes = int.from_bytes((b"\1" + bytes(7)) * nb, "little")
+            shift = lanes * (128 * 64 << (2 * _FIX))
+            bias = lanes * _QBIAS
+            self.bias[nb] = shift, bias
+        wide = bytearray(nb * 8)
+        rows = []
+        for y in range(8):
+            line = strip[y*width:(y+1)*width]
+            d = []
+            for x in range(8):
+                wide[0::8] = line[x::8]
+                d.append(int.from_bytes(wide, "little"))
+            rows.append(_fdct(d))
+        cols = [_fdct([row[u] for row in rows]) for u in range(8)]
+        buf = bytearray(nb * 2)
+        coefs = []
+        for k in range(64):
+            v, u = divmod(_ZIGZAG[k], 8)
+            c = cols[u][v]
+            if not k:
+                c -= shift
+            c = (c * recips[k] + bias).to_bytes(nb * 8, "little")
+            buf[0::2] = c[6::8]
+            buf[1::2] = c[7::8].translate(_FLIP)
+            a = array.array("h", buf)
+            if not _LE:
+                a.byteswap()
+            coefs.append(a)
+        return coefs[0], list(zip(*coefs[1:]))
+
+    def tokens(self, my):
+        # Huffman symbols (table << 8 | symbol) and value bits for a row
+        # of MCUs
+        planes = self.planes(my)
+        blocks = []
+        for plane, (id, h, v, t), table in zip(planes, self.comps,
+                                               self.tables):
+            width = self.mcux * h * 8
+            rows = []
+            for by in range(v):
+                strip = plane[by*8*width:(by+1)*8*width]
+                rows.append(self.transform(strip, width, table))
+            blocks.append((rows, h, v, t * 2 << 8, (t * 2 + 1) << 8))
+        syms = []
+        vals = []
+        preds = self.preds
+        dcsize, dcbits = _DCSIZE, _DCBITS
+        acsize, acbits = _ACSIZE, _ACBITS
+        for mx in range(self.mcux):
+            for ci in range(len(blocks)):
+                rows, h, v, dct, act = blocks[ci]
+                eob = act
+                zrl = act | 0xf0
+                for by in range(v):
+                    dcs, acs = rows[by]
+                    for b in range(mx * h, mx * h + h):
+                        d = dcs[b] - preds[ci]
+                        preds[ci] = dcs[b]
+                        syms.append(dct | dcsize[d & 4095])
+                        vals.append(dcbits[d & 4095])
+                        if acs is not None:
+                            ac = acs[b]
+                            last = 0
+                            for k in compress(_AC, ac):
+                                r = k - last - 1
+                                while r > 15:
+                                    syms.append(zrl)
+                                    vals.append(0)
+                                    r -= 16
+                                c = ac[k-1] & 4095
+                                syms.append(act | r << 4 | acsize[c])
+                                vals.append(acbits[c])
+                                last = k
+                            if last == 63:
+                                continue
+                        syms.append(eob)
+                        vals.append(0)
+        return syms, vals
+
+    def emit(self, syms, vals):
+        # write the codes for a list of symbols
+        lens, codes = self.lens, self.codes
+        words = self.words
+        append = words.append
+        masks = _MASK
+        acc, count = self.acc, self.count
+        for sym, bits in zip(syms, vals):
+            n = lens[sym]
+            acc = (acc << n) | codes[sym] | bits
+            count += n
+            if count >= 32:
+                count -= 32
+                append(acc >> count)
+                acc &= masks[count]
+        self.acc, self.count = acc, count
+        self.flush()
+
+    def flush(self, final=0):
+        # move complete words (and at the end, bytes) to the output,
+        # stuffing a zero byte after each 0xff byte
+        words = self.words
+        if _LE:
+            words.byteswap()
+        data = words.tobytes()
+        del words[:]
+        count = self.count
+        if final and count:
+            data += self.acc.to_bytes(count // 8, "big")
+            self.acc = self.count = 0
+        self.data += data.replace(b"\xff", b"\xff\x00")
@@ -0,0 +1,408 @@
+#
+# The Python Imaging Library.
+# $Id$
+#
+# pixel packers and unpackers for the pure-Python core
+#
+# Each entry maps a (mode, rawmode) pair to the number of bits used
+# per pixel in the raw data, and a function that converts one line of
+# pixels.  Unpackers turn raw file data into the core storage layout,
+# packers do the reverse.  All shufflers work on whole lines, using
+# extended slicing and bytes.translate instead of per-pixel loops.
+#
+# Unpackers that convert each pixel on its own are marked as "bulk"
+# unpackers; the raw decoder unpacks many lines with one call to
+# them, as if they were one long line.  Line interleaved data (such
+# as "RGB;L") depends on where the lines start, and is unpacked one
+# line at a time.
+#
+# See the README file for information on usage and redistribution.
+#
+
+import array
+import sys
+
+_LE = sys.byteorder == "little"
+
+# --------------------------------------------------------------------
+# Helpers
+
+def _bulk(function):
+    # mark an unpacker that can handle several lines in one call
+    function.bulk = True
+    return function
+
+@_bulk
+def _copy(data, pixels):
+    return data
+
+def _table(function):
+    # build a 256-byte translation table from a function
+    return bytes([function(i) & 255 for i in range(256)])
+
+def _shuffler(insize, order, fill=255):
+    # generic band shuffler.  order lists, for each output band, the
+    # index of the corresponding input byte (or None for fill)
+    outsize = len(order)
+    if insize == outsize and list(order) == list(range(outsize)):
+        return _copy
+    fillbyte = bytes((fill,))
+    @_bulk
+    def shuffle(data, pixels):
+        out = bytearray(pixels * outsize)
+        for i, j in enumerate(order):
+            if j is None:
+                out[i::outsize] = fillbyte * pixels
+            else:
+                out[i::outsize] = data[j:pixels*insize:insize]
+        return out
+    return shuffle
+
+# 1-bit tables, indexed by bit position (msb first)
+_BIT = [_table(lambda i, k=k: 255 if i & (128 >> k) else 0) for k in range(8)]
+_BIT_I = [_table(lambda i, k=k: 0 if i & (128 >> k) else 255) for k in range(8)]
+_BIT_R = [_table(lambda i, k=k: 255 if i & (1 << k) else 0) for k in range(8)]
+
+_NONZERO = _table(lambda i: 255 if i else 0)
+_INVERT = _table(lambda i: 255 - i)
+
+def _unpackbits(tables):
+    @_bulk
+    def unpack(data, pixels):
+        data = bytes(data[:(pixels + 7) >> 3])
+        out = bytearray(len(data) * 8)
+        for k in range(8):
+            out[k::8] = data.translate(tables[k])
+        del out[pixels:]
+        return out
+    return unpack
+
+def _unpackfields(bits, scale=1):
+    # unpack 1, 2 or 4-bit fields (msb first) to one byte per pixel
+    n = 8 // bits
+    mask = (1 << bits) - 1
+    tables = [
+        _table(lambda i, k=k: ((i >> (8 - bits*(k+1))) & mask) * scale)
+        for k in range(n)
+        ]
+    @_bulk
+    def unpack(data, pixels):
+        data = bytes(data[:(pixels * bits + 7) >> 3])
+        out = bytearray(len(data) * n)
+        for k in range(n):
+            out[k::n] = data.translate(tables[k])
+        del out[pixels:]
+        return out
+    return unpack
+
+def _msb16(size, shuffle=None):
+    # keep the most significant byte of big-endian 16-bit samples
+    @_bulk
+    def unpack(data, pixels):
+        data = bytes(data[0:pixels*size:2])
+        if shuffle:
+            data = shuffle(data, pixels)
+        return data
+    return unpack
+
+def _unpack16(gbits):
+    # unpack little-endian 16-bit BGR pixels (5 bits blue in the low
+    # bits, then 5 or 6 bits green, and 5 bits red), scaled to 8 bits.
+    # green straddles the two bytes; its parts are disjoint bit fields,
+    # so they are combined for the whole line with one big-integer add.
+    rshift = 5 + gbits
+    gmax = (1 << gbits) - 1
+    blue = _table(lambda i: (i & 31) * 255 // 31)
+    red = _table(lambda i: ((i << 8) >> rshift & 31) * 255 // 31)
+    glo = _table(lambda i: i >> 5)
+    ghi = _table(lambda i: (i << 3) & gmax)
+    green = _table(lambda i: (i & gmax) * 255 // gmax)
+    @_bulk
+    def unpack(data, pixels):
+        lo = bytes(data[0:pixels*2:2])
+        hi = bytes(data[1:pixels*2:2])
+        g = int.from_bytes(lo.translate(glo), "little") + \
+            int.from_bytes(hi.translate(ghi), "little")
+        out = bytearray(pixels * 3)
+        out[0::3] = hi.translate(red)
+        out[1::3] = g.to_bytes(pixels, "little").translate(green)
+        out[2::3] = lo.translate(blue)
+        return out
+    return unpack
+
+@_bulk
+def _swap16(data, pixels):
+    # reverse the byte order of 16-bit samples
+    values = array.array("H", bytes(data[:pixels*2]))
+    values.byteswap()
+    return values.tobytes()
+
+def _translate(table):
+    # unpack one byte per pixel through a translation table
+    @_bulk
+    def unpack(data, pixels):
+        return bytes(data[:pixels]).translate(table)
+    return unpack
+
+def _unpacklines(bands):
+    # unpack line interleaved data: all pixels of the first band, then
+    # all pixels of the second band, and so on.  the planes must span
+    # the same lines, so the raw decoder calls this once per line.
+    def unpack(data, pixels):
+        out = bytearray(pixels * bands)
+        for k in range(bands):
+            out[k::bands] = data[k*pixels:(k+1)*pixels]
+        return out
+    return unpack
+
+# 1-bit tables for bit planes, indexed by plane and bit position
+_PLANE = [
+    [_table(lambda i, k=k, b=b: (i >> (7 - b) & 1) << k) for b in range(8)]
+    for k in range(4)
+    ]
+
+def _unpackplanes(planes):
+    # unpack line interleaved bit planes (msb first) to one byte per
+    # pixel.  the planes hold disjoint bits of each pixel value, so
+    # they are combined as big integers, for the whole line at once.
+    # like _unpacklines, this expects one plane after another.
+    def unpack(data, pixels):
+        size = (pixels + 7) >> 3
+        bits = bytearray(size * 8)
+        acc = 0
+        for k in range(planes):
+            plane = bytes(data[k*size:(k+1)*size])
+            for b in range(8):
+                bits[b::8] = plane.translate(_PLANE[k][b])
+            acc |= int.from_bytes(bits, "big")
+        return acc.to_bytes(size * 8, "big")[:pixels]
+    return unpack
+
+_PACK_BIT = [_table(lambda i, k=k: (128 >> k) if i else 0) for k in range(8)]
+_PACK_BIT_I = [_table(lambda i, k=k: 0 if i else (128 >> k)) for k in range(8)]
+
+def _packbits(tables):
+    def pack(data, pixels):
+        size = (pixels + 7) >> 3
+        data = bytes(data[:pixels]) + bytes(size * 8 - pixels)
+        # the bit planes never overlap, so OR-ing them as big integers
+        # combines all bytes of the line in one go
+        acc = 0
+        for k in range(8):
+            acc |= int.from_bytes(data[k::8].translate(tables[k]), "big")
+        return acc.to_bytes(size, "big")
+    return pack
+
+def _packfields(bits):
+    # pack one byte per pixel into 1, 2 or 4-bit fields (msb first)
+    n = 8 // bits
+    mask = (1 << bits) - 1
+    tables = [
+        _table(lambda i, k=k: (i & mask) << (8 - bits*(k+1)))
+        for k in range(n)
+        ]
+    def pack(data, pixels):
+        size = (pixels * bits + 7) >> 3
+        data = bytes(data[:pixels]) + bytes(size * n - pixels)
+        acc = 0
+        for k in range(n):
+            acc |= int.from_bytes(data[k::n].translate(tables[k]), "big")
+        return acc.to_bytes(size, "big")
+    return pack
+
+def _widen16(offsets):
+    # unpack 16-bit unsigned data to native 32-bit integers
+    @_bulk
+    def unpack(data, pixels):
+        out = bytearray(pixels * 4)
+        lo, hi = offsets
+        if _LE:
+            out[0::4] = data[lo:pixels*2:2]
+            out[1::4] = data[hi:pixels*2:2]
+        else:
+            out[3::4] = data[lo:pixels*2:2]
+            out[2::4] = data[hi:pixels*2:2]
+        return out
+    return unpack
+
+def _narrow16(offsets):
+    # pack native 32-bit integers as 16-bit unsigned data (clipped)
+    def pack(data, pixels):
+        data = bytes(data[:pixels*4])
+        values = array.array("i", data)
+        if values and (min(values) < 0 or max(values) > 65535):
+            values = array.array(
+                "i", [min(max(v, 0), 65535) for v in values]
+                )
+            data = values.tobytes()
+        out = bytearray(pixels * 2)
+        lo, hi = offsets
+        if _LE:
+            out[lo::2] = data[0::4]
+            out[hi::2] = data[1::4]
+        else:
+            out[lo::2] = data[3::4]
+            out[hi::2] = data[2::4]
+        return out
+    return pack
+
+# --------------------------------------------------------------------
+# Unpackers
+
+UNPACK = {
+    # (mode, rawmode) => bits, unpacker
+
+    # bilevel
+    ("1", "1"): (1, _unpackbits(_BIT)),
+    ("1", "1;I"): (1, _unpackbits(_BIT_I)),
+    ("1", "1;R"): (1, _unpackbits(_BIT_R)),
+    ("1", "1;8"): (8, _translate(_NONZERO)),
+
+    # greyscale
+    ("L", "L"): (8, _copy),
+    ("L", "L;I"): (8, _translate(_INVERT)),
+    ("L", "L;2"): (2, _unpackfields(2, 85)),
+    ("L", "L;4"): (4, _unpackfields(4, 17)),
+    ("LA", "LA"): (16, _copy),
+    ("PA", "PA"): (16, _copy),
+
+    # palette
+    ("P", "P"): (8, _copy),
+    ("P", "L"): (8, _copy),
+    ("P", "P;1"): (1, _unpackfields(1)),
+    ("P", "P;2"): (2, _unpackfields(2)),
+    ("P", "P;4"): (4, _unpackfields(4)),
+    ("P", "P;2L"): (2, _unpackplanes(2)),
+    ("P", "P;4L"): (4, _unpackplanes(4)),
+
+    # true colour
+    ("RGB", "RGB"): (24, _copy),
+    ("RGB", "RGBX"): (32, _shuffler(4, (0, 1, 2))),
+    ("RGB", "RGBA"): (32, _shuffler(4, (0, 1, 2))),
+    ("RGB", "RGB;16B"): (48, _msb16(6)),
+    ("RGB", "BGR"): (24, _shuffler(3, (2, 1, 0))),
+    ("RGB", "BGRX"): (32, _shuffler(4, (2, 1, 0))),
+    ("RGB", "BGR;15"): (16, _unpack16(5)),
+    ("RGB", "BGR;16"): (16, _unpack16(6)),
+    ("RGB", "BGR;5"): (16, _unpack16(5)),
+    ("RGB", "RGB;L"): (24, _unpacklines(3)),
+    ("RGBA", "RGBA"): (32, _copy),
+    ("RGBA", "RGB"): (24, _shuffler(3, (0, 1, 2, None))),
+    ("RGBA", "LA;16B"): (32, _msb16(4, _shuffler(2, (0, 0, 0, 1)))),
+    ("RGBA", "RGBA;16B"): (64, _msb16(8)),
+    ("RGBA", "BGRA"): (32, _shuffler(4, (2, 1, 0, 3))),
+    ("RGBX", "RGBX"): (32, _copy),
+    ("RGBX", "RGB"): (24, _shuffler(3, (0, 1, 2, None))),
+    ("CMYK", "CMYK"): (32, _copy),
+    ("YCbCr", "YCbCr"): (24, _copy),
+
+    # integer/floating point
+    ("I", "I"): (32, _copy),
+    ("I", "I;16"): (16, _widen16((0, 1))),
+    ("I", "I;16B"): (16, _widen16((1, 0))),
+    ("F", "F"): (32, _copy),
+    ("I;16", "I;16"): (16, _copy),
+    ("I;16L", "I;16L"): (16, _copy),
+    ("I;16B", "I;16B"): (16, _copy),
+    ("I;16", "I;16B"): (16, _swap16),
+    ("I;16B", "I;16"): (16, _swap16),
+}
+
+if _LE:
+    UNPACK[("I", "I;32")] = UNPACK[("I", "I")]
+    UNPACK[("F", "F;32F")] = UNPACK[("F", "F")]
+else:
+    UNPACK[("I", "I;32B")] = UNPACK[("I", "I")]
+    UNPACK[("F", "F;32BF")] = UNPACK[("F", "F")]
+
+# single band raw modes: (mode, rawmode) => band.  the raw data has
+# one byte per pixel, which is stored in the given band of the image
+# memory; the other bands are left as they are.
+
+BANDS = {
+    ("LA", "L"): 0, ("LA", "A"): 1,
+    ("RGB", "R"): 0, ("RGB", "G"): 1, ("RGB", "B"): 2,
+    ("RGBA", "R"): 0, ("RGBA", "G"): 1, ("RGBA", "B"): 2, ("RGBA", "A"): 3,
+    ("RGBX", "R"): 0, ("RGBX", "G"): 1, ("RGBX", "B"): 2, ("RGBX", "X"): 3,
+    ("CMYK", "C"): 0, ("CMYK", "M"): 1, ("CMYK", "Y"): 2, ("CMYK", "K"): 3,
+    ("YCbCr", "Y"): 0, ("YCbCr", "Cb"): 1, ("YCbCr", "Cr"): 2,
+}
+
+# --------------------------------------------------------------------
+# Packers
+
+PACK = {
+    # (mode, rawmode) => bits, packer
+
+    ("1", "1"): (1, _packbits(_PACK_BIT)),
+    ("1", "1;I"): (1, _packbits(_PACK_BIT_I)),
+    ("1", "L"): (8, _copy),
+    ("L", "L"): (8, _copy),
+    ("LA", "LA"): (16, _copy),
+    ("PA", "PA"): (16, _copy),
+    ("P", "P"): (8, _copy),
+    ("P", "P;1"): (1, _packfields(1)),
+    ("P", "P;2"): (2, _packfields(2)),
+    ("P", "P;4"): (4, _packfields(4)),
+    ("RGB", "RGB"): (24, _copy),
+    ("RGB", "RGBX"): (32, _shuffler(3, (0, 1, 2, None))),
+    ("RGB", "BGR"): (24, _shuffler(3, (2, 1, 0))),
+    ("RGB", "BGRX"): (32, _shuffler(3, (2, 1, 0, None))),
+    ("RGBA", "RGBA"): (32, _copy),
+    ("RGBA", "RGB"): (24, _shuffler(4, (0, 1, 2))),
+    ("RGBA", "BGRA"): (32, _shuffler(4, (2, 1, 0, 3))),
+    ("RGBX", "RGBX"): (32, _copy),
+    ("RGBX", "RGB"): (24, _shuffler(4, (0, 1, 2))),
+    ("CMYK", "CMYK"): (32, _copy),
+    ("YCbCr", "YCbCr"): (24, _copy),
+    ("I", "I"): (32, _copy),
+    ("I", "I;16"): (16, _narrow16((0, 1))),
+    ("I", "I;16B"): (16, _narrow16((1, 0))),
+    ("F", "F"): (32, _copy),
+    ("I;16", "I;16"): (16, _copy),
+    ("I;16L", "I;16L"): (16, _copy),
+    ("I;16B", "I;16B"): (16, _copy),
+    ("I;16", "I;16B"): (16, _swap16),
+    ("I;16B", "I;16"): (16, _swap16),
+}
+
+# --------------------------------------------------------------------
+# Lookup
+
+##
+# Gets the unpacker for a given mode/rawmode combination.
+#
+# @param mode Image mode.
+# @param rawmode Raw (file) mode.
+# @return A (bits, function) tuple.
+# @exception ValueError If the combination is not supported.
+
+def getunpacker(mode, rawmode):
+    try:
+        return UNPACK[(mode, rawmode)]
+    except KeyError:
+        raise ValueError("unknown raw mode")
+
+##
+# Gets the band filled by a single band raw mode.
+#
+# @param mode Image mode.
+# @param rawmode Raw (file) mode.
+# @return The band index, or None if the raw mode holds whole pixels.
+
+def getband(mode, rawmode):
+    return BANDS.get((mode, rawmode))
+
+##
+# Gets the packer for a given mode/rawmode combination.
+#
+# @param mode Image mode.
+# @param rawmode Raw (file) mode.
+# @return A (bits, function) tuple.
+# @exception ValueError If the combination is not supported.
+
+def getpacker(mode, rawmode):
+    try:
+        return PACK[(mode, rawmode)]
+    except KeyError:
+        raise ValueError("unknown raw mode")
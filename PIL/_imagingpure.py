@@ -0,0 +1,935 @@
+#
+# The Python Imaging Library.
+# $Id$
+#
+# pure-Python replacement for the _imaging core
+#
+# This module is used as Image.core when the _imaging C extension is
+# not available.  Pixels are kept in a single row-major bytearray (or
+# any other buffer supporting the buffer protocol), without padding
+# between lines.  8-bit modes use one byte per band ("RGB" is stored
+# as three bytes per pixel, not four), "I" and "F" use native 32-bit
+# integers and floats, and the "I;16" modes use two bytes per pixel.
+#
+# All operations work on whole lines or whole buffers, using slicing,
+# bytes.translate and (where arithmetic is needed) big integers as
+# SIMD registers, so no Python objects are created per pixel.
+#
+# See the README file for information on usage and redistribution.
+#
+
+import array
+import collections
+import struct
+import sys
+import zlib
+from itertools import compress, repeat
+
+from . import _imagingpack
+
+# --------------------------------------------------------------------
+# Modes
+
+_MODES = {
+    # mode => bytes per pixel, bands, pixel format
+    "1": (1, 1, "B"),
+    "L": (1, 1, "B"),
+    "P": (1, 1, "B"),
+    "I": (4, 1, "=i"),
+    "F": (4, 1, "=f"),
+    "LA": (2, 2, "2B"),
+    "PA": (2, 2, "2B"),
+    "RGB": (3, 3, "3B"),
+    "RGBA": (4, 4, "4B"),
+    "RGBX": (4, 4, "4B"),
+    "CMYK": (4, 4, "4B"),
+    "YCbCr": (3, 3, "3B"),
+    "I;16": (2, 1, "<H"),
+    "I;16L": (2, 1, "<H"),
+    "I;16B": (2, 1, ">H"),
+}
+
+_STRUCTS = {}
+
+def _getmode(mode):
+    try:
+        return _MODES[mode]
+    except KeyError:
+        raise ValueError("unrecognized mode")
+
+def _getstruct(mode):
+    try:
+        return _STRUCTS[mode]
+    except KeyError:
+        s = _STRUCTS[mode] = struct.Struct(_getmode(mode)[2])
+        return s
+
+def _is8bit(mode):
+    return _MODES[mode][2][-1] == "B"
+
+def _clip8(v):
+    v = int(v)
+    if v < 0:
+        return 0
+    if v > 255:
+        return 255
+    return v
+
+def _ink(mode, color):
+    # convert a colour value to the byte representation of one pixel
+    pixelsize, bands, format = _getmode(mode)
+    if not _is8bit(mode):
+        if isinstance(color, tuple):
+            color = color[0]
+        return _getstruct(mode).pack(color)
+    if isinstance(color, tuple):
+        color = list(color)
+        if len(color) == bands - 1:
+            color.append(255)
+        if len(color) != bands:
+            raise ValueError("wrong number of bands in colour value")
+        ink = bytes([_clip8(c) for c in color])
+    elif bands == 1:
+        ink = bytes((_clip8(color),))
+    else:
+        # packed integer value, as used by the C core
+        ink = int(color).to_bytes(4, "little")[:bands]
+    if mode == "1":
+        ink = ink.translate(_imagingpack._NONZERO)
+    return ink
+
+# --------------------------------------------------------------------
+# Palettes
+
+def _palette_unpack(rawmode, data):
+    # convert raw palette data to 768 bytes of RGB data
+    data = bytes(data)
+    if rawmode in ("RGB;L", "RGBA;L"):
+        n = len(data) // len(rawmode[:-2])
+        planes = [data[i*n:(i+1)*n] for i in range(3)]
+    else:
+        try:
+            order = {
+                "RGB": (3, 0, 1, 2), "RGBX": (4, 0, 1, 2),
+                "RGBA": (4, 0, 1, 2), "BGR": (3, 2, 1, 0),
+                "BGRX": (4, 2, 1, 0), "L": (1, 0, 0, 0),
+                }[rawmode]
+        except KeyError:
+            raise ValueError("unrecognized palette mode")
+        step = order[0]
+        planes = [data[i::step] for i in order[1:]]
+    out = bytearray(768)
+    for i, plane in enumerate(planes):
+        plane = plane[:256]
+        out[i:len(plane)*3:3] = plane
+    return out
+
+class _Palette:
+
+    def __init__(self, mode="RGB", data=None):
+        self.mode = mode
+        if data is None:
+            # greyscale ramp, like the C core
+            ramp = bytes(range(256))
+            data = bytearray(768)
+            data[0::3] = data[1::3] = data[2::3] = ramp
+        self.palette = bytearray(data)
+        self.alpha = bytearray(b"\xff" * 256)
+
+    def copy(self):
+        p = _Palette(self.mode, self.palette)
+        p.alpha = bytearray(self.alpha)
+        return p
+
+    def tables(self):
+        # return translation tables for each colour band
+        p = bytes(self.palette)
+        return p[0::3], p[1::3], p[2::3]
+
+# --------------------------------------------------------------------
+# Image memory
+
+##
+# Image memory.  This is the object stored in the <b>im</b> attribute
+# of Image objects.
+
+class ImagingCore:
+
+    def __init__(self, mode, size, buffer=None):
+        self.pixelsize, self.bands, format = _getmode(mode)
+        xsize, ysize = int(size[0]), int(size[1])
+        if xsize < 0 or ysize < 0:
+            raise ValueError("bad image size")
+        self.mode = mode
+        self.size = xsize, ysize
+        self.linesize = xsize * self.pixelsize
+        if buffer is None:
+            buffer = bytearray(self.linesize * ysize)
+        elif len(buffer) < self.linesize * ysize:
+            raise ValueError("buffer is not large enough")
+        self.buffer = buffer
+        self.palette = None
+        if mode in ("P", "PA"):
+            self.palette = _Palette()
+
+    def _new(self, mode, size, buffer=None):
+        im = ImagingCore(mode, size, buffer)
+        if self.palette and im.palette:
+            im.palette = self.palette.copy()
+        return im
+
+    @property
+    def id(self):
+        return id(self)
+
+    @property
+    def ptr(self):
+        return memoryview(self.buffer)
+
+    def isblock(self):
+        return 1
+
+    # sequence interface (used by getdata)
+
+    def __len__(self):
+        return self.size[0] * self.size[1]
+
+    def __getitem__(self, i):
+        if i < 0:
+            i = i + len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("image index out of range")
+        return self.getpixel((i % self.size[0], i // self.size[0]))
+
+    # pixel access
+
+    def _offset(self, xy):
+        x, y = int(xy[0]), int(xy[1])
+        if not (0 <= x < self.size[0] and 0 <= y < self.size[1]):
+            raise IndexError("image index out of range")
+        return (y * self.size[0] + x) * self.pixelsize
+
+    def getpixel(self, xy):
+        offset = self._offset(xy)
+        if self.pixelsize == 1:
+            return self.buffer[offset]
+        if self.bands > 1:
+            return tuple(self.buffer[offset:offset+self.pixelsize])
+        return _getstruct(self.mode).unpack_from(self.buffer, offset)[0]
+
+    def putpixel(self, xy, value):
+        offset = self._offset(xy)
+        self.buffer[offset:offset+self.pixelsize] = _ink(self.mode, value)
+
+    def pixel_access(self, readonly=0):
+        return PixelAccess(self, readonly)
+
+    def getextrema(self):
+        if self.bands != 1:
+            raise ValueError("image has wrong mode")
+        if self.pixelsize == 1:
+            data = self.buffer
+        else:
+            code = {"I": "i", "F": "f"}.get(self.mode, "H")
+            data = array.array(code, bytes(self.buffer))
+            if code == "H" and (self.mode == "I;16B") == (sys.byteorder == "little"):
+                data.byteswap()
+        if not len(data):
+            return None
+        return min(data), max(data)
+
+    def histogram(self, extrema=None, mask=None):
+        if mask is not None:
+            if mask.size != self.size or mask.pixelsize != 1:
+                raise ValueError("bad transparency mask")
+            mask = mask.buffer
+        if _is8bit(self.mode):
+            h = []
+            for band in range(self.pixelsize):
+                data = self.buffer[band::self.pixelsize]
+                if mask is not None:
+                    data = compress(data, mask)
+                counts = collections.Counter(data)
+                h.extend(map(counts.get, range(256), repeat(0)))
+            return h
+        if self.mode not in ("I", "F"):
+            raise ValueError("image has wrong mode")
+        if not extrema:
+            raise ValueError("min/max not given")
+        # 256 bins between the given extrema
+        lo, hi = extrema
+        if lo >= hi or not len(self):
+            return [0] * 256
+        scale = 255.0 / (hi - lo)
+        data = array.array("i" if self.mode == "I" else "f", bytes(self.buffer))
+        if mask is not None:
+            data = compress(data, mask)
+        counts = collections.Counter([int((v - lo) * scale) for v in data])
+        return list(map(counts.get, range(256), repeat(0)))
+
+    def putdata(self, data, scale=1.0, offset=0.0):
+        n = len(self)
+        if scale == 1.0 and offset == 0.0 and self.pixelsize == 1:
+            data = bytes(data[:n])
+            self.buffer[:len(data)] = data
+            return
+        pack = _getstruct(self.mode).pack
+        mode = self.mode
+        out = []
+        for v in data[:n]:
+            if scale != 1.0 or offset != 0.0:
+                v = v * scale + offset
+            if self.bands == 1 and mode not in ("F",):
+                v = int(v)
+            out.append(_ink(mode, v))
+        out = b"".join(out)
+        self.buffer[:len(out)] = out
+
+    # geometry
+
+    def copy(self):
+        return self._new(self.mode, self.size, bytearray(self.buffer))
+
+    def crop(self, box):
+        x0, y0, x1, y1 = [int(v) for v in box]
+        xsize, ysize = max(x1 - x0, 0), max(y1 - y0, 0)
+        im = self._new(self.mode, (xsize, ysize))
+        if x0 == 0 and x1 == self.size[0] and 0 <= y0 <= y1 <= self.size[1]:
+            # full lines; copy in one go
+            ls = self.linesize
+            im.buffer[:] = self.buffer[y0*ls:y1*ls]
+            return im
+        im.paste(self, (-x0, -y0, self.size[0] - x0, self.size[1] - y0))
+        return im
+
+    def paste(self, im, box, mask=None):
+        if mask is not None:
+            raise ValueError("paste with mask not supported by this core")
+        x0, y0, x1, y1 = [int(v) for v in box]
+        ps = self.pixelsize
+        if isinstance(im, ImagingCore):
+            if im.mode != self.mode:
+                raise ValueError("images do not match")
+            if (x1 - x0, y1 - y0) != im.size:
+                raise ValueError("images do not match")
+            # clip against destination
+            sx = max(0, -x0); sy = max(0, -y0)
+            dx0 = max(0, x0); dy0 = max(0, y0)
+            dx1 = min(self.size[0], x1); dy1 = min(self.size[1], y1)
+            if dx1 <= dx0 or dy1 <= dy0:
+                return
+            n = (dx1 - dx0) * ps
+            src, dst = im.buffer, self.buffer
+            sls, dls = im.linesize, self.linesize
+            s = sy * sls + sx * ps
+            d = dy0 * dls + dx0 * ps
+            for y in range(dy1 - dy0):
+                dst[d:d+n] = src[s:s+n]
+                s += sls
+                d += dls
+        else:
+            ink = _ink(self.mode, im)
+            dx0 = max(0, x0); dy0 = max(0, y0)
+            dx1 = min(self.size[0], x1); dy1 = min(self.size[1], y1)
+            if dx1 <= dx0 or dy1 <= dy0:
+                return
+            line = ink * (dx1 - dx0)
+            dls = self.linesize
+            d = dy0 * dls + dx0 * ps
+            for y in range(dy1 - dy0):
+                self.buffer[d:d+len(line)] = line
+                d += dls
+
+    def resize(self, size, filter=0, box=None):
+        from . import _imagingresample
+        return _imagingresample.resize(self, size, filter, box)
+
+    def stretch(self, size, filter=0, box=None):
+        from . import _imagingresample
+        return _imagingresample.resize(self, size, filter, box)
+
+    def reduce(self, factor):
+        from . import _imagingresample
+        return _imagingresample.reduce(self, factor)
+
+    # bands
+
+    def getband(self, band):
+        if not 0 <= band < self.bands:
+            raise ValueError("band index out of range")
+        if self.bands == 1:
+            return self.copy()
+        return ImagingCore(
+            "L", self.size, bytearray(self.buffer[band::self.pixelsize])
+            )
+
+    def putband(self, im, band):
+        if not 0 <= band < self.bands:
+            raise ValueError("band index out of range")
+        if im.size != self.size or im.pixelsize != 1:
+            raise ValueError("images do not match")
+        if self.bands == 1:
+            self.buffer[:] = im.buffer
+        else:
+            self.buffer[band::self.pixelsize] = im.buffer
+
+    def fillband(self, band, color):
+        if not 0 <= band < self.bands or self.pixelsize != self.bands:
+            raise ValueError("band index out of range")
+        n = len(self)
+        self.buffer[band::self.pixelsize] = bytes((_clip8(color),)) * n
+
+    # palette
+
+    def putpalette(self, rawmode, data):
+        if self.mode not in ("L", "P", "PA"):
+            raise ValueError("illegal image mode")
+        if self.mode == "L":
+            self.mode = "P"
+        self.palette = _Palette("RGB", _palette_unpack(rawmode, data))
+
+    def putpalettealpha(self, index, alpha=0):
+        if not self.palette:
+            raise ValueError("image has no palette")
+        self.palette.mode = "RGBA"
+        self.palette.alpha[index] = _clip8(alpha)
+
+    def getpalette(self, mode="RGB", rawmode="RGB"):
+        if not self.palette:
+            raise ValueError("image has no palette")
+        r, g, b = self.palette.tables()
+        planes = {
+            "R": r, "G": g, "B": b, "A": bytes(self.palette.alpha),
+            "X": bytes(256),
+            }
+        # pixel interleaved, or line interleaved (";L", one band after
+        # the other, as in TIFF and IM colour maps)
+        bands, sep, layout = rawmode.partition(";")
+        if layout not in ("", "L"):
+            raise ValueError("unsupported palette mode")
+        try:
+            bands = [planes[c] for c in bands]
+        except KeyError:
+            raise ValueError("unsupported palette mode")
+        if layout == "L":
+            return b"".join(bands)
+        out = bytearray(256 * len(bands))
+        for i, plane in enumerate(bands):
+            out[i::len(bands)] = plane
+        return bytes(out)
+
+    # conversion
+
+    def convert(self, mode, dither=None, palette=None):
+        if mode == self.mode:
+            return self.copy()
+        try:
+            converter = _CONVERT[(self.mode, mode)]
+        except KeyError:
+            # go via RGB, if possible
+            if (self.mode, "RGB") in _CONVERT and ("RGB", mode) in _CONVERT:
+                return self.convert("RGB").convert(mode)
+            raise ValueError("conversion not supported")
+        im = self._new(mode, self.size)
+        converter(self, im)
+        return im
+
+##
+# Pixel access object, returned by the <b>load</b> method.
+
+class PixelAccess:
+
+    def __init__(self, im, readonly=0):
+        self.im = im
+        self.readonly = readonly
+
+    def __getitem__(self, xy):
+        return self.im.getpixel(xy)
+
+    def __setitem__(self, xy, value):
+        if self.readonly:
+            raise ValueError("image is readonly")
+        self.im.putpixel(xy, value)
+
+# --------------------------------------------------------------------
+# Conversions.  Each converter fills the target image memory from the
+# source image memory.
+
+# ITU-R 601-2 luma weights, in 16-bit fixed point
+_LUMA = 19595, 38470, 7471
+
+def _luma(r, g, b):
+    # compute (r*299 + g*587 + b*114) / 1000 for whole planes at once.
+    # each pixel gets a 32-bit lane in a big integer; the lanes never
+    # overflow (255 * 65536 + 32768 < 2**24), so a single bigint
+    # multiply-add computes all pixels.
+    n = len(r)
+    wide = bytearray(n * 4)
+    acc = int.from_bytes(b"\0\0\x80\0" * n, "big") # rounding
+    for plane, weight in zip((r, g, b), _LUMA):
+        wide[3::4] = plane
+        acc += int.from_bytes(wide, "big") * weight
+    return acc.to_bytes(n * 4, "big")[1::4]
+
+_CHUNK = 1 << 16 # pixels per slice in multi-step conversions
+
+def _chunks(im):
+    # yield (start, stop) pixel ranges covering the image
+    n = len(im)
+    for i in range(0, n, _CHUNK):
+        yield i, min(i + _CHUNK, n)
+
+def _rgb2l(im, out):
+    ps = im.pixelsize
+    buf = im.buffer
+    for i, j in _chunks(im):
+        data = buf[i*ps:j*ps]
+        out.buffer[i:j] = _luma(data[0::ps], data[1::ps], data[2::ps])
+
+def _rgb2p(im, out):
+    # map to a 6x6x6 colour cube ("web" palette).  the three band
+    # indices never exceed 215 together, so they can be summed as big
+    # integers without carries between bytes.
+    ps = im.pixelsize
+    buf = im.buffer
+    for i, j in _chunks(im):
+        data = buf[i*ps:j*ps]
+        acc = 0
+        for band, table in enumerate(_WEB_TABLES):
+            acc += int.from_bytes(bytes(data[band::ps]).translate(table), "big")
+        out.buffer[i:j] = acc.to_bytes(j - i, "big")
+    palette = bytearray(768)
+    for i in range(216):
+        palette[i*3:i*3+3] = bytes((i//36*51, i//6%6*51, i%6*51))
+    out.palette = _Palette("RGB", palette)
+
+_WEB_TABLES = [
+    bytes([(v + 25) // 51 * scale for v in range(256)])
+    for scale in (36, 6, 1)
+    ]
+
+def _l2rgb(im, out):
+    ps = out.pixelsize
+    for i in range(ps):
+        if i < 3:
+            out.buffer[i::ps] = im.buffer
+        else:
+            out.buffer[i::ps] = b"\xff" * len(im)
+
+def _l2la(im, out):
+    out.buffer[0::2] = im.buffer
+    out.buffer[1::2] = b"\xff" * len(im)
+
+def _la2l(im, out):
+    out.buffer[:] = im.buffer[0::2]
+
+def _l2i(im, out):
+    # widen to native 32-bit integers
+    if sys.byteorder == "little":
+        out.buffer[0::4] = im.buffer
+    else:
+        out.buffer[3::4] = im.buffer
+
+def _l2p(im, out):
+    out.buffer[:] = im.buffer
+
+def _l2bit(im, out):
+    out.buffer[:] = bytes(im.buffer).translate(_THRESHOLD)
+
+_THRESHOLD = bytes([255 if v >= 128 else 0 for v in range(256)])
+
+def _shuffle(order):
+    # copy bands between 8-bit images; None means opaque alpha
+    def convert(im, out):
+        n = len(im)
+        ips, ops = im.pixelsize, out.pixelsize
+        for i, band in enumerate(order):
+            if band is None:
+                out.buffer[i::ops] = b"\xff" * n
+            else:
+                out.buffer[i::ops] = im.buffer[band::ips]
+    return convert
+
+def _p2rgb(im, out):
+    buf = bytes(im.buffer[0::im.pixelsize])
+    ps = out.pixelsize
+    for i, table in enumerate(im.palette.tables()):
+        out.buffer[i::ps] = buf.translate(table)
+    if ps == 4:
+        if out.mode == "RGBA":
+            out.buffer[3::4] = buf.translate(bytes(im.palette.alpha))
+        else:
+            out.buffer[3::4] = b"\xff" * len(im)
+
+def _p2l(im, out):
+    buf = bytes(im.buffer[0::im.pixelsize])
+    out.buffer[:] = buf.translate(_luma(*im.palette.tables()))
+
+def _p2bit(im, out):
+    _p2l(im, out)
+    out.buffer[:] = bytes(out.buffer).translate(_THRESHOLD)
+
+_CONVERT = {
+    ("1", "L"): _l2p,
+    ("1", "RGB"): _l2rgb,
+    ("1", "RGBA"): _l2rgb,
+    ("1", "RGBX"): _l2rgb,
+    ("1", "I"): _l2i,
+    ("L", "1"): _l2bit,
+    ("L", "P"): _l2p,
+    ("L", "LA"): _l2la,
+    ("L", "I"): _l2i,
+    ("L", "RGB"): _l2rgb,
+    ("L", "RGBA"): _l2rgb,
+    ("L", "RGBX"): _l2rgb,
+    ("LA", "L"): _la2l,
+    ("LA", "RGBA"): _shuffle((0, 0, 0, 1)),
+    ("P", "1"): _p2bit,
+    ("P", "L"): _p2l,
+    ("P", "RGB"): _p2rgb,
+    ("P", "RGBA"): _p2rgb,
+    ("P", "RGBX"): _p2rgb,
+    ("RGB", "1"): lambda im, out: (_rgb2l(im, out), _l2bit(out, out)),
+    ("RGB", "L"): _rgb2l,
+    ("RGB", "P"): _rgb2p,
+    ("RGB", "RGBA"): _shuffle((0, 1, 2, None)),
+    ("RGB", "RGBX"): _shuffle((0, 1, 2, None)),
+    ("RGBA", "L"): _rgb2l,
+    ("RGBA", "RGB"): _shuffle((0, 1, 2)),
+    ("RGBA", "RGBX"): _shuffle((0, 1, 2, None)),
+    ("RGBX", "L"): _rgb2l,
+    ("RGBX", "RGB"): _shuffle((0, 1, 2)),
+    ("RGBX", "RGBA"): _shuffle((0, 1, 2, None)),
+}
+
+def _rgba2la(im, out):
+    lum = ImagingCore("L", im.size)
+    _rgb2l(im, lum)
+    out.buffer[0::2] = lum.buffer
+    out.buffer[1::2] = im.buffer[3::4]
+
+def _luma2(converter):
+    # convert to greyscale first, then from "L"
+    def convert(im, out):
+        lum = ImagingCore("L", im.size)
+        _rgb2l(im, lum)
+        converter(lum, out)
+    return convert
+
+_CONVERT[("RGBA", "LA")] = _rgba2la
+_CONVERT[("RGB", "LA")] = _luma2(_l2la)
+_CONVERT[("RGBX", "LA")] = _luma2(_l2la)
+_CONVERT[("RGB", "I")] = _luma2(_l2i)
+_CONVERT[("RGBA", "I")] = _luma2(_l2i)
+_CONVERT[("RGBX", "I")] = _luma2(_l2i)
+
+# --------------------------------------------------------------------
+# Raw codecs
+
+class _Codec:
+    # common codec state, modelled after ImagingCodecState
+
+    def __init__(self, mode, rawmode=None, stride=0, ystep=1):
+        self.mode = mode
+        self.rawmode = rawmode or mode
+        self.stride = stride or 0
+        self.ystep = ystep
+        self.im = None
+
+    def setimage(self, im, extents=None):
+        if extents is None:
+            extents = (0, 0) + im.size
+        x0, y0, x1, y1 = extents
+        if x0 < 0 or y0 < 0 or x1 > im.size[0] or y1 > im.size[1] \
+           or x1 <= x0 or y1 <= y0:
+            raise ValueError("tile cannot extend outside image")
+        self.im = im
+        self.xoff, self.yoff = x0, y0
+        self.xsize, self.ysize = x1 - x0, y1 - y0
+        self.y = 0
+        if self.ystep < 0:
+            self.y = self.ysize - 1
+            self.ystep = -1
+        else:
+            self.ystep = 1
+        self.setup()
+
+    def setup(self):
+        pass
+
+    def _line(self, y):
+        # (start, stop) offsets of line y of the region, in the image buffer
+        im = self.im
+        start = (self.yoff + y) * im.linesize + self.xoff * im.pixelsize
+        return start, start + self.xsize * im.pixelsize
+
+##
+# Raw decoder.  Unpacks lines of raw data into the image memory.
+#
+# For raw modes where each pixel is unpacked on its own (see the
+# _imagingpack module), all complete lines in a block of data are
+# unpacked with a single call, as if they were one long line.  Line
+# padding is dropped first, and packed formats whose lines end with
+# unused bits unpack a few extra pixels per line, which are skipped
+# when the lines are stored.  Other raw modes (such as line
+# interleaved "RGB;L") are unpacked one line at a time.  Bottom-up images are stored line by line, in reverse.
+# Single band raw modes (such as "R") fill one band of the image
+# memory.
+
+class RawDecoder(_Codec):
+
+    def __init__(self, mode, rawmode=None, stride=0, ystep=1):
+        _Codec.__init__(self, mode, rawmode, stride, ystep)
+        # look up the unpacker here, like the C core does; errors
+        # from setimage only make ImageFile.load skip the tile
+        self.band = _imagingpack.getband(mode, self.rawmode)
+        if self.band is None:
+            self.bits, self.unpack = _imagingpack.getunpacker(
+                mode, self.rawmode
+                )
+        else:
+            self.bits, self.unpack = 8, _imagingpack._copy
+        self.bulk = getattr(self.unpack, "bulk", False)
+
+    def setup(self):
+        if self.band is None:
+            self.pixelsize = self.im.pixelsize
+        else:
+            self.pixelsize = 1
+        self.bytes = (self.xsize * self.bits + 7) // 8
+        if self.stride:
+            self.skip = self.stride - self.bytes
+        else:
+            self.skip = 0
+        self.pending = 0 # padding still to skip
+        # pixels unpacked from each line, including unused bits
+        self.pixels = self.bytes * 8 // self.bits
+        # full lines, stored in order: store many lines per slice
+        self.direct = (
+            self.ystep == 1 and self.xoff == 0 and
+            self.xsize == self.im.size[0] and self.pixels == self.xsize
+            )
+
+    def decode(self, data):
+        if self.im is None:
+            raise ValueError("decoder not initialized")
+        data = memoryview(data)
+        size = len(data)
+        ptr = 0
+        if self.pending:
+            if size < self.pending:
+                return 0, 0
+            ptr = self.pending
+            self.pending = 0
+        # complete lines in this block (the padding after the last
+        # one is skipped on the next call)
+        linesize = self.bytes + self.skip
+        if self.ystep < 0:
+            left = self.y + 1
+        else:
+            left = self.ysize - self.y
+        n = min((size - ptr + self.skip) // linesize, left)
+        if n <= 0:
+            return ptr, 0
+        if self.skip:
+            raw = b"".join([
+                data[i:i+self.bytes]
+                for i in range(ptr, ptr + n * linesize, linesize)
+                ])
+        else:
+            raw = data[ptr:ptr+n*self.bytes]
+        ptr += n * linesize - self.skip
+        if self.unpack is _imagingpack._copy:
+            pixels = raw
+        else:
+            if not isinstance(raw, bytes):
+                raw = raw.tobytes()
+            if self.bulk:
+                pixels = self.unpack(raw, n * self.pixels)
+            else:
+                size = self.bytes
+                pixels = b"".join([
+                    self.unpack(raw[i:i+size], self.pixels)
+                    for i in range(0, n * size, size)
+                    ])
+        buffer = self.im.buffer
+        band = self.band
+        step = self.im.pixelsize
+        if self.direct:
+            start = (self.yoff + self.y) * self.im.linesize
+            if band is None:
+                buffer[start:start+len(pixels)] = pixels
+            else:
+                stop = start + n * self.im.linesize
+                buffer[start+band:stop:step] = pixels
+            self.y += n
+        else:
+            linesize = self.pixels * self.pixelsize
+            size = self.xsize * self.pixelsize
+            for i in range(0, n * linesize, linesize):
+                start, stop = self._line(self.y)
+                if band is None:
+                    buffer[start:stop] = pixels[i:i+size]
+                else:
+                    buffer[start+band:stop:step] = pixels[i:i+size]
+                self.y += self.ystep
+        if self.y < 0 or self.y >= self.ysize:
+            return -1, 0
+        self.pending = self.skip
+        return ptr, 0
+
+##
+# Raw encoder.  Packs lines of image memory into raw data.
+
+class RawEncoder(_Codec):
+
+    def setup(self):
+        self.bits, self.pack = _imagingpack.getpacker(
+            self.im.mode, self.rawmode
+            )
+        self.count = (self.xsize * self.bits + 7) // 8
+        self.bytes = max(self.stride, self.count)
+        self.done = 0
+
+    def encode(self, bufsize):
+        if self.im is None:
+            raise ValueError("encoder not initialized")
+        if self.done:
+            return 0, 1, b""
+        lines = max(bufsize // self.bytes, 1)
+        buffer = self.im.buffer
+        padding = bytes(self.bytes - self.count)
+        data = []
+        for i in range(lines):
+            start, stop = self._line(self.y)
+            line = self.pack(buffer[start:stop], self.xsize)
+            data.append(bytes(line))
+            if padding:
+                data.append(padding)
+            self.y += self.ystep
+            if self.y < 0 or self.y >= self.ysize:
+                self.done = 1
+                break
+        data = b"".join(data)
+        return len(data), self.done, data
+
+    def encode_to_file(self, fh, bufsize):
+        import os
+        while 1:
+            l, s, d = self.encode(bufsize)
+            os.write(fh, d)
+            if s:
+                return s
+
+# --------------------------------------------------------------------
+# Factories
+
+def new(mode, size):
+    return ImagingCore(mode, size)
+
+def fill(mode, size, color=0):
+    im = ImagingCore(mode, size)
+    ink = _ink(mode, color)
+    if ink.count(0) != len(ink):
+        im.buffer[:] = ink * len(im)
+    return im
+
+# raw modes that have the same layout as the image memory, and the
+# image mode they map to
+MAPMODES = dict((mode, mode) for mode in _MODES if mode != "1")
+if sys.byteorder == "little":
+    MAPMODES.update({"I;32": "I", "F;32F": "F"})
+else:
+    MAPMODES.update({"I;32B": "I", "F;32BF": "F"})
+
+def map_buffer(target, size, codec, bbox, offset, args):
+    # use a region of an existing buffer (usually a memory map) as
+    # image memory.  only top-down data without line padding can be
+    # used as is; the buffer is exported read-only.
+    rawmode, stride, ystep = args
+    if codec != "raw":
+        raise ValueError("unsupported codec")
+    try:
+        mode = MAPMODES[rawmode]
+    except KeyError:
+        raise ValueError("cannot map raw mode %s" % rawmode)
+    if ystep != 1:
+        raise ValueError("cannot map bottom-up image")
+    linesize = int(size[0]) * _getmode(mode)[0]
+    if stride and stride != linesize:
+        raise ValueError("cannot map padded lines")
+    view = memoryview(target).toreadonly()
+    end = offset + linesize * int(size[1])
+    if offset < 0 or end > len(view):
+        raise ValueError("buffer is not large enough")
+    return ImagingCore(mode, size, view[offset:end])
+
+def raw_decoder(mode, rawmode=None, stride=0, ystep=1):
+    return RawDecoder(mode, rawmode, stride, ystep)
+
+def raw_encoder(mode, rawmode=None, stride=0, ystep=1):
+    return RawEncoder(mode, rawmode, stride, ystep)
+
+def gif_decoder(mode, bits=8, interlace=0):
+    from . import _imaginggif
+    return _imaginggif.GifDecoder(mode, bits, interlace)
+
+def gif_encoder(mode, rawmode=None, bits=8, interlace=0):
+    from . import _imaginggif
+    return _imaginggif.GifEncoder(mode, rawmode, bits, interlace)
+
+def zip_decoder(mode, rawmode=None, interlace=0):
+    from . import _imagingzip
+    return _imagingzip.ZipDecoder(mode, rawmode, interlace)
+
+def zip_encoder(mode, rawmode=None, *options):
+    from . import _imagingzip
+    return _imagingzip.ZipEncoder(mode, rawmode, *options)
+
+def packbits_decoder(mode, rawmode=None):
+    from . import _imagingtiff
+    return _imagingtiff.PackBitsDecoder(mode, rawmode)
+
+def tiff_lzw_decoder(mode, rawmode=None, predictor=1):
+    from . import _imagingtiff
+    return _imagingtiff.LzwDecoder(mode, rawmode, predictor)
+
+def tiff_deflate_decoder(mode, rawmode=None, predictor=1):
+    from . import _imagingtiff
+    return _imagingtiff.DeflateDecoder(mode, rawmode, predictor)
+
+def tga_rle_decoder(mode, rawmode=None, ystep=0, depth=0):
+    from . import _imagingrle
+    return _imagingrle.TgaRleDecoder(mode, rawmode, ystep, depth)
+
+def pcx_decoder(mode, rawmode=None, stride=0):
+    from . import _imagingrle
+    return _imagingrle.PcxDecoder(mode, rawmode, stride)
+
+def sgi_rle_decoder(mode, rawmode=None, stride=0, ystep=1):
+    from . import _imagingrle
+    return _imagingrle.SgiRleDecoder(mode, rawmode, stride, ystep)
+
+def sun_rle_decoder(mode, rawmode=None):
+    from . import _imagingrle
+    return _imagingrle.SunRleDecoder(mode, rawmode)
+
+def jpeg_decoder(mode, rawmode=None, jpegmode="", scale=1, draft=0):
+    from . import _imagingjpeg
+    return _imagingjpeg.JpegDecoder(mode, rawmode, jpegmode, scale, draft)
+
+def jpeg_encoder(mode, rawmode=None, quality=0, progressive=0, smooth=0,
+                 optimize=0, streamtype=0, xdpi=0, ydpi=0, subsampling=-1,
+                 extra=b""):
+    from . import _imagingjpeg
+    return _imagingjpeg.JpegEncoder(
+        mode, rawmode, quality, progressive, smooth, optimize, streamtype,
+        xdpi, ydpi, subsampling, extra
+        )
+
+def crc32(data, crc=(0, 0)):
+    # the C core splits the checksum into two 16-bit halves
+    if isinstance(crc, tuple):
+        crc = (crc[0] << 16) | crc[1]
+    crc = zlib.crc32(data, crc)
+    return crc >> 16, crc & 0xffff
@@ -0,0 +1,442 @@
+#
+# The Python Imaging Library.
+# $Id$
+#
+# resampling (resize and stretch) for the pure-Python core
+#
+# Images are resized in two passes, first vertically and then
+# horizontally.  For each output line (or column), the filter gives
+# the range of input lines that contribute to it, and an integer
+# weight for each of them.  When the image is reduced, the filter is
+# widened by the reduction factor, so that all input pixels
+# contribute (this is what the ANTIALIAS filter does in the C core).
+# The weight tables only depend on the sizes and the filter, so they
+# are kept in a small cache; resizing many images of the same size
+# computes them once.
+#
+# For 8-bit images, each line is a big integer with a 32-bit lane per
+# sample, and each contributing line is added to all lanes with a
+# single multiply-add.  The results are clipped with byte tables.
+# The horizontal pass does the same with columns, taken from the
+# (already reduced) output of the first pass with extended slicing.
+#
+# Other modes are resampled with floating point arithmetic, a line at
+# a time.
+#
+# Reducing by integer factors averages whole blocks of pixels; block
+# sums are made in wide lanes, in the same way, and divided with a
+# multiplication by the reciprocal.
+#
+# See the README file for information on usage and redistribution.
+#
+
+import array
+import math
+import sys
+from functools import lru_cache
+from itertools import repeat
+from operator import add, itemgetter, mul
+
+_LE = sys.byteorder == "little"
+
+# filters, by Image constant: support, function
+NEAREST, ANTIALIAS, BILINEAR, BICUBIC = 0, 1, 2, 3
+
+def _triangle(x):
+    x = abs(x)
+    if x < 1.0:
+        return 1.0 - x
+    return 0.0
+
+def _cubic(x, a=-0.5):
+    x = abs(x)
+    if x < 1.0:
+        return ((a + 2.0) * x - (a + 3.0)) * x * x + 1
+    if x < 2.0:
+        return (((x - 5) * x + 8) * x - 4) * a
+    return 0.0
+
+def _sinc(x):
+    if x == 0.0:
+        return 1.0
+    x = x * math.pi
+    return math.sin(x) / x
+
+def _lanczos(x):
+    # 3-lobed lanczos
+    if -3.0 <= x < 3.0:
+        return _sinc(x) * _sinc(x / 3)
+    return 0.0
+
+_FILTERS = {
+    ANTIALIAS: (3.0, _lanczos),
+    BILINEAR: (1.0, _triangle),
+    BICUBIC: (2.0, _cubic),
+    }
+
+# weights have 16 fractional bits.  in the 32-bit lanes, the integer
+# part of each result ends up in the upper two bytes, offset by 256 so
+# that it is never negative.
+_BITS = 16
+_ONE = 1 << _BITS
+_LANE = (256 << _BITS) + (1 << (_BITS - 1)) # offset, rounding
+
+# clipping, from the upper byte of each lane
+_KEEP = bytes([0, 255] + [0] * 254) # in range
+_OVER = bytes([0, 0] + [255] * 254) # above 255
+
+@lru_cache(maxsize=32)
+def _coefficients(insize, outsize, filter, start=0.0, stop=None):
+    # first input index and integer weights, for each output index.
+    # the output covers input coordinates start to stop.
+    if stop is None:
+        stop = insize
+    support, function = _FILTERS[filter]
+    scale = (stop - start) / outsize
+    fscale = max(scale, 1.0)
+    support = support * fscale
+    coefficients = []
+    for i in range(outsize):
+        center = start + (i + 0.5) * scale
+        lo = max(int(center - support + 0.5), 0)
+        hi = min(int(center + support + 0.5), insize)
+        weights = [function((j - center + 0.5) / fscale) for j in range(lo, hi)]
+        # drop zero weights at the ends
+        while len(weights) > 1 and not weights[-1]:
+            weights.pop()
+        while len(weights) > 1 and not weights[0]:
+            weights.pop(0)
+            lo += 1
+        total = sum(weights)
+        weights = [int(round(w * _ONE / total)) for w in weights]
+        # make the weights add up exactly, so that flat areas stay flat
+        k = weights.index(max(weights))
+        weights[k] += _ONE - sum(weights)
+        coefficients.append((lo, tuple(weights)))
+    return tuple(coefficients)
+
+_BIAS = {}
+
+def _bias(n, value=_LANE, size=4):
+    # n lanes of the given size, holding a rounding offset
+    try:
+        return _BIAS[n, value, size]
+    except KeyError:
+        bias = int.from_bytes(value.to_bytes(size, "little") * n, "little")
+        if len(_BIAS) > 16:
+            _BIAS.clear()
+        _BIAS[n, value, size] = bias
+        return bias
+
+def _narrow(acc, n):
+    # clip the integer parts of n lanes to 0..255
+    data = acc.to_bytes(n * 4, "little")
+    hi = data[3::4]
+    v = int.from_bytes(data[2::4], "little") & int.from_bytes(
+        hi.translate(_KEEP), "little"
+        ) | int.from_bytes(hi.translate(_OVER), "little")
+    return v.to_bytes(n, "little")
+
+# --------------------------------------------------------------------
+# 8-bit images
+
+def _vertical(buffer, linesize, coefficients):
+    # resample whole lines; returns the output lines
+    wide = bytearray(linesize * 4)
+    bias = _bias(linesize)
+    lines = {} # widened input lines, for the current window
+    out = []
+    for start, weights in coefficients:
+        for y in [y for y in lines if y < start]:
+            del lines[y]
+        acc = bias
+        for y, w in enumerate(weights, start):
+            try:
+                line = lines[y]
+            except KeyError:
+                wide[0::4] = buffer[y*linesize:(y+1)*linesize]
+                line = lines[y] = int.from_bytes(wide, "little")
+            acc += w * line
+        out.append(_narrow(acc, linesize))
+    return out
+
+def _horizontal(data, xsize, ysize, bands, coefficients):
+    # resample whole columns of data (ysize lines of xsize pixels)
+    linesize = xsize * bands
+    wide = bytearray(ysize * 4)
+    columns = []
+    for i in range(linesize):
+        wide[0::4] = data[i::linesize]
+        columns.append(int.from_bytes(wide, "little"))
+    bias = _bias(ysize)
+    step = len(coefficients) * bands
+    out = bytearray(step * ysize)
+    for x, (start, weights) in enumerate(coefficients):
+        for band in range(bands):
+            i = start * bands + band
+            acc = bias + sum(map(
+                mul, weights, columns[i:i+len(weights)*bands:bands]
+                ))
+            out[x*bands+band::step] = _narrow(acc, ysize)
+    return out
+
+def _resample8(im, size, xcoefficients, ycoefficients):
+    xsize, ysize = im.size
+    bands = im.pixelsize
+    if ycoefficients:
+        lines = _vertical(im.buffer, im.linesize, ycoefficients)
+        data = b"".join(lines)
+        ysize = size[1]
+    else:
+        data = im.buffer
+    if xcoefficients:
+        data = _horizontal(data, xsize, ysize, bands, xcoefficients)
+    out = im._new(im.mode, size)
+    out.buffer[:] = data
+    return out
+
+# --------------------------------------------------------------------
+# Other images
+
+_TYPES = {
+    # mode => array type, byte order
+    "I": ("i", sys.byteorder), "F": ("f", sys.byteorder),
+    "I;16": ("H", "little"), "I;16L": ("H", "little"),
+    "I;16B": ("H", "big"),
+    }
+
+def _resamplefloat(im, size, xcoefficients, ycoefficients):
+    code, order = _TYPES[im.mode]
+    values = array.array(code, bytes(im.buffer))
+    if (order == "little") != _LE:
+        values.byteswap()
+    xsize, ysize = im.size
+    lines = [values[y*xsize:(y+1)*xsize].tolist() for y in range(ysize)]
+    if ycoefficients:
+        out = []
+        for start, weights in ycoefficients:
+            acc = repeat(0.0, xsize)
+            for y, w in enumerate(weights, start):
+                acc = map(add, acc, map(mul, lines[y], repeat(w / _ONE)))
+            out.append(list(acc))
+        lines = out
+    if xcoefficients:
+        xcoefficients = [
+            (start, start + len(weights), [w / _ONE for w in weights])
+            for start, weights in xcoefficients
+            ]
+        lines = [
+            [sum(map(mul, line[start:stop], weights))
+             for start, stop, weights in xcoefficients]
+            for line in lines
+            ]
+    values = array.array(code)
+    for line in lines:
+        if code == "i":
+            line = [min(max(int(round(v)), -2**31), 2**31-1) for v in line]
+        elif code == "H":
+            line = [min(max(int(round(v)), 0), 65535) for v in line]
+        values.extend(line)
+    if (order == "little") != _LE:
+        values.byteswap()
+    out = im._new(im.mode, size)
+    out.buffer[:] = values.tobytes()
+    return out
+
+# --------------------------------------------------------------------
+# Nearest neighbour
+
+def _nearest(im, size):
+    xsize, ysize = size
+    width, height = im.size
+    ps = im.pixelsize
+    # byte offsets of all output pixels, in a source line
+    offsets = [
+        (2 * x + 1) * width // (2 * xsize) * ps + i
+        for x in range(xsize) for i in range(ps)
+        ]
+    gather = itemgetter(*offsets)
+    if len(offsets) == 1:
+        gather = lambda line, gather=gather: (gather(line),)
+    out = im._new(im.mode, size)
+    linesize = im.linesize
+    outsize = xsize * ps
+    previous = None
+    for y in range(ysize):
+        sy = (2 * y + 1) * height // (2 * ysize)
+        if sy != previous:
+            line = bytes(gather(im.buffer[sy*linesize:(sy+1)*linesize]))
+            previous = sy
+        out.buffer[y*outsize:(y+1)*outsize] = line
+    return out
+
+# --------------------------------------------------------------------
+# Box reduction
+
+# block sums are added up in the narrowest lanes that can hold them,
+# and divided by multiplying with a 32-bit reciprocal, in 64-bit
+# lanes; the quotient ends up in the fifth byte of each lane.  this is
+# exact for blocks of up to _MAXBLOCK pixels.
+_MAXBLOCK = 4096
+_LANES = {2: "H", 4: "I", 8: "Q"}
+
+def _divide(sums, counts):
+    # rounded averages of a list of sums
+    return [(s + c // 2) // c for s, c in zip(sums, counts)]
+
+def _average(s, count, lane, n):
+    # rounded averages of the count lanes in s, each a sum of n values
+    data = s.to_bytes(count * lane, "little")
+    if n > _MAXBLOCK:
+        data = memoryview(data).cast(_LANES[lane]).tolist()
+        return bytes(_divide(data, repeat(n)))
+    if lane < 8:
+        wide = bytearray(count * 8)
+        for i in range(lane):
+            wide[i::8] = data[i::lane]
+        s = int.from_bytes(wide, "little")
+    scale = -(-(1 << 32) // n)
+    data = (s * scale + _bias(count, (n // 2) * scale, 8)).to_bytes(
+        count * 8, "little"
+        )
+    return data[4::8]
+
+def _reduce8(im, xfactor, yfactor):
+    xsize, ysize = im.size
+    bands = im.pixelsize
+    linesize = im.linesize
+    buffer = im.buffer
+    blocks, xrem = divmod(xsize, xfactor)
+    step = xfactor * bands
+    full = blocks * step
+    for lane in (2, 4, 8):
+        if 255 * xfactor * yfactor < 1 << (8 * lane):
+            break
+    wide = bytearray(linesize * lane)
+    out = []
+    for y in range(0, ysize, yfactor):
+        rows = min(yfactor, ysize - y)
+        # add up the lines, one lane per sample
+        acc = 0
+        for k in range(y * linesize, (y + rows) * linesize, linesize):
+            wide[0::lane] = buffer[k:k+linesize]
+            acc += int.from_bytes(wide, "little")
+        n = rows * xfactor
+        if xfactor == 1:
+            out.append(_average(acc, linesize, lane, n))
+            continue
+        lanes = acc.to_bytes(linesize * lane, "little")
+        lanes = memoryview(lanes).cast(_LANES[lane])
+        line = bytearray(-(-xsize // xfactor) * bands)
+        if blocks:
+            for band in range(bands):
+                s = 0
+                for dx in range(xfactor):
+                    s += int.from_bytes(
+                        lanes[dx*bands+band:full:step], "little"
+                        )
+                line[band:full//xfactor:bands] = _average(s, blocks, lane, n)
+        if xrem:
+            # partial block at the right edge
+            line[full//xfactor:] = bytes(_divide(
+                [sum(lanes[full+band::bands]) for band in range(bands)],
+                repeat(rows * xrem)
+                ))
+        out.append(line)
+    return b"".join(out)
+
+def _reducefloat(im, xfactor, yfactor):
+    code, order = _TYPES[im.mode]
+    values = array.array(code, bytes(im.buffer))
+    if (order == "little") != _LE:
+        values.byteswap()
+    xsize, ysize = im.size
+    out = array.array(code)
+    for y in range(0, ysize, yfactor):
+        rows = min(yfactor, ysize - y)
+        acc = values[y*xsize:(y+1)*xsize].tolist()
+        for k in range(xsize * (y + 1), xsize * (y + rows), xsize):
+            acc = list(map(add, acc, values[k:k+xsize]))
+        line = [
+            sum(acc[x:x+xfactor]) / (rows * min(xfactor, xsize - x))
+            for x in range(0, xsize, xfactor)
+            ]
+        if code == "i":
+            line = [int(math.floor(v + 0.5)) for v in line]
+        elif code == "H":
+            line = [int(v + 0.5) for v in line]
+        out.extend(line)
+    if (order == "little") != _LE:
+        out.byteswap()
+    return out.tobytes()
+
+##
+# Reduces an image memory by integer factors.  Each output pixel is
+# the average of a block of xfactor by yfactor input pixels; blocks
+# along the right and bottom edges may be smaller.
+#
+# @param im Image memory.
+# @param factor Reduction factors, as a 2-tuple.
+# @return A new image memory.
+
+def reduce(im, factor):
+    xfactor, yfactor = int(factor[0]), int(factor[1])
+    if xfactor < 1 or yfactor < 1:
+        raise ValueError("reduction factor must be positive")
+    if (xfactor, yfactor) == (1, 1):
+        return im.copy()
+    if im.mode in ("1", "P", "PA"):
+        raise ValueError("image has wrong mode")
+    xsize, ysize = im.size
+    size = -(-xsize // xfactor), -(-ysize // yfactor)
+    out = im._new(im.mode, size)
+    if im.mode in _TYPES:
+        out.buffer[:] = _reducefloat(im, xfactor, yfactor)
+    else:
+        out.buffer[:] = _reduce8(im, xfactor, yfactor)
+    return out
+
+# --------------------------------------------------------------------
+
+##
+# Resizes an image memory.
+#
+# @param im Image memory.
+# @param size Output size.
+# @param filter Resampling filter (an Image filter constant).
+# @param box The region of the input image to resample, as a 4-tuple
+#    of (possibly fractional) coordinates.  The default is the whole
+#    image.  Not used by the NEAREST filter.
+# @return A new image memory.
+
+def resize(im, size, filter=NEAREST, box=None):
+    xsize, ysize = int(size[0]), int(size[1])
+    if xsize < 0 or ysize < 0:
+        raise ValueError("bad image size")
+    size = xsize, ysize
+    if filter != NEAREST and filter not in _FILTERS:
+        raise ValueError("unknown resampling filter")
+    if box is None or filter == NEAREST:
+        box = (0, 0) + im.size
+    box = tuple(float(v) for v in box)
+    full = box == (0.0, 0.0, float(im.size[0]), float(im.size[1]))
+    if size == im.size and full:
+        return im.copy()
+    if not (xsize and ysize and im.size[0] and im.size[1]):
+        return im._new(im.mode, size)
+    if filter == NEAREST:
+        return _nearest(im, size)
+    if im.mode in ("1", "P", "PA"):
+        raise ValueError("image has wrong mode")
+    xcoefficients = ycoefficients = None
+    if xsize != im.size[0] or box[0] or box[2] != im.size[0]:
+        xcoefficients = _coefficients(
+            im.size[0], xsize, filter, box[0], box[2]
+            )
+    if ysize != im.size[1] or box[1] or box[3] != im.size[1]:
+        ycoefficients = _coefficients(
+            im.size[1], ysize, filter, box[1], box[3]
+            )
+    if im.mode in _TYPES:
+        return _resamplefloat(im, size, xcoefficients, ycoefficients)
+    return _resample8(im, size, xcoefficients, ycoefficients)
@@ -0,0 +1,278 @@
+#
+# The Python Imaging Library.
+# $Id$
+#
+# Run-length decoders ("tga_rle", "pcx", "sgi_rle", "sun_rle") for the
+# pure-Python core
+#
+# The decoders expand runs into a bytearray: repeated values are
+# expanded with a bytes multiplication, and literal data is copied
+# with a single slice.  PCX and Sun files mark runs with special byte
+# values, so a regular expression splits a whole block of data into
+# literal strings and runs at once; the runs are then expanded with
+# map, and everything is joined in one go.
+#
+# Complete lines are handed to a raw decoder, which unpacks and stores
+# many lines at a time, and takes care of line padding and bottom-up
+# images.  PCX files store the bands (or bit planes) of each line one
+# after the other; the bands of all complete lines are gathered and
+# unpacked with a single call.  SGI files hold each band as a separate
+# image, with a table of line offsets, so the SGI decoder collects the
+# whole file, and interleaves the bands with extended slicing.
+#
+# See the README file for information on usage and redistribution.
+#
+
+import re
+import struct
+
+from . import _imagingpack
+from ._imagingpure import _Codec, RawDecoder
+
+# runs: count and value.  a PCX count byte has the two top bits set;
+# a Sun run starts with 0x80, and a 0x80 byte is written as 0x80 0x00.
+_PCXRUN = re.compile(rb"([\xc0-\xff])([\x00-\xff])")
+_SUNRUN = re.compile(rb"\x80([\x01-\xff])([\x00-\xff])|\x80\x00")
+
+# start of a run, and run lengths, indexed by count byte
+_PCXSTART = re.compile(rb"[\xc0-\xff]")
+_PCXCOUNT = {bytes((i,)): i & 63 for i in range(192, 256)}
+_SUNSTART = re.compile(rb"\x80")
+_SUNCOUNT = {bytes((i,)): i + 1 for i in range(1, 256)}
+
+def _expand(data, run, start, counts, escape=b""):
+    # expand all complete runs in data.  returns the expanded data,
+    # and the number of bytes used.  runs without a count give the
+    # escape string.
+    parts = run.split(data)
+    literals = parts[0::3]
+    # the only run start left in the literals is an incomplete run
+    # at the very end; it is left for the next call
+    used = len(data)
+    m = start.search(literals[-1])
+    if m:
+        used -= len(literals[-1]) - m.start()
+        literals[-1] = literals[-1][:m.start()]
+    runs = [
+        value * counts[count] if count else escape
+        for count, value in zip(parts[1::3], parts[2::3])
+        ]
+    out = [None] * (len(literals) + len(runs))
+    out[0::2] = literals
+    out[1::2] = runs
+    return b"".join(out), used
+
+# line interleaved raw modes: raw mode => planes, bits per plane
+_PLANAR = {
+    "RGB;L": (3, 8),
+    "P;2L": (2, 1),
+    "P;4L": (4, 1),
+    }
+
+# SGI line offsets are file offsets; the data starts after the header
+_SGIHEADER = 512
+
+class _RleDecoder(_Codec):
+    # common line handling for the run-length decoders
+
+    def setup(self):
+        self.out = bytearray() # expanded data, not yet stored
+        self.lines = self.decoder(self.rawmode, self.stride)
+
+    def decoder(self, rawmode, stride):
+        # raw decoder for the expanded lines
+        decoder = RawDecoder(self.mode, rawmode, stride, self.ystep)
+        decoder.setimage(self.im, (
+            self.xoff, self.yoff,
+            self.xoff + self.xsize, self.yoff + self.ysize
+            ))
+        return decoder
+
+    def flush(self):
+        # store all complete lines; true when the image is done
+        n, err = self.lines.decode(self.out)
+        if n < 0:
+            return 1
+        del self.out[:n]
+        return 0
+
+##
+# TGA run-length decoder.  Runs hold whole pixels, and may cross line
+# boundaries.
+
+class TgaRleDecoder(_RleDecoder):
+
+    def __init__(self, mode, rawmode=None, ystep=0, depth=0):
+        _Codec.__init__(self, mode, rawmode, 0, ystep)
+        self.depth = depth
+
+    def decode(self, data):
+        if self.im is None:
+            raise ValueError("decoder not initialized")
+        size = (self.depth + 7) // 8
+        out = self.out
+        n = len(data)
+        ptr = 0
+        while ptr < n:
+            c = data[ptr]
+            if c & 128:
+                # repeated pixel
+                if ptr + size >= n:
+                    break
+                out += bytes(data[ptr+1:ptr+1+size]) * ((c & 127) + 1)
+                ptr += size + 1
+            else:
+                # literal pixels
+                c = (c + 1) * size
+                if ptr + c >= n:
+                    break
+                out += data[ptr+1:ptr+1+c]
+                ptr += c + 1
+        if self.flush():
+            return -1, 0
+        return ptr, 0
+
+##
+# PCX run-length decoder.  Bytes with the two top bits set give the
+# length of a run; all other bytes are literals.
+
+class PcxDecoder(_RleDecoder):
+
+    def __init__(self, mode, rawmode=None, stride=0):
+        _Codec.__init__(self, mode, rawmode, stride)
+
+    def setup(self):
+        _RleDecoder.setup(self)
+        self.planes = _PLANAR.get(self.rawmode)
+        if self.planes:
+            # the unpacked lines are stored as is
+            self.lines = self.decoder(self.mode, 0)
+            self.unpack = _imagingpack.getunpacker(
+                self.mode, self.rawmode
+                )[1]
+            self.left = self.ysize
+
+    def decode(self, data):
+        if self.im is None:
+            raise ValueError("decoder not initialized")
+        out, n = _expand(data, _PCXRUN, _PCXSTART, _PCXCOUNT)
+        self.out += out
+        if self.planes:
+            done = self.interleave()
+        else:
+            done = self.flush()
+        if done:
+            return -1, 0
+        return n, 0
+
+    def interleave(self):
+        # gather each band of all complete lines, and unpack them as
+        # one long line
+        planes, bits = self.planes
+        out = self.out
+        stride = self.stride
+        size = stride // planes
+        count = (self.xsize * bits + 7) // 8 # bytes used per plane
+        pixels = count * 8 // bits # pixels unpacked per line
+        n = min(len(out) // stride, self.left)
+        if not n:
+            return 0
+        data = b"".join([
+            out[i+k*size:i+k*size+count]
+            for k in range(planes) for i in range(0, n * stride, stride)
+            ])
+        del out[:n*stride]
+        data = self.unpack(data, n * pixels)
+        if pixels != self.xsize:
+            data = b"".join([
+                data[i:i+self.xsize] for i in range(0, n * pixels, pixels)
+                ])
+        self.left -= n
+        return self.lines.decode(data)[0] < 0
+
+##
+# SGI run-length decoder.  Each line of each band is a separate run
+# sequence; the low seven bits of each count byte give the length of
+# the run, and the top bit tells if it is a literal run.
+
+class SgiRleDecoder(_RleDecoder):
+
+    def __init__(self, mode, rawmode=None, stride=0, ystep=1):
+        _Codec.__init__(self, mode, rawmode, 0, ystep)
+
+    def setup(self):
+        _RleDecoder.setup(self)
+        self.bands = self.lines.bits // 8
+        self.end = None # size of the compressed data
+
+    def decode(self, data):
+        if self.im is None:
+            raise ValueError("decoder not initialized")
+        out = self.out
+        out += data
+        count = self.ysize * self.bands
+        if self.end is None:
+            if len(out) < count * 8:
+                return len(data), 0
+            # line offset and length tables
+            self.starts = struct.unpack(">%dI" % count, out[:count*4])
+            self.lengths = struct.unpack(">%dI" % count, out[count*4:count*8])
+            self.end = max([
+                start + length - _SGIHEADER
+                for start, length in zip(self.starts, self.lengths)
+                ])
+        if len(out) < self.end:
+            return len(data), 0
+        xsize = self.xsize
+        bands = self.bands
+        pixels = bytearray(xsize * self.ysize * bands)
+        for band in range(bands):
+            lines = []
+            for i in range(band * self.ysize, (band + 1) * self.ysize):
+                start = self.starts[i] - _SGIHEADER
+                line = self.expand(out, start, start + self.lengths[i])
+                if len(line) != xsize:
+                    line = (line + bytes(xsize))[:xsize]
+                lines.append(line)
+            pixels[band::bands] = b"".join(lines)
+        del out[:]
+        self.lines.decode(pixels)
+        return -1, 0
+
+    def expand(self, data, ptr, end):
+        # expand the runs of one line
+        line = bytearray()
+        while ptr < end:
+            c = data[ptr]
+            n = c & 127
+            if not n:
+                break
+            if c & 128:
+                line += data[ptr+1:ptr+1+n]
+                ptr += n + 1
+            else:
+                line += data[ptr+1:ptr+2] * n
+                ptr += 2
+        return line
+
+##
+# Sun raster run-length decoder.  0x80 starts a run, followed by the
+# run length minus one, and the value (or 0 for a single 0x80 byte).
+# Lines are padded to a multiple of 16 bits.
+
+class SunRleDecoder(_RleDecoder):
+
+    def setup(self):
+        bits = _imagingpack.getunpacker(self.mode, self.rawmode)[0]
+        size = (self.xsize * bits + 7) // 8
+        self.stride = size + (size & 1)
+        _RleDecoder.setup(self)
+
+    def decode(self, data):
+        if self.im is None:
+            raise ValueError("decoder not initialized")
+        out, n = _expand(data, _SUNRUN, _SUNSTART, _SUNCOUNT, b"\x80")
+        self.out += out
+        if self.flush():
+            return -1, 0
+        return n, 0
@@ -0,0 +1,357 @@
+#
+# The Python Imaging Library.
+# $Id$
+#
+# TIFF strip codecs ("packbits", "tiff_lzw", "tiff_deflate") for the
+# pure-Python core
+#
+# Each decoder handles one strip (or tile).  Decompressed data is
+# collected in a bytearray, and complete rows are unpacked into the
+# image memory as soon as they are available; rows of full-width
+# images that need no conversion are copied many at a time.  The
+# decoders stop as soon as the strip is complete, so they can be fed
+# data that runs past the end of the strip.
+#
+# The LZW decoder works like the GIF decoder: the string table holds
+# the offset and length of each string in the output, and every code
+# is expanded with a single slice copy.  TIFF packs codes most
+# significant bit first, and widens them one code early.
+#
+# Horizontal differencing (predictor 2) is undone one row at a time,
+# with a running sum over each sample position.  Like libtiff, only
+# the LZW and deflate decoders support it.
+#
+# See the README file for information on usage and redistribution.
+#
+
+import array
+import sys
+import zlib
+from itertools import accumulate
+
+from . import _imagingpack
+from ._imagingpure import _Codec
+from ._imagingzip import _unsub
+
+_LE = sys.byteorder == "little"
+
+# LZW codes are at most 12 bits wide
+_MAXCODE = 4096
+
+# largest amount of data inflated (or expanded) in one go
+_MAXOUT = 1 << 18
+
+# array type codes for 16- and 32-bit samples
+_TYPES = {}
+for t in "LIH":
+    _TYPES[array.array(t).itemsize] = t
+del t
+
+# --------------------------------------------------------------------
+# Predictor
+
+def _sampleformat(rawmode):
+    # bytes per sample, and byte order, for a raw mode
+    bits = 8
+    big = 0
+    if ";" in rawmode:
+        suffix = rawmode.split(";")[1]
+        digits = suffix.rstrip("BFSI")
+        if digits.isdigit():
+            bits = int(digits)
+            big = "B" in suffix[len(digits):]
+    return bits, big
+
+def _unpredict(row, bpp, size, big):
+    # undo horizontal differencing.  each sample is the sum of all
+    # samples to its left in the same band, modulo the sample size.
+    if size == 1:
+        return _unsub(row, bpp)
+    t = _TYPES[size]
+    a = array.array(t, row)
+    if big == _LE:
+        a.byteswap()
+    spp = bpp // size
+    out = array.array(t, bytes(len(row)))
+    lo = 0 if _LE else 8 - size
+    for j in range(spp):
+        # keep the low bytes of 64-bit running sums
+        sums = array.array("Q", accumulate(a[j::spp])).tobytes()
+        lane = bytearray(len(sums) // 8 * size)
+        for k in range(size):
+            lane[k::size] = sums[lo+k::8]
+        out[j::spp] = array.array(t, lane)
+    if big == _LE:
+        out.byteswap()
+    return out.tobytes()
+
+# --------------------------------------------------------------------
+# Decoders
+
+class _StripDecoder(_Codec):
+    # common row handling for the strip decoders
+
+    def __init__(self, mode, rawmode=None, predictor=1):
+        _Codec.__init__(self, mode, rawmode)
+        self.bits, self.unpack = _imagingpack.getunpacker(
+            mode, self.rawmode
+            )
+        if predictor == 2:
+            bits, self.big = _sampleformat(self.rawmode)
+            if bits not in (8, 16, 32) or self.bits % bits:
+                raise ValueError(
+                    "predictor not supported for raw mode %s" % self.rawmode
+                    )
+            self.sample = bits // 8
+        elif predictor != 1:
+            raise ValueError("unsupported predictor %d" % predictor)
+        self.predictor = predictor
+
+    def setup(self):
+        im = self.im
+        self.rowbytes = (self.xsize * self.bits + 7) // 8
+        self.bpp = self.bits // 8 # bytes per pixel, for the predictor
+        self.left = self.rowbytes * self.ysize # output still needed
+        self.out = bytearray() # decompressed data
+        self.ptr = 0 # start of the first row not yet stored
+        self.done = 0
+        # full lines, stored as is: copy many lines per slice
+        self.direct = (
+            self.predictor == 1 and self.unpack is _imagingpack._copy and
+            self.xoff == 0 and self.xsize == im.size[0]
+            )
+
+    def rows(self):
+        # store all complete rows
+        out = self.out
+        ptr = self.ptr
+        rowbytes = self.rowbytes
+        im = self.im
+        if self.direct:
+            n = min((len(out) - ptr) // rowbytes, self.ysize - self.y)
+            start = (self.yoff + self.y) * im.linesize
+            im.buffer[start:start+n*rowbytes] = out[ptr:ptr+n*rowbytes]
+            ptr += n * rowbytes
+            self.y += n
+        else:
+            while self.y < self.ysize and len(out) - ptr >= rowbytes:
+                row = out[ptr:ptr+rowbytes]
+                if self.predictor == 2:
+                    row = _unpredict(row, self.bpp, self.sample, self.big)
+                start, stop = self._line(self.y)
+                im.buffer[start:stop] = self.unpack(row, self.xsize)
+                ptr += rowbytes
+                self.y += 1
+        self.ptr = ptr
+        if self.y >= self.ysize:
+            self.done = 1
+
+    def trim(self, n):
+        # drop n bytes of stored rows from the output buffer
+        del self.out[:n]
+        self.ptr -= n
+
+##
+# PackBits decoder (TIFF compression 32773).
+
+class PackBitsDecoder(_StripDecoder):
+
+    def __init__(self, mode, rawmode=None):
+        _StripDecoder.__init__(self, mode, rawmode)
+
+    def decode(self, data):
+        if self.im is None:
+            raise ValueError("decoder not initialized")
+        if self.done:
+            return -1, 0
+        out = self.out
+        left = self.left
+        n = len(data)
+        ptr = 0
+        while left > 0 and ptr < n:
+            c = data[ptr]
+            if c < 128:
+                # literal run
+                c += 1
+                if ptr + c >= n:
+                    break
+                out += data[ptr+1:ptr+1+c]
+                ptr += c + 1
+            elif c > 128:
+                # repeated byte
+                if ptr + 1 >= n:
+                    break
+                c = 257 - c
+                out += bytes((data[ptr+1],)) * c
+                ptr += 2
+            else:
+                ptr += 1 # no-op
+                continue
+            left -= c
+        self.left = left
+        self.rows()
+        self.trim(self.ptr)
+        if self.done or left <= 0:
+            return -1, 0
+        return ptr, 0
+
+##
+# LZW decoder (TIFF compression 5).
+
+class LzwDecoder(_StripDecoder):
+
+    def setup(self):
+        _StripDecoder.setup(self)
+        self.data = bytearray() # unused part of the code stream
+        self.acc = self.count = 0 # bit buffer
+        self.offs = [0] * _MAXCODE # where each string is in the output
+        self.lens = [0] * _MAXCODE
+        self.epoch = 0 # where the current string table starts
+        self.size = 9
+        self.next = 258
+        self.prev = -1 # length of previous string, if any
+        self.prevpos = 0
+
+    def decode(self, data):
+        if self.im is None:
+            raise ValueError("decoder not initialized")
+        if self.done:
+            return -1, 0
+        data = memoryview(data)
+        end = 0
+        for i in range(0, len(data), _MAXOUT):
+            # don't copy data beyond the end of the strip
+            self.data += data[i:i+_MAXOUT]
+            try:
+                end = self.expand()
+            except ValueError:
+                return -1, -2 # code out of range
+            self.rows()
+            # stored rows can be dropped, but the string table may
+            # refer to anything after the last clear code
+            n = min(self.ptr, self.epoch)
+            if n:
+                self.trim(n)
+                self.epoch -= n
+                self.prevpos -= n
+                offs = self.offs
+                for code in range(258, self.next):
+                    offs[code] -= n
+            if end or self.done or self.left <= 0:
+                return -1, 0
+        return len(data), 0
+
+    def expand(self):
+        # expand all complete codes in the buffer.  returns true when
+        # the end code has been seen.
+        data = self.data
+        out = self.out
+        offs = self.offs
+        lens = self.lens
+        left = self.left
+        acc, count, size = self.acc, self.count, self.size
+        next, prev, prevpos = self.next, self.prev, self.prevpos
+        pos = len(out)
+        mask = (1 << size) - 1
+        limit = mask # code size increases one code early
+        ptr = 0
+        n = len(data)
+        end = 0
+        while left > 0:
+            if count < size:
+                # refill the bit buffer; a code spans at most two bytes
+                if ptr + 3 <= n:
+                    acc = ((acc & ((1 << count) - 1)) << 24 |
+                           data[ptr] << 16 | data[ptr+1] << 8 | data[ptr+2])
+                    ptr += 3
+                    count += 24
+                else:
+                    while count < size and ptr < n:
+                        acc = (acc & ((1 << count) - 1)) << 8 | data[ptr]
+                        ptr += 1
+                        count += 8
+                    if count < size:
+                        break
+            count -= size
+            code = (acc >> count) & mask
+            if code < 256:
+                # literal
+                out.append(code)
+                length = 1
+            elif code > 257:
+                if code < next:
+                    length = lens[code]
+                    if length > left:
+                        length = left
+                    off = offs[code]
+                    out += out[off:off+length]
+                elif code == next and prev >= 0:
+                    # the string being defined: the previous string
+                    # plus its own first byte
+                    length = prev + 1
+                    if length > left:
+                        out += out[prevpos:prevpos+left]
+                        length = left
+                    else:
+                        out += out[prevpos:prevpos+prev]
+                        out.append(out[prevpos])
+                else:
+                    raise ValueError("bad code")
+            elif code == 256:
+                # clear
+                size = 9
+                mask = limit = 511
+                next = 258
+                prev = -1
+                self.epoch = pos
+                continue
+            else:
+                end = 1 # end of information
+                break
+            if prev >= 0 and next < _MAXCODE:
+                offs[next] = prevpos
+                lens[next] = prev + 1
+                next += 1
+                if next >= limit and size < 12:
+                    size += 1
+                    mask = limit = (1 << size) - 1
+            prev = length
+            prevpos = pos
+            pos += length
+            left -= length
+        del data[:ptr]
+        self.acc, self.count, self.size = acc, count, size
+        self.next, self.prev, self.prevpos = next, prev, prevpos
+        self.left = left
+        return end
+
+##
+# Deflate decoder (TIFF compression 8 and 32946).
+
+class DeflateDecoder(_StripDecoder):
+
+    def setup(self):
+        _StripDecoder.setup(self)
+        self.z = zlib.decompressobj()
+
+    def decode(self, data):
+        if self.im is None:
+            raise ValueError("decoder not initialized")
+        if self.done:
+            return -1, 0
+        z = self.z
+        try:
+            chunk = z.decompress(data, _MAXOUT)
+            while 1:
+                self.out += chunk
+                self.rows()
+                self.trim(self.ptr)
+                if self.done or z.eof:
+                    return -1, 0
+                tail = z.unconsumed_tail
+                if not tail:
+                    break
+                chunk = z.decompress(tail, _MAXOUT)
+        except zlib.error:
+            return -1, -2 # broken stream
+        return len(data), 0
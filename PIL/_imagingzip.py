@@ -0,0 +1,384 @@
+#
+# The Python Imaging Library.
+# $Id$
+#
+# PNG ("zip") codecs for the pure-Python core
+#
+# The decoder inflates the image stream incrementally, using a zlib
+# decompression object with a bounded output size, and unfilters and
+# unpacks one scanline at a time straight into the image memory, so
+# the decompressed stream is never held in full.
+#
+# The Up filter is undone with one big-integer operation per row, and
+# Sub with a running sum per byte position (itertools.accumulate).
+# Average and Paeth depend on the previous byte of the same row, and
+# are done byte by byte.
+#
+# See the README file for information on usage and redistribution.
+#
+
+import array
+import sys
+import zlib
+from itertools import accumulate
+
+from . import _imagingpack
+from ._imagingpure import _Codec
+
+_LE = sys.byteorder == "little"
+
+# largest amount of data inflated in one go
+_MAXOUT = 1 << 18
+
+# Adam7 passes: x0, y0, dx, dy
+_ADAM7 = (
+    (0, 0, 8, 8), (4, 0, 8, 8), (0, 4, 4, 8), (2, 0, 4, 4),
+    (0, 2, 2, 4), (1, 0, 2, 2), (0, 1, 1, 2),
+    )
+
+# --------------------------------------------------------------------
+# Scanline filters
+
+_MASKS = {}
+
+def _masks(size):
+    try:
+        return _MASKS[size]
+    except KeyError:
+        m = (int.from_bytes(b"\x7f" * size, "big"),
+             int.from_bytes(b"\x80" * size, "big"))
+        _MASKS[size] = m
+        return m
+
+def _add(x, y):
+    # bytewise (x + y) & 255 for two rows of the same length.  the low
+    # seven bits of each byte are added with room for the carry, and
+    # the top bits are combined without it.
+    m7, m8 = _masks(len(x))
+    a = int.from_bytes(x, "big")
+    b = int.from_bytes(y, "big")
+    return (((a & m7) + (b & m7)) ^ ((a ^ b) & m8)).to_bytes(len(x), "big")
+
+def _unsub(row, bpp):
+    # running sum over each byte position; the low byte of each sum
+    # is the reconstructed value
+    out = bytearray(len(row))
+    lo = 0 if _LE else 7
+    for j in range(bpp):
+        sums = array.array("Q", accumulate(row[j::bpp]))
+        out[j::bpp] = sums.tobytes()[lo::8]
+    return bytes(out)
+
+def _unaverage(row, prior, bpp):
+    out = bytearray(row)
+    for i in range(bpp):
+        out[i] = (out[i] + (prior[i] >> 1)) & 255
+    for i, b in zip(range(bpp, len(out)), prior[bpp:]):
+        out[i] = (out[i] + ((out[i-bpp] + b) >> 1)) & 255
+    return bytes(out)
+
+def _unpaeth(row, prior, bpp):
+    out = bytearray(_add(row[:bpp], prior[:bpp]) + row[bpp:])
+    for i, b, c in zip(range(bpp, len(out)), prior[bpp:], prior):
+        a = out[i-bpp]
+        pa = b - c
+        pb = a - c
+        pc = pa + pb
+        if pa < 0:
+            pa = -pa
+        if pb < 0:
+            pb = -pb
+        if pc < 0:
+            pc = -pc
+        if pa <= pb and pa <= pc:
+            out[i] = (out[i] + a) & 255
+        elif pb <= pc:
+            out[i] = (out[i] + b) & 255
+        else:
+            out[i] = (out[i] + c) & 255
+    return bytes(out)
+
+def unfilter(filter, row, prior, bpp):
+    # prior is None for the first row of an image (or pass)
+    if filter == 0:
+        return bytes(row)
+    elif filter == 1:
+        return _unsub(row, bpp)
+    elif filter == 2:
+        if prior is None:
+            return bytes(row)
+        return _add(row, prior)
+    elif filter == 3:
+        return _unaverage(row, prior or bytes(len(row)), bpp)
+    elif filter == 4:
+        if prior is None:
+            return _unsub(row, bpp) # Paeth predicts from the left
+        return _unpaeth(row, prior, bpp)
+    raise ValueError("unknown filter type %d" % filter)
+
+# --------------------------------------------------------------------
+# Decoder
+
+##
+# PNG image data decoder.  Consumes the concatenated contents of the
+# IDAT chunks.
+
+class ZipDecoder(_Codec):
+
+    def __init__(self, mode, rawmode=None, interlace=0):
+        _Codec.__init__(self, mode, rawmode)
+        self.interlace = interlace
+
+    def setup(self):
+        self.bits, self.unpack = _imagingpack.getunpacker(
+            self.im.mode, self.rawmode
+            )
+        self.bpp = max(self.bits // 8, 1) # filter byte distance
+        self.z = zlib.decompressobj()
+        self.data = bytearray()
+        if self.interlace:
+            # empty passes are left out of the stream
+            self.passes = [
+                p for p in _ADAM7 if p[0] < self.xsize and p[1] < self.ysize
+                ]
+        else:
+            self.passes = [(0, 0, 1, 1)]
+        self.done = 0
+        self.nextpass()
+
+    def nextpass(self):
+        if not self.passes:
+            self.done = 1
+            return
+        self.x0, self.py, self.dx, self.dy = self.passes.pop(0)
+        self.pixels = (self.xsize - self.x0 + self.dx - 1) // self.dx
+        self.rowbytes = (self.pixels * self.bits + 7) // 8
+        self.prior = None
+
+    def decode(self, data):
+        if self.im is None:
+            raise ValueError("decoder not initialized")
+        if self.done:
+            return -1, 0
+        try:
+            chunk = self.z.decompress(data, _MAXOUT)
+            while 1:
+                self.data += chunk
+                self.rows()
+                if self.done:
+                    return -1, 0
+                tail = self.z.unconsumed_tail
+                if not tail:
+                    break
+                chunk = self.z.decompress(tail, _MAXOUT)
+        except (zlib.error, ValueError):
+            return -1, -2 # broken stream or unknown filter
+        return len(data), 0
+
+    def rows(self):
+        # unfilter and store all complete scanlines
+        data = self.data
+        ptr = 0
+        while not self.done and len(data) - ptr > self.rowbytes:
+            row = unfilter(
+                data[ptr], data[ptr+1:ptr+1+self.rowbytes],
+                self.prior, self.bpp
+                )
+            ptr += 1 + self.rowbytes
+            self.store(row)
+            self.prior = row
+            self.py += self.dy
+            if self.py >= self.ysize:
+                self.nextpass()
+        del data[:ptr]
+
+    def store(self, row):
+        im = self.im
+        ps = im.pixelsize
+        line = self.unpack(row, self.pixels)
+        start = (self.yoff + self.py) * im.linesize + (self.xoff + self.x0) * ps
+        if self.dx == 1:
+            im.buffer[start:start+self.pixels*ps] = line
+        else:
+            # scatter the pass pixels into every dx'th image pixel
+            step = self.dx * ps
+            stop = start + (self.pixels - 1) * step + ps
+            for k in range(ps):
+                im.buffer[start+k:stop:step] = line[k::ps]
+
+# --------------------------------------------------------------------
+# Encoder
+
+FILTERS = ("none", "sub", "up", "average", "paeth", "adaptive")
+
+# absolute value of each byte, taken as a signed difference
+_ABS = bytes(min(i, 256 - i) for i in range(256))
+
+def _sub(x, y):
+    # bytewise (x - y) & 255 for two rows of the same length
+    m7, m8 = _masks(len(x))
+    a = int.from_bytes(x, "big")
+    b = int.from_bytes(y, "big")
+    d = ((a | m8) - (b & m7)) ^ ((a ^ b ^ m8) & m8)
+    return d.to_bytes(len(x), "big")
+
+def _average(x, y):
+    # bytewise (x + y) >> 1; the low bits are dropped before the
+    # shift, so no bit crosses into the next byte
+    m7, m8 = _masks(len(x))
+    a = int.from_bytes(x, "big")
+    b = int.from_bytes(y, "big")
+    return ((a & b) + (((a ^ b) & (m7 << 1)) >> 1)).to_bytes(len(x), "big")
+
+_LANES = {}
+
+def _lanes(size):
+    # constants for 16-bit lanes, one lane per byte of a row
+    try:
+        return _LANES[size]
+    except KeyError:
+        one = int.from_bytes(b"\1\0" * size, "little")
+        _LANES[size] = one, one * 0xffff
+        return _LANES[size]
+
+def _widen(data):
+    wide = bytearray(2 * len(data))
+    wide[0::2] = data
+    return int.from_bytes(wide, "little")
+
+def _abs(d, bias, bit, one, full):
+    # |d - bias| for lanes holding d (biased to be positive)
+    ge = (d >> bit) & one
+    m = ge * 0xffff
+    n = full ^ m
+    return ((d & m) - (bias & m)) + ((bias & n) - (d & n))
+
+def _paeth(row, prior, bpp):
+    # Paeth predictor for a whole row, computed in 16-bit lanes: the
+    # distances and comparisons all fit in a lane, so every byte is
+    # handled at once
+    size = len(row)
+    one, full = _lanes(size)
+    shift = 16 * bpp
+    b = _widen(prior)
+    a = (_widen(row) << shift) & full
+    c = (b << shift) & full
+    pa = _abs(b + 256*one - c, 256*one, 8, one, full)
+    pb = _abs(a + 256*one - c, 256*one, 8, one, full)
+    pc = _abs(a + b + 512*one - c - c, 512*one, 9, one, full)
+    ab = ((pb + 1024*one - pa) >> 10) & one # pa <= pb
+    ac = ((pc + 1024*one - pa) >> 10) & one # pa <= pc
+    bc = ((pc + 1024*one - pb) >> 10) & one # pb <= pc
+    sa = ab & ac
+    sb = (one ^ sa) & bc
+    sc = one ^ sa ^ sb
+    pred = (a & sa*0xffff) | (b & sb*0xffff) | (c & sc*0xffff)
+    return _sub(row, pred.to_bytes(2 * size, "little")[0::2])
+
+def applyfilter(filter, row, prior, bpp):
+    # apply a scanline filter (0-4) to a row
+    if filter == 0:
+        return row
+    left = bytes(bpp) + row[:-bpp]
+    if filter == 1:
+        return _sub(row, left)
+    elif filter == 2:
+        return _sub(row, prior)
+    elif filter == 3:
+        return _sub(row, _average(left, prior))
+    elif filter == 4:
+        return _paeth(row, prior, bpp)
+    raise ValueError("unknown filter type %d" % filter)
+
+##
+# PNG image data encoder.  Produces the zlib stream for the IDAT
+# chunks, one filtered scanline at a time.
+
+class ZipEncoder(_Codec):
+
+    def __init__(self, mode, rawmode=None, optimize=0, dictionary=b"",
+                 compress_level=-1, filter_strategy=None):
+        _Codec.__init__(self, mode, rawmode)
+        if compress_level is None or compress_level < 0:
+            compress_level = 9 if optimize else 6
+        if filter_strategy is not None and filter_strategy not in FILTERS:
+            raise ValueError("unknown filter strategy %r" % filter_strategy)
+        self.compress_level = compress_level
+        self.filter_strategy = filter_strategy
+        self.dictionary = dictionary
+
+    def setup(self):
+        self.bits, self.pack = _imagingpack.getpacker(
+            self.im.mode, self.rawmode
+            )
+        self.bpp = max(self.bits // 8, 1)
+        self.rowbytes = (self.xsize * self.bits + 7) // 8
+        strategy = self.filter_strategy
+        if strategy is None:
+            # the PNG specification recommends no filtering for
+            # palette images and bit depths below 8
+            if self.bits < 8 or self.im.mode in ("1", "P"):
+                strategy = "none"
+            else:
+                strategy = "adaptive"
+        if strategy == "adaptive":
+            self.filters = (0, 1, 2, 3, 4)
+        else:
+            self.filters = (FILTERS.index(strategy),)
+        if self.dictionary:
+            self.z = zlib.compressobj(
+                self.compress_level, zlib.DEFLATED, 15, 9,
+                zlib.Z_DEFAULT_STRATEGY, self.dictionary
+                )
+        else:
+            self.z = zlib.compressobj(self.compress_level)
+        self.prior = bytes(self.rowbytes)
+        self.done = 0
+
+    def filterrow(self, row):
+        # pick the filter giving the smallest sum of absolute
+        # differences (the heuristic suggested by the PNG spec)
+        best = None
+        for f in self.filters:
+            data = applyfilter(f, row, self.prior, self.bpp)
+            if len(self.filters) == 1:
+                return f, data
+            score = sum(data.translate(_ABS))
+            if best is None or score < best[0]:
+                best = score, f, data
+                if not score:
+                    break
+        return best[1], best[2]
+
+    def encode(self, bufsize):
+        if self.im is None:
+            raise ValueError("encoder not initialized")
+        if self.done:
+            return 0, 1, b""
+        out = []
+        size = 0
+        buffer = self.im.buffer
+        while size < bufsize:
+            start, stop = self._line(self.y)
+            row = bytes(self.pack(buffer[start:stop], self.xsize))
+            f, data = self.filterrow(row)
+            self.prior = row
+            data = self.z.compress(bytes((f,)) + data)
+            if data:
+                out.append(data)
+                size += len(data)
+            self.y += 1
+            if self.y >= self.ysize:
+                out.append(self.z.flush())
+                self.done = 1
+                break
+        data = b"".join(out)
+        return len(data), self.done, data
+
+    def encode_to_file(self, fh, bufsize):
+        import os
+        while 1:
+            l, s, d = self.encode(bufsize)
+            os.write(fh, d)
+            if s:
+                return s
@@ -0,0 +1,35 @@
+import io
+import os
+import struct
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PIL import Image
+
+
+def fli(frames):
+    # FLC header and empty frames, without any image data chunks
+    header = struct.pack("<IHHHHHH", 0, 0xAF12, frames, 8, 6, 8, 0)
+    header += bytes(128 - len(header))
+    frame = struct.pack("<IHH8x", 16, 0xF1FA, 0)
+    return header + frame * frames
+
+
+def test_seek():
+    # frames can be stepped through without decoding them
+    im = Image.open(io.BytesIO(fli(3)))
+    assert im.format == "FLI"
+    assert im.size == (8, 6)
+    im.seek(1)
+    assert im.tell() == 1
+    assert im.tile[0][2] == 128 + 16
+    im.seek(2)
+    assert im.tile[0][2] == 128 + 32
+    with pytest.raises(EOFError):
+        im.seek(3)
+    im.seek(0)
+    assert im.tell() == 0
+    assert im.tile[0][2] == 128
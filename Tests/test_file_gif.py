@@ -0,0 +1,203 @@
+import io
+import os
+import random
+import struct
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PIL import Image
+
+
+def test_bilevel_palette():
+    im = Image.new("1", (20, 20))
+    im.paste(1, (0, 0, 10, 20))
+    fp = io.BytesIO()
+    im.save(fp, "GIF")
+    data = fp.getvalue()
+    # global palette with two entries, black and white
+    assert data[10] == 128
+    assert data[13:19] == b"\0\0\0\xff\xff\xff"
+    fp.seek(0)
+    assert Image.open(fp).convert("1").tobytes() == im.tobytes()
+
+
+def lzw(data, bits, reset=True):
+    # reference LZW encoder.  when the table is full, either start
+    # over with a clear code, or keep using the full table.
+    clear = 1 << bits
+    codes = []
+    def start(size):
+        codes.append((clear, size))
+        return dict((bytes((i,)), i) for i in range(clear)), clear + 2, bits + 1
+    table, next, size = start(bits + 1)
+    w = b""
+    for c in data:
+        wc = w + bytes((c,))
+        if wc in table:
+            w = wc
+            continue
+        codes.append((table[w], size))
+        if next < 4096:
+            table[wc] = next
+            if next == 1 << size:
+                size = size + 1
+            next = next + 1
+        elif reset:
+            table, next, size = start(size)
+        w = bytes((c,))
+    codes.append((table[w], size))
+    codes.append((clear + 1, size))
+    # pack the codes, least significant bit first
+    acc = count = 0
+    out = bytearray()
+    for code, size in codes:
+        acc = acc | (code << count)
+        count = count + size
+        while count >= 8:
+            out.append(acc & 255)
+            acc = acc >> 8
+            count = count - 8
+    if count:
+        out.append(acc)
+    return bytes(out)
+
+
+def blocks(data):
+    # split into sub-blocks, followed by the block terminator
+    out = b""
+    for i in range(0, len(data), 255):
+        out = out + bytes((len(data[i:i+255]),)) + data[i:i+255]
+    return out + b"\0"
+
+
+def interlaced(data, width):
+    rows = [data[y:y+width] for y in range(0, len(data), width)]
+    order = []
+    for y0, dy in ((0, 8), (4, 8), (2, 4), (1, 2)):
+        order.extend(range(y0, len(rows), dy))
+    return b"".join([rows[y] for y in order])
+
+
+def gif(size, frames, bits=8):
+    # frames are (x, y, width, height, data, interlace, reset) tuples
+    palette = [i * 255 // ((1 << bits) - 1) for i in range(1 << bits)]
+    out = (b"GIF89a" + struct.pack("<HHBBB", size[0], size[1],
+                                   128 | (bits - 1), 0, 0) +
+           b"".join([bytes((c, 255 - c, 0)) for c in palette]))
+    for x, y, width, height, data, interlace, reset in frames:
+        if interlace:
+            data = interlaced(data, width)
+        out = (out + b"," +
+               struct.pack("<HHHHB", x, y, width, height, interlace and 64) +
+               bytes((max(bits, 2),)) + blocks(lzw(data, max(bits, 2), reset)))
+    return out + b";"
+
+
+def noise(size, bits, seed=0):
+    rng = random.Random(seed)
+    return bytes(rng.randrange(1 << bits) for i in range(size))
+
+
+@pytest.mark.parametrize("bits", [1, 2, 4, 8])
+@pytest.mark.parametrize("interlace", [0, 1])
+def test_decode(bits, interlace):
+    data = noise(37 * 23, bits)
+    im = Image.open(io.BytesIO(gif((37, 23), [
+        (0, 0, 37, 23, data, interlace, True)
+        ], bits)))
+    assert im.mode == "P"
+    assert im.tobytes() == data
+
+
+@pytest.mark.parametrize("reset", [True, False])
+def test_decode_full_table(reset):
+    # enough noise to fill the string table several times over
+    data = noise(200 * 100, 8, 1)
+    im = Image.open(io.BytesIO(gif((200, 100), [
+        (0, 0, 200, 100, data, 0, reset)
+        ])))
+    assert im.tobytes() == data
+
+
+def test_decode_runs():
+    # long runs use the code that is being defined (KwKwK)
+    data = bytes([3] * 1000 + [5, 3] * 500 + [7] * 1000)
+    im = Image.open(io.BytesIO(gif((100, 30), [
+        (0, 0, 100, 30, data, 1, True)
+        ], 4)))
+    assert im.tobytes() == data
+
+
+def test_decode_partial_frame():
+    first = noise(16 * 12, 4, 2)
+    patch = noise(5 * 9, 4, 3)
+    im = Image.open(io.BytesIO(gif((16, 12), [
+        (0, 0, 16, 12, first, 0, True),
+        (3, 2, 5, 9, patch, 1, True),
+        ], 4)))
+    assert im.tobytes() == first
+    im.seek(1)
+    expected = bytearray(first)
+    for y in range(9):
+        expected[(y + 2) * 16 + 3:(y + 2) * 16 + 8] = patch[y * 5:y * 5 + 5]
+    assert im.tobytes() == bytes(expected)
+
+
+def roundtrip(im, **options):
+    fp = io.BytesIO()
+    im.save(fp, "GIF", **options)
+    data = fp.getvalue()
+    return data, Image.open(io.BytesIO(data))
+
+
+def test_save_exact_palette():
+    # few colours: the palette holds exactly those, in 2 bits
+    colors = [(255, 0, 0), (0, 128, 255), (12, 34, 56)]
+    im = Image.new("RGB", (30, 20))
+    for i, color in enumerate(colors):
+        im.paste(color, (i * 10, 0, i * 10 + 10, 20))
+    data, out = roundtrip(im)
+    assert data[10] & 7 == 1
+    assert out.mode == "P"
+    assert out.convert("RGB").tobytes() == im.tobytes()
+    palette = data[13:13 + 12]
+    assert sorted(palette[i:i+3] for i in range(0, 9, 3)) == \
+           sorted(bytes(c) for c in colors)
+
+
+@pytest.mark.parametrize("interlace", [0, 1])
+def test_save_noise(interlace):
+    # enough noise to fill the string table several times over
+    data = noise(200 * 150, 8, 4)
+    im = Image.frombytes("P", (200, 150), data)
+    im.putpalette(bytes((i, 255 - i, i // 2)[b] for i in range(256)
+                        for b in range(3)))
+    gif, out = roundtrip(im, interlace=interlace)
+    flags = gif[13 + 768 + 9]
+    assert flags & 64 == interlace * 64
+    assert out.tobytes() == data
+    # the string table keeps the file close to the uncompressed size
+    assert len(gif) < len(data) * 1.5
+
+
+def test_save_blocky():
+    # pixelized images compress well
+    im = Image.new("RGB", (256, 256))
+    for y in range(0, 256, 16):
+        for x in range(0, 256, 16):
+            im.paste((x, y, x ^ y), (x, y, x + 16, y + 16))
+    data, out = roundtrip(im)
+    assert out.convert("RGB").tobytes() == im.tobytes()
+    assert len(data) < 256 * 256 // 3
+
+
+def test_save_grey():
+    data = bytes(range(80)) * 20
+    im = Image.frombytes("L", (80, 20), data)
+    gif, out = roundtrip(im)
+    # grey levels up to 79 need a 128 entry palette
+    assert gif[10] & 7 == 6
+    assert out.convert("L").tobytes() == data
@@ -0,0 +1,26 @@
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PIL import Image
+
+
+def im_rgb(width, height, data):
+    # IM files store RGB images line interleaved, bottom-up
+    header = b"Image type: RGB image\r\nImage size (x*y): %d*%d\r\n" % (
+        width, height)
+    lines = []
+    for y in reversed(range(height)):
+        line = data[y*width*3:(y+1)*width*3]
+        lines.append(line[0::3] + line[1::3] + line[2::3])
+    return header + bytes(511 - len(header)) + b"\x1a" + b"".join(lines)
+
+
+def test_rgb():
+    data = bytes(range(7 * 4 * 3))
+    im = Image.open(io.BytesIO(im_rgb(7, 4, data)))
+    assert im.mode == "RGB"
+    assert im.size == (7, 4)
+    assert im.tobytes() == data
@@ -0,0 +1,199 @@
+import io
+import os
+import random
+import struct
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PIL import Image
+
+
+def marker(code, data):
+    return struct.pack(">BBH", 255, code, len(data) + 2) + data
+
+
+def flat(levels, progressive=0):
+    # greyscale JPEG of flat 8x8 blocks, with the given levels, one
+    # row of blocks per list.  the quantization table is all ones, so
+    # the DC coefficient is exactly 8 * (level - 128).
+    height, width = len(levels) * 8, len(levels[0]) * 8
+    bits = []
+    prev = 0
+    for row in levels:
+        for level in row:
+            dc = 8 * (level - 128)
+            diff, prev = dc - prev, dc
+            size = abs(diff).bit_length()
+            bits.append(format(size, "04b")) # 4-bit code per category
+            if size:
+                if diff < 0:
+                    diff = diff + (1 << size) - 1
+                bits.append(format(diff, "0%db" % size))
+            if not progressive:
+                bits.append("0") # end of block
+    bits = "".join(bits)
+    bits = bits + "1" * (-len(bits) % 8)
+    scan = bytes(int(bits[i:i+8], 2) for i in range(0, len(bits), 8))
+    scan = scan.replace(b"\xff", b"\xff\0")
+    dc = bytes([0] * 3 + [12] + [0] * 12) + bytes(range(12))
+    ac = bytes([1] + [0] * 15) + b"\0"
+    return (b"\xff\xd8" +
+            marker(0xdb, b"\0" + b"\1" * 64) +
+            marker(0xc2 if progressive else 0xc0,
+                   struct.pack(">BHHBBBB", 8, height, width, 1, 1, 0x11, 0)) +
+            marker(0xc4, b"\x00" + dc + b"\x10" + ac) +
+            marker(0xda, bytes((1, 1, 0, 0, 0 if progressive else 63, 0))) +
+            scan + b"\xff\xd9")
+
+
+LEVELS = [[0, 40, 128, 255], [17, 200, 99, 128], [255, 1, 64, 250]]
+
+
+def expand(levels, n):
+    # one n x n square per level
+    return b"".join(bytes(level for level in row for x in range(n)) * n
+                    for row in levels)
+
+
+@pytest.mark.parametrize("progressive", [0, 1])
+def test_decode_flat(progressive):
+    im = Image.open(io.BytesIO(flat(LEVELS, progressive)))
+    assert (im.mode, im.size) == ("L", (32, 24))
+    assert im.tobytes() == expand(LEVELS, 8)
+
+
+@pytest.mark.parametrize("progressive", [0, 1])
+@pytest.mark.parametrize("scale", [1, 2, 4, 8])
+def test_draft_flat(scale, progressive):
+    im = Image.open(io.BytesIO(flat(LEVELS, progressive)))
+    im.draft("L", (32 // scale, 24 // scale))
+    assert im.size == (32 // scale, 24 // scale)
+    assert im.tobytes() == expand(LEVELS, 8 // scale)
+
+
+def test_draft_sizes():
+    # the largest scale that still covers the requested size
+    for size, expected in [((40, 24), (40, 24)), ((20, 12), (20, 12)),
+                           ((15, 9), (20, 12)), ((11, 6), (10, 6)),
+                           ((5, 3), (5, 3)), ((1, 1), (5, 3))]:
+        im = Image.open(io.BytesIO(flat([[128] * 5] * 3)))
+        im.draft("L", size)
+        assert im.size == expected
+        assert im.tobytes() == b"\x80" * (expected[0] * expected[1])
+
+
+def test_draft_block_average():
+    # at 1/8 scale, each pixel is (about) the average of its block
+    rng = random.Random(0)
+    im = Image.frombytes("L", (40, 32), bytes(
+        rng.randrange(100, 156) for i in range(40 * 32)))
+    fp = io.BytesIO()
+    im.save(fp, "JPEG", quality=95)
+    full = Image.open(io.BytesIO(fp.getvalue()))
+    full.load()
+    draft = Image.open(io.BytesIO(fp.getvalue()))
+    draft.draft("L", (5, 4))
+    assert draft.size == (5, 4)
+    data = full.tobytes()
+    for y in range(4):
+        for x in range(5):
+            block = [data[(y * 8 + j) * 40 + x * 8 + i]
+                     for j in range(8) for i in range(8)]
+            assert abs(draft.getpixel((x, y)) - sum(block) / 64.0) < 1.5
+
+
+def segments(data):
+    # get the (marker, data) pairs up to the start of scan
+    pos = 2
+    out = {}
+    while 1:
+        code, size = struct.unpack(">xBH", data[pos:pos+4])
+        out.setdefault(code, []).append(data[pos+4:pos+2+size])
+        if code == 0xda:
+            return out
+        pos = pos + 2 + size
+
+
+def save(im, **options):
+    fp = io.BytesIO()
+    im.save(fp, "JPEG", **options)
+    return fp.getvalue()
+
+
+def gradient(size=(48, 40)):
+    w, h = size
+    return Image.frombytes("RGB", size, bytes(
+        (x * 200 // w + y * 50 // h, y * 250 // h,
+         255 - x * 150 // w - y * 100 // h)[b]
+        for y in range(h) for x in range(w) for b in range(3)))
+
+
+def error(a, b):
+    diff = [abs(x - y) for x, y in zip(a.tobytes(), b.tobytes())]
+    return max(diff), sum(diff) / float(len(diff))
+
+
+@pytest.mark.parametrize("subsampling, factors", [
+    (None, 0x22), ("4:2:0", 0x22), ("4:2:2", 0x21), ("4:4:4", 0x11),
+    (2, 0x22), (0, 0x11),
+    ])
+def test_save_subsampling(subsampling, factors):
+    im = gradient()
+    options = {}
+    if subsampling is not None:
+        options["subsampling"] = subsampling
+    data = save(im, quality=90, **options)
+    sof = segments(data)[0xc0][0]
+    assert sof[5] == 3
+    assert [sof[7], sof[10], sof[13]] == [factors, 0x11, 0x11]
+    out = Image.open(io.BytesIO(data))
+    assert (out.mode, out.size) == ("RGB", im.size)
+    worst, mean = error(out, im)
+    assert worst < 32 and mean < 3
+
+
+def test_save_grey():
+    im = gradient().convert("L")
+    data = save(im, quality=90)
+    assert segments(data)[0xc0][0][5] == 1
+    worst, mean = error(Image.open(io.BytesIO(data)), im)
+    assert worst < 16 and mean < 2
+
+
+def test_save_quality():
+    im = gradient()
+    # quality 50 uses the example tables from the JPEG standard
+    tables = segments(save(im, quality=50))[0xdb]
+    tables = b"".join(tables)
+    assert tables[:9] == b"\0" + bytes((16, 11, 12, 14, 12, 10, 16, 14))
+    low, high = save(im, quality=20), save(im, quality=95)
+    assert len(low) < len(high)
+    assert (error(Image.open(io.BytesIO(high)), im)[1] <
+            error(Image.open(io.BytesIO(low)), im)[1])
+
+
+def test_save_optimize():
+    # optimized Huffman tables change the size, but not the pixels
+    im = gradient((80, 64))
+    plain, optimized = save(im), save(im, optimize=1)
+    assert len(optimized) < len(plain)
+    assert (Image.open(io.BytesIO(optimized)).tobytes() ==
+            Image.open(io.BytesIO(plain)).tobytes())
+
+
+def test_save_blocks():
+    # flat 8x8 blocks survive (almost) unchanged
+    levels = [[0, 40, 128, 255], [17, 200, 99, 128]]
+    im = Image.frombytes("L", (32, 16), expand(levels, 8))
+    worst, mean = error(Image.open(io.BytesIO(save(im, quality=90))), im)
+    assert worst <= 1
+
+
+def test_save_errors():
+    with pytest.raises(IOError):
+        save(Image.new("P", (8, 8)))
+    with pytest.raises(ValueError):
+        save(gradient(), subsampling="4:3:0")
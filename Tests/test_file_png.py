@@ -0,0 +1,103 @@
+import io
+import os
+import struct
+import sys
+import zlib
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PIL import Image
+
+
+def chunk(cid, data):
+    crc = zlib.crc32(cid + data)
+    return struct.pack(">I", len(data)) + cid + data + struct.pack(">I", crc)
+
+
+def png(size, depth, colortype, rows, *chunks):
+    header = struct.pack(">IIBBBBB", size[0], size[1], depth, colortype, 0, 0, 0)
+    data = zlib.compress(b"".join([b"\0" + row for row in rows]))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + b"".join(chunks)
+            + chunk(b"IDAT", data) + chunk(b"IEND", b""))
+
+
+def test_grey_2bit_transparency():
+    # the tRNS value is the raw sample value; the pixels are scaled
+    data = png((4, 1), 2, 0, [b"\x1b"], chunk(b"tRNS", b"\0\1"))
+    im = Image.open(io.BytesIO(data))
+    assert im.mode == "L"
+    assert im.info["transparency"] == 1
+    assert im.tobytes() == bytes((0, 85, 170, 255))
+
+
+def chunks(data):
+    # split a PNG file into (chunk id, data) pairs
+    pos = 8
+    while pos < len(data):
+        size, cid = struct.unpack(">I4s", data[pos:pos+8])
+        yield cid, data[pos+8:pos+8+size]
+        pos = pos + size + 12
+
+
+def save(im, **options):
+    out = io.BytesIO()
+    im.save(out, "PNG", **options)
+    return out.getvalue()
+
+
+def idat(data):
+    return zlib.decompress(b"".join([d for c, d in chunks(data) if c == b"IDAT"]))
+
+
+def gradient(mode, size=(19, 11)):
+    bands = len(mode)
+    return Image.frombytes(mode, size, bytes(
+        (x * 13 + y * 7 + b * 50) & 255
+        for y in range(size[1]) for x in range(size[0]) for b in range(bands)))
+
+
+@pytest.mark.parametrize("strategy",
+                         ["none", "sub", "up", "average", "paeth", "adaptive"])
+@pytest.mark.parametrize("mode", ["L", "LA", "RGB", "RGBA"])
+def test_filter_strategy(mode, strategy):
+    im = gradient(mode)
+    data = save(im, filter_strategy=strategy)
+    assert Image.open(io.BytesIO(data)).tobytes() == im.tobytes()
+    stride = im.size[0] * len(mode) + 1
+    filters = set(idat(data)[::stride])
+    if strategy == "adaptive":
+        assert filters <= set(range(5))
+    else:
+        assert filters == {["none", "sub", "up", "average", "paeth"].index(strategy)}
+
+
+def test_filter_strategy_default():
+    # no filtering for palette images, adaptive for the others
+    im = gradient("L")
+    assert set(idat(save(im.convert("P")))[::20]) == {0}
+    assert set(idat(save(im))[::20]) - {0}
+    with pytest.raises(ValueError):
+        save(im, filter_strategy="median")
+
+
+def test_compress_level():
+    im = gradient("RGB")
+    sizes = []
+    for level in (0, 1, 6, 9):
+        data = save(im, compress_level=level)
+        assert Image.open(io.BytesIO(data)).tobytes() == im.tobytes()
+        sizes.append(len(data))
+    # level 0 stores the filtered data uncompressed
+    assert sizes[0] > len(im.tobytes()) > sizes[-1]
+
+
+def test_idat_size():
+    im = gradient("RGB", (64, 64))
+    data = save(im, idat_size=100, compress_level=0)
+    sizes = [len(d) for c, d in chunks(data) if c == b"IDAT"]
+    assert len(sizes) > 2
+    assert set(sizes[:-1]) == {100} and 0 < sizes[-1] <= 100
+    assert [c for c, d in chunks(data)][-1] == b"IEND"
+    assert Image.open(io.BytesIO(data)).tobytes() == im.tobytes()
@@ -0,0 +1,24 @@
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PIL import Image
+
+
+def test_16bit_full_range():
+    im = Image.open(io.BytesIO(b"P6\n1 1\n65535\n" + b"\xff\xff" * 3))
+    assert im.getpixel((0, 0)) == (255, 255, 255)
+    im = Image.open(io.BytesIO(b"P5\n1 1\n65535\n\x12\x34"))
+    assert im.mode == "I"
+    assert im.getpixel((0, 0)) == 0x1234
+
+
+def test_16bit_other_maxval():
+    # samples would need scaling; such files are not supported
+    data = b"P6\n1 1\n999\n" + (999).to_bytes(2, "big") * 3
+    with pytest.raises(IOError):
+        Image.open(io.BytesIO(data))
@@ -0,0 +1,39 @@
+import io
+import os
+import struct
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PIL import Image
+
+
+def sgi(mode, size, data):
+    # uncompressed SGI file: one plane per band, bottom-up
+    width, height = size
+    bands = len(mode)
+    header = struct.pack(">HBBHHHH", 474, 0, 1, 3 if bands > 1 else 2,
+                         width, height, bands)
+    planes = []
+    for band in range(bands):
+        plane = data[band::bands]
+        planes.extend([
+            plane[y*width:(y+1)*width] for y in reversed(range(height))
+            ])
+    return header + bytes(512 - len(header)) + b"".join(planes)
+
+
+def test_uncompressed_rgb():
+    size = 5, 3
+    data = bytes(range(5 * 3 * 3))
+    im = Image.open(io.BytesIO(sgi("RGB", size, data)))
+    assert im.mode == "RGB"
+    assert im.tobytes() == data
+
+
+def test_uncompressed_rgba():
+    size = 4, 2
+    data = bytes(range(100, 100 + 4 * 2 * 4))
+    im = Image.open(io.BytesIO(sgi("RGBA", size, data)))
+    assert im.mode == "RGBA"
+    assert im.tobytes() == data
@@ -0,0 +1,236 @@
+import io
+import os
+import random
+import struct
+import sys
+import zlib
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PIL import Image, TiffImagePlugin
+
+
+def tiff(xmp):
+    # 4x4 greyscale image with an XMP tag too large for its directory
+    # entry, so its value is read from the file on demand
+    entries = [
+        (256, 3, 1, 4), # ImageWidth
+        (257, 3, 1, 4), # ImageLength
+        (258, 3, 1, 8), # BitsPerSample
+        (259, 3, 1, 1), # Compression
+        (262, 3, 1, 1), # PhotometricInterpretation
+        (273, 4, 1, 0), # StripOffsets, set below
+        (278, 3, 1, 4), # RowsPerStrip
+        (279, 4, 1, 16), # StripByteCounts
+        (700, 7, len(xmp), 0), # XMP, set below
+        ]
+    ifd = 8
+    data = ifd + 2 + len(entries) * 12 + 4
+    pixels = bytes(range(0, 256, 16))
+    values = {273: data + len(xmp), 700: data}
+    out = [b"II*\0", struct.pack("<I", ifd), struct.pack("<H", len(entries))]
+    for tag, typ, count, value in entries:
+        value = values.get(tag, value)
+        if typ == 3:
+            out.append(struct.pack("<HHIHH", tag, typ, count, value, 0))
+        else:
+            out.append(struct.pack("<HHII", tag, typ, count, value))
+    out.append(struct.pack("<I", 0))
+    return b"".join(out) + xmp + pixels
+
+
+def test_lazy_tag_after_load_and_close():
+    xmp = b"<x:xmpmeta>" + b"x" * 89
+    f = io.BytesIO(tiff(xmp))
+    im = Image.open(f)
+    assert 700 in im.tag.tagref # not read yet
+    im.load()
+    f.close()
+    assert im.tag[700] == xmp
+    assert im.tag.fp is None
+    assert im.getpixel((1, 0)) == 16
+
+
+def test_lazy_tag_before_load():
+    xmp = b"y" * 100
+    f = io.BytesIO(tiff(xmp))
+    im = Image.open(f)
+    assert im.tag[700] == xmp
+    im.load()
+    assert im.tobytes() == bytes(range(0, 256, 16))
+
+
+def test_palette_roundtrip():
+    # the colour map is written line interleaved ("RGB;L")
+    im = Image.new("P", (3, 2))
+    im.putpalette(bytes(range(256)) * 3)
+    im.putpixel((1, 0), 5)
+    f = io.BytesIO()
+    im.save(f, "TIFF")
+    f.seek(0)
+    out = Image.open(f)
+    assert out.mode == "P"
+    assert out.getpixel((1, 0)) == 5
+    assert out.getpalette() == im.getpalette()
+
+
+def compressed(compression, predictor, strip, width, height):
+    # greyscale image in a single compressed strip
+    entries = [
+        (256, 3, 1, width), # ImageWidth
+        (257, 3, 1, height), # ImageLength
+        (258, 3, 1, 8), # BitsPerSample
+        (259, 3, 1, compression), # Compression
+        (262, 3, 1, 1), # PhotometricInterpretation
+        (273, 4, 1, 8 + 2 + 9 * 12 + 4), # StripOffsets
+        (278, 3, 1, height), # RowsPerStrip
+        (279, 4, 1, len(strip)), # StripByteCounts
+        (317, 3, 1, predictor), # Predictor
+        ]
+    out = [b"II*\0", struct.pack("<IH", 8, len(entries))]
+    for tag, typ, count, value in entries:
+        if typ == 3:
+            out.append(struct.pack("<HHIHH", tag, typ, count, value, 0))
+        else:
+            out.append(struct.pack("<HHII", tag, typ, count, value))
+    out.append(struct.pack("<I", 0))
+    return b"".join(out) + strip
+
+
+def test_predictor():
+    rows = b"\x0a\x01\x01\x01" * 2
+    # horizontal differencing is undone for deflate
+    im = Image.open(io.BytesIO(compressed(8, 2, zlib.compress(rows), 4, 2)))
+    assert im.tobytes() == b"\x0a\x0b\x0c\x0d" * 2
+    # but not for packbits, which ignores the predictor (like libtiff)
+    strip = b"\x07" + rows # one literal run
+    im = Image.open(io.BytesIO(compressed(32773, 2, strip, 4, 2)))
+    assert im.tobytes() == rows
+
+
+def pages(*images):
+    # TIFF file with one page per (mode, size, rowsperstrip, compression,
+    # pixels) tuple; compression is 1 (none) or 8 (deflate)
+    out = bytearray(b"II*\0\0\0\0\0")
+    link = 4
+    for mode, size, rowsperstrip, compression, pixels in images:
+        bands = len(mode)
+        stride = size[0] * bands
+        offsets, counts = [], []
+        for y in range(0, size[1], rowsperstrip):
+            strip = pixels[y * stride:(y + rowsperstrip) * stride]
+            if compression == 8:
+                strip = zlib.compress(strip)
+            offsets.append(len(out))
+            counts.append(len(strip))
+            out += strip + b"\0" * (len(strip) & 1)
+        entries = [
+            (256, 3, [size[0]]), # ImageWidth
+            (257, 3, [size[1]]), # ImageLength
+            (258, 3, [8] * bands), # BitsPerSample
+            (259, 3, [compression]), # Compression
+            (262, 3, [2 if bands == 3 else 1]), # PhotometricInterpretation
+            (273, 4, offsets), # StripOffsets
+            (277, 3, [bands]), # SamplesPerPixel
+            (278, 3, [rowsperstrip]), # RowsPerStrip
+            (279, 4, counts), # StripByteCounts
+            ]
+        ifd = bytearray(struct.pack("<H", len(entries)))
+        for tag, typ, values in entries:
+            data = struct.pack("<%d%s" % (len(values), "HI"[typ == 4]), *values)
+            if len(data) <= 4:
+                value = data + b"\0" * (4 - len(data))
+            else:
+                value = struct.pack("<I", len(out))
+                out += data
+            ifd += struct.pack("<HHI", tag, typ, len(values)) + value
+        out[link:link+4] = struct.pack("<I", len(out))
+        link = len(out) + len(ifd)
+        out += ifd + b"\0\0\0\0"
+    return bytes(out)
+
+
+def noise(size, seed=0):
+    rng = random.Random(seed)
+    return bytes(rng.randrange(256) for i in range(size))
+
+
+@pytest.mark.parametrize("threads", [None, 0, 1, 4])
+def test_threaded_strips(threads):
+    # 16 strips of 3 lines; the last one is partial
+    pixels = noise(29 * 47 * 3)
+    data = pages(("RGB", (29, 47), 3, 8, pixels))
+    im = Image.open(io.BytesIO(data))
+    im.decoderthreads = threads
+    im.load()
+    assert im.tobytes() == pixels
+
+
+def test_threaded_strips_used(monkeypatch):
+    calls = []
+    load = TiffImagePlugin.TiffImageFile._load_threaded
+    def spy(self, threads, bytecounts):
+        calls.append(threads)
+        return load(self, threads, bytecounts)
+    monkeypatch.setattr(TiffImagePlugin.TiffImageFile, "_load_threaded", spy)
+    pixels = noise(16 * 64, 1)
+    for compression in (1, 8):
+        im = Image.open(io.BytesIO(pages(("L", (16, 64), 4, compression, pixels))))
+        im.decoderthreads = 4
+        assert im.tobytes() == pixels
+    # only deflate compressed strips are decoded in parallel
+    assert calls == [4]
+
+
+def test_threaded_strips_error():
+    data = bytearray(pages(("L", (16, 64), 4, 8, noise(16 * 64, 2))))
+    data[200:210] = b"\xff" * 10 # inside one of the strips
+    im = Image.open(io.BytesIO(bytes(data)))
+    im.decoderthreads = 4
+    with pytest.raises(IOError):
+        im.load()
+
+
+class CountingFile(io.BytesIO):
+    # count the bytes read from the file
+    count = 0
+    def read(self, size=-1):
+        data = io.BytesIO.read(self, size)
+        self.count = self.count + len(data)
+        return data
+
+
+def test_seek_pages():
+    images = [
+        ("L", (8, 6), 2, 1, noise(8 * 6, 3)),
+        ("RGB", (5, 9), 4, 8, noise(5 * 9 * 3, 4)),
+        ("L", (7, 7), 7, 8, noise(7 * 7, 5)),
+        ]
+    im = Image.open(io.BytesIO(pages(*images)))
+    for frame in (2, 0, 1, 1, 2):
+        im.seek(frame)
+        mode, size, rowsperstrip, compression, pixels = images[frame]
+        assert im.tell() == frame
+        assert (im.mode, im.size) == (mode, size)
+        assert im.tobytes() == pixels
+    with pytest.raises(EOFError):
+        im.seek(3)
+    assert im.frameindex.frames == 3
+    with pytest.raises(EOFError):
+        im.seek(5)
+
+
+def test_seek_pages_index():
+    # once the pages are indexed, seeking reads only that directory
+    images = [("L", (4, 4), 4, 1, noise(16, i)) for i in range(20)]
+    f = CountingFile(pages(*images))
+    im = Image.open(f)
+    im.seek(19)
+    assert len(im.frameindex.offsets) == 20
+    f.count = 0
+    im.seek(10)
+    assert im.size == (4, 4)
+    assert f.count < 200
+    assert im.tobytes() == images[10][4]
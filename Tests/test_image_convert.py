@@ -0,0 +1,27 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PIL import Image
+
+
+def test_rgb_to_la_and_i():
+    im = Image.new("RGB", (2, 2), (10, 20, 30))
+    grey = im.convert("L").getpixel((0, 0))
+    assert im.convert("LA").getpixel((0, 0)) == (grey, 255)
+    assert im.convert("I").getpixel((0, 0)) == grey
+    assert im.convert("RGBA").convert("I").getpixel((0, 0)) == grey
+
+
+def test_palette_modes():
+    im = Image.new("P", (1, 1))
+    im.putpalette(bytes(range(256)) * 3)
+    assert im.im.getpalette("RGB", "RGB;L")[:2] == b"\0\3"
+    assert im.im.getpalette("RGB", "RGB;L")[256:258] == b"\1\4"
+    with pytest.raises(ValueError):
+        im.im.getpalette("RGB", "RGB;16")
+    with pytest.raises(ValueError):
+        im.im.getpalette("RGB", "YCC")
@@ -0,0 +1,30 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PIL import Image
+
+
+def planar(data, width, height, bands):
+    # line interleaved copy of pixel interleaved data
+    lines = []
+    for y in range(height):
+        line = data[y*width*bands:(y+1)*width*bands]
+        lines.extend([line[k::bands] for k in range(bands)])
+    return b"".join(lines)
+
+
+def test_line_interleaved():
+    data = bytes(range(5 * 3 * 3))
+    im = Image.frombytes("RGB", (5, 3), planar(data, 5, 3, 3), "raw", "RGB;L")
+    assert im.tobytes() == data
+
+
+def test_bulk_bottom_up():
+    data = bytes(range(5 * 3 * 3))
+    bgr = bytearray(len(data))
+    bgr[0::3], bgr[1::3], bgr[2::3] = data[2::3], data[1::3], data[0::3]
+    lines = [bytes(bgr[y*15:(y+1)*15]) + b"\0" for y in reversed(range(3))]
+    im = Image.frombytes("RGB", (5, 3), b"".join(lines), "raw", "BGR", 16, -1)
+    assert im.tobytes() == data
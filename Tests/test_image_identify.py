@@ -0,0 +1,76 @@
+import io
+import os
+import struct
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PIL import Image, ImageFile
+
+
+def tiff(profile, padding):
+    # 4x2 greyscale image, with an ICC profile after some padding
+    entries = [
+        (256, 3, 1, 4), # ImageWidth
+        (257, 3, 1, 2), # ImageLength
+        (258, 3, 1, 8), # BitsPerSample
+        (259, 3, 1, 1), # Compression
+        (262, 3, 1, 1), # PhotometricInterpretation
+        (273, 4, 1, 0), # StripOffsets, set below
+        (278, 3, 1, 2), # RowsPerStrip
+        (279, 4, 1, 8), # StripByteCounts
+        (34675, 7, len(profile), 0), # ICCProfile, set below
+        ]
+    data = 8 + 2 + len(entries) * 12 + 4
+    values = {273: data, 34675: data + 8 + padding}
+    out = [b"II*\0", struct.pack("<IH", 8, len(entries))]
+    for tag, typ, count, value in entries:
+        value = values.get(tag, value)
+        if typ == 3:
+            out.append(struct.pack("<HHIHH", tag, typ, count, value, 0))
+        else:
+            out.append(struct.pack("<HHII", tag, typ, count, value))
+    out.append(struct.pack("<I", 0))
+    out.append(bytes(range(8)) + bytes(padding) + profile)
+    return b"".join(out)
+
+
+def test_identify(tmp_path):
+    path = str(tmp_path / "test.png")
+    Image.new("RGB", (7, 5)).save(path)
+    id = Image.identify(path)
+    assert (id.format, id.mode, id.size) == ("PNG", "RGB", (7, 5))
+
+
+def test_identify_tags_past_first_block(tmp_path):
+    profile = bytes(range(256)) * 4
+    for padding in (0, Image.IDENTIFY_BLOCK):
+        path = str(tmp_path / ("icc%d.tif" % padding))
+        with open(path, "wb") as fp:
+            fp.write(tiff(profile, padding))
+        id = Image.identify(path)
+        assert (id.format, id.size) == ("TIFF", (4, 2))
+        assert id.info["icc_profile"] == profile
+
+
+class BrokenImageFile(ImageFile.ImageFile):
+    format = "BROKEN"
+
+    def _open(self):
+        struct.unpack("<I", self.fp.read(2))
+
+
+def test_identify_many_errors(tmp_path, monkeypatch):
+    # a plugin error on a large file gives None, not an exception
+    monkeypatch.setitem(Image.OPEN, "BROKEN", (
+        BrokenImageFile, lambda prefix: prefix[:6] == b"BROKEN"))
+    monkeypatch.setattr(Image, "ID", ["BROKEN"] + Image.ID)
+    broken = str(tmp_path / "broken.bin")
+    with open(broken, "wb") as fp:
+        fp.write(b"BROKEN" + bytes(Image.IDENTIFY_BLOCK))
+    good = str(tmp_path / "good.png")
+    Image.new("L", (3, 2)).save(good)
+    for workers in (1, 2):
+        ids = Image.identify_many([broken, good], workers)
+        assert ids[0] is None
+        assert ids[1].size == (3, 2)
@@ -0,0 +1,62 @@
+import io
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from PIL import Image
+
+from test_file_im import im_rgb
+from test_file_png import png
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def plugins(script, tmp_path):
+    # run a script in a fresh interpreter; get the plugins it imported
+    code = (
+        "import sys\n"
+        "sys.path.insert(0, %r)\n"
+        "from PIL import Image\n"
+        "%s\n"
+        "print(' '.join(sorted(m[4:] for m in sys.modules\n"
+        "    if m.startswith('PIL.') and m.endswith('ImagePlugin'))))\n"
+        ) % (ROOT, script)
+    out = subprocess.check_output(
+        [sys.executable, "-c", code], cwd=str(tmp_path)
+        )
+    return out.decode().split()
+
+
+def test_open_imports_one_plugin(tmp_path):
+    with open(str(tmp_path / "x.png"), "wb") as fp:
+        fp.write(png((2, 1), 8, 0, [b"\1\2"]))
+    script = "assert Image.open('x.png').tobytes() == b'\\1\\2'"
+    assert plugins(script, tmp_path) == ["PngImagePlugin"]
+
+
+def test_save_imports_one_plugin(tmp_path):
+    script = "Image.new('L', (4, 4)).save('x.ppm')"
+    assert plugins(script, tmp_path) == ["PpmImagePlugin"]
+    assert Image.open(str(tmp_path / "x.ppm")).tobytes() == bytes(16)
+
+
+def test_match():
+    assert Image._match(b"\x89PNG\r\n\x1a\n\0\0") == ["PngImagePlugin"]
+    assert Image._match(b"GIF89a\0\0") == ["GifImagePlugin"]
+    assert Image._match(b"II*\0") == ["TiffImagePlugin"]
+    # all matches, in registry order
+    assert Image._match(b"\0\0\1\0\x11\xaf") == [
+        "FliImagePlugin", "IcoImagePlugin", "TgaImagePlugin"
+        ]
+    assert Image._match(b"xyzzy") == []
+
+
+def test_open_without_signature():
+    # formats with no signature are found by trying the other plugins
+    data = bytes(range(4 * 3 * 3))
+    im = Image.open(io.BytesIO(im_rgb(4, 3, data)))
+    assert im.format == "IM"
+    assert im.tobytes() == data
@@ -0,0 +1,208 @@
+import math
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PIL import Image
+from PIL import _imagingresample
+
+
+def ramp(width, height):
+    im = Image.new("L", (width, height))
+    im.putdata([x * 255 // (width - 1)
+                for y in range(height) for x in range(width)])
+    return im
+
+
+def test_reduce_keeps_sampling_grid():
+    # 1000 is not a multiple of the reduction factor (3), so the
+    # reduced image ends in a partial block
+    im = ramp(1000, 30)
+    for resample in (Image.BILINEAR, Image.ANTIALIAS):
+        reduced = im.resize((333, 10), resample)
+        direct = im._new(_imagingresample.resize(im.im, (333, 10), resample))
+        for x in range(333):
+            assert abs(reduced.getpixel((x, 5)) - direct.getpixel((x, 5))) <= 1
+
+
+def noise(mode, size, seed=0):
+    rng = random.Random(seed)
+    return Image.frombytes(mode, size, bytes(
+        rng.randrange(256) for i in range(size[0] * size[1] * len(mode))))
+
+
+def test_nearest():
+    im = noise("RGB", (13, 9))
+    for size in [(5, 4), (13, 9), (30, 20), (13, 1)]:
+        out = im.resize(size)
+        for y in range(size[1]):
+            for x in range(size[0]):
+                sx = (2 * x + 1) * 13 // (2 * size[0])
+                sy = (2 * y + 1) * 9 // (2 * size[1])
+                assert out.getpixel((x, y)) == im.getpixel((sx, sy))
+
+
+def test_bilinear_known():
+    im = Image.frombytes("L", (2, 1), b"\0\xff")
+    assert im.resize((4, 1), Image.BILINEAR).tobytes() == b"\0\x40\xbf\xff"
+    im = Image.frombytes("L", (4, 1), b"\0\x40\xc0\xff")
+    assert im.resize((2, 1), Image.BILINEAR).tobytes() == b"\x37\xc9"
+
+
+def reference(im, size, filter):
+    # separable float resampling with getpixel; vertical first, with
+    # the intermediate result rounded to 8 bits
+    support, function = _imagingresample._FILTERS[filter]
+    def weights(insize, outsize):
+        scale = float(insize) / outsize
+        fscale = max(scale, 1.0)
+        out = []
+        for i in range(outsize):
+            center = (i + 0.5) * scale
+            w = [(j, function((j - center + 0.5) / fscale))
+                 for j in range(insize)]
+            total = sum(v for j, v in w)
+            out.append([(j, v / total) for j, v in w if v])
+        return out
+    xw = weights(im.size[0], size[0])
+    yw = weights(im.size[1], size[1])
+    src = [[im.getpixel((x, y)) for x in range(im.size[0])]
+           for y in range(im.size[1])]
+    def clip(v):
+        return min(max(int(math.floor(v + 0.5)), 0), 255)
+    columns = [[clip(sum(src[j][x] * v for j, v in w))
+                for x in range(im.size[0])] for w in yw]
+    return [[clip(sum(row[j] * v for j, v in w)) for w in xw]
+            for row in columns]
+
+
+@pytest.mark.parametrize("filter",
+                         [Image.BILINEAR, Image.BICUBIC, Image.ANTIALIAS])
+@pytest.mark.parametrize("size", [(7, 5), (18, 7), (31, 23)])
+def test_filters(filter, size):
+    # the core resampler, without the reduction step
+    im = noise("L", (18, 11))
+    out = im._new(_imagingresample.resize(im.im, size, filter))
+    expected = reference(im, size, filter)
+    for y in range(size[1]):
+        for x in range(size[0]):
+            assert abs(out.getpixel((x, y)) - expected[y][x]) <= 1
+
+
+@pytest.mark.parametrize("filter",
+                         [Image.BILINEAR, Image.BICUBIC, Image.ANTIALIAS])
+@pytest.mark.parametrize("mode", ["L", "RGB", "RGBA", "I", "F"])
+def test_flat(mode, filter):
+    # the weights add up exactly, so flat images stay flat
+    color = {"L": 77, "I": 1234567, "F": 0.375}.get(mode, (1, 128, 254, 255))
+    im = Image.new(mode, (37, 23), color[:len(mode)]
+                   if isinstance(color, tuple) else color)
+    for size in [(10, 6), (37, 50), (80, 3)]:
+        out = im.resize(size, filter)
+        assert out.size == size
+        flat = Image.new(mode, size, im.getpixel((0, 0)))
+        assert out.tobytes() == flat.tobytes()
+
+
+def test_coefficient_cache():
+    im = noise("RGB", (40, 30))
+    im.resize((17, 13), Image.BICUBIC)
+    hits = _imagingresample._coefficients.cache_info().hits
+    noise("RGB", (40, 30), 1).resize((17, 13), Image.BICUBIC)
+    assert _imagingresample._coefficients.cache_info().hits == hits + 2
+
+
+def test_resize_errors():
+    im = noise("L", (8, 8))
+    assert im.resize((0, 5), Image.BILINEAR).size == (0, 5)
+    with pytest.raises(ValueError):
+        im.resize((4, 4), 17)
+    # palette images are always resized with NEAREST
+    p = im.convert("P")
+    out = p.resize((4, 4), Image.BILINEAR)
+    assert out.tobytes() == p.resize((4, 4)).tobytes()
+
+
+def block_means(im, xfactor, yfactor, rounding):
+    # average each block with getpixel, including the partial blocks
+    # along the right and bottom edges
+    width, height = im.size
+    out = []
+    for y0 in range(0, height, yfactor):
+        for x0 in range(0, width, xfactor):
+            values = [im.getpixel((x, y))
+                      for y in range(y0, min(y0 + yfactor, height))
+                      for x in range(x0, min(x0 + xfactor, width))]
+            if not isinstance(values[0], tuple):
+                values = [(v,) for v in values]
+            out.append(tuple(rounding(sum(v) / float(len(v)))
+                             for v in zip(*values)))
+    return out
+
+
+def pixels(im):
+    data = im.getdata()
+    if len(im.getbands()) == 1:
+        return [(v,) for v in data]
+    return list(data)
+
+
+@pytest.mark.parametrize("mode", ["L", "LA", "RGB", "RGBA"])
+@pytest.mark.parametrize("factor", [(2, 2), (3, 5), (4, 1), (1, 3), (7, 7)])
+def test_reduce(mode, factor):
+    # 23x19 is not a multiple of any of the factors
+    im = noise(mode, (23, 19))
+    out = im.reduce(*factor)
+    assert out.mode == mode
+    assert out.size == (-(-23 // factor[0]), -(-19 // factor[1]))
+    rounding = lambda v: int(math.floor(v + 0.5))
+    assert pixels(out) == block_means(im, factor[0], factor[1], rounding)
+
+
+@pytest.mark.parametrize("mode", ["I", "F"])
+def test_reduce_float(mode):
+    rng = random.Random(1)
+    im = Image.new(mode, (11, 9))
+    im.putdata([rng.randrange(-100000, 100000) for i in range(99)])
+    out = im.reduce(4, 3)
+    assert out.size == (3, 3)
+    if mode == "I":
+        rounding = lambda v: int(math.floor(v + 0.5))
+    else:
+        rounding = lambda v: v
+    expected = block_means(im, 4, 3, rounding)
+    for value, (mean,) in zip(out.getdata(), expected):
+        assert abs(value - mean) <= abs(mean) * 1e-6
+
+
+def test_reduce_large_blocks():
+    # each output pixel is the mean of a 64x64 block of 255 and 0
+    im = Image.new("L", (128, 64), 255)
+    im.paste(0, (0, 0, 64, 1))
+    assert im.reduce(64).tobytes() == bytes((251, 255))
+    assert im.reduce(64, 1).size == (2, 64)
+
+
+def test_reduce_errors():
+    im = noise("L", (8, 8))
+    assert im.reduce(1).tobytes() == im.tobytes()
+    with pytest.raises(ValueError):
+        im.reduce(0)
+    with pytest.raises(ValueError):
+        im.convert("P").reduce(2)
+
+
+def test_resize_whole_factor():
+    # reducing by whole factors needs no filtering after the reduction
+    im = noise("RGB", (48, 36), 2)
+    for resample in (Image.BILINEAR, Image.BICUBIC, Image.ANTIALIAS):
+        assert (im.resize((12, 9), resample).tobytes() ==
+                im.reduce(4, 4).tobytes())
+    thumb = im.copy()
+    thumb.thumbnail((16, 16), Image.ANTIALIAS)
+    assert thumb.size == (16, 12)
+    assert thumb.tobytes() == im.reduce(3).tobytes()
@@ -0,0 +1,130 @@
+import io
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from PIL import Image, ImageFile
+
+from test_file_im import im_rgb
+from test_file_png import png
+from test_file_sgi import sgi
+
+DATA = bytes(range(7 * 4 * 3))
+
+
+def load(path, data):
+    with open(path, "wb") as fp:
+        fp.write(data)
+    im = Image.open(path)
+    im.load()
+    return im
+
+
+def test_map_ppm(tmp_path):
+    # top-down raw data is used as the image memory
+    im = load(str(tmp_path / "map.ppm"), b"P6\n7 4\n255\n" + DATA)
+    assert im.readonly
+    assert im.tobytes() == DATA
+    im.putpixel((0, 0), (255, 255, 255))
+    assert im.getpixel((0, 0)) == (255, 255, 255)
+    assert im.getpixel((1, 0)) == (3, 4, 5)
+
+
+def test_map_sgi(tmp_path):
+    # planar, bottom-up bands are decoded from the map
+    im = load(str(tmp_path / "map.sgi"), sgi("RGB", (7, 4), DATA))
+    assert not im.readonly
+    assert im.tobytes() == DATA
+
+
+def test_map_im(tmp_path):
+    # line interleaved, bottom-up data is decoded from the map
+    im = load(str(tmp_path / "map.im"), im_rgb(7, 4, DATA))
+    assert not im.readonly
+    assert im.tobytes() == DATA
+
+
+def open_blocks(data, blocksize):
+    # open from memory, reading blocksize bytes at a time in load()
+    im = Image.open(io.BytesIO(data))
+    im.decodermaxblock = blocksize
+    return im
+
+
+def test_load_small_blocks():
+    # reads smaller than a line leave partial lines pending
+    noise = bytes(random.Random(0).randrange(256) for i in range(33 * 9 * 3))
+    data = b"P6\n33 9\n255\n" + noise
+    for blocksize in (1, 7, 100, 99, 4096):
+        im = open_blocks(data, blocksize)
+        im.load()
+        assert im.tobytes() == noise
+
+
+def test_load_small_blocks_compressed():
+    # the decoder consumes only part of each block
+    rows = [bytes((x * y) & 255 for x in range(40)) for y in range(30)]
+    data = png((40, 30), 8, 0, rows)
+    for blocksize in (1, 13, 1024):
+        im = open_blocks(data, blocksize)
+        im.load()
+        assert im.tobytes() == b"".join(rows)
+
+
+def test_load_truncated():
+    im = open_blocks(b"P5\n10 10\n255\n" + b"\0" * 95, 16)
+    with pytest.raises(IOError):
+        im.load()
+
+
+def parse(data, sizes, reuse=False):
+    # feed data in chunks of the given sizes, cycling through them
+    parser = ImageFile.Parser()
+    buffer = bytearray()
+    pos = i = 0
+    while pos < len(data):
+        size = sizes[i % len(sizes)]
+        if reuse:
+            # the caller overwrites its buffer after each feed
+            buffer[:] = data[pos:pos+size]
+            parser.feed(buffer)
+            buffer[:] = b"\xff" * len(buffer)
+        else:
+            parser.feed(data[pos:pos+size])
+        pos = pos + size
+        i = i + 1
+    return parser.close()
+
+
+def test_parser_chunks():
+    noise = bytes(random.Random(1).randrange(256) for i in range(21 * 13 * 3))
+    rows = [bytes((x ^ y) & 255 for x in range(25)) for y in range(11)]
+    for data, pixels in [
+        (b"P6\n21 13\n255\n" + noise, noise),
+        (png((25, 11), 8, 0, rows), b"".join(rows)),
+        ]:
+        for sizes in ([1], [3, 64, 5], [len(data)]):
+            for reuse in (0, 1):
+                im = parse(data, sizes, reuse)
+                assert im.size == Image.open(io.BytesIO(data)).size
+                assert im.tobytes() == pixels
+
+
+def test_parser_header_lines():
+    # header lines split across feeds, and pixel data in the same
+    # feed as the end of the header
+    data = b"P5\n# comment\n4 2\n255\n" + bytes(range(8))
+    im = parse(data, [2, 9, 1])
+    assert im.tobytes() == bytes(range(8))
+
+
+def test_parser_incomplete():
+    parser = ImageFile.Parser()
+    parser.feed(b"P5\n4 2\n255\n" + bytes(5))
+    with pytest.raises(IOError):
+        parser.close()
@@ -0,0 +1,154 @@
+import math
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PIL import Image
+from PIL import ImageStat
+
+
+def test_median():
+    im = Image.new("L", (4, 4), 7)
+    im.paste(200, (0, 0, 4, 1))
+    stat = ImageStat.Stat(im)
+    assert stat.median == [7]
+    assert stat.percentile(90) == [200]
+
+
+def test_median_empty():
+    assert ImageStat.Stat([0] * 256).median == [255]
+
+
+def noise(mode, size, seed=0):
+    rng = random.Random(seed)
+    return Image.frombytes(mode, size, bytes(
+        rng.randrange(40, 220) for i in range(size[0] * size[1] * len(mode))))
+
+
+def bands(im, mask=None):
+    # pixel values per band, with getpixel
+    values = []
+    for y in range(im.size[1]):
+        for x in range(im.size[0]):
+            if mask is None or mask.getpixel((x, y)):
+                values.append(im.getpixel((x, y)))
+    if len(im.getbands()) == 1:
+        return [values]
+    return [list(v) for v in zip(*values)]
+
+
+def check(stat, values):
+    for i, v in enumerate(values):
+        n = len(v)
+        mean = sum(v) / float(n)
+        var = sum([(x - mean) ** 2 for x in v]) / n
+        assert stat.count[i] == n
+        assert stat.sum[i] == sum(v)
+        assert stat.sum2[i] == sum([x * x for x in v])
+        assert stat.extrema[i] == (min(v), max(v))
+        assert abs(stat.mean[i] - mean) < 1e-9
+        assert abs(stat.var[i] - var) < 1e-6
+        assert abs(stat.stddev[i] - math.sqrt(var)) < 1e-6
+        assert abs(stat.rms[i] - math.sqrt(sum([x * x for x in v]) / n)) < 1e-9
+        s = sorted(v)
+        assert stat.median[i] == s[n // 2]
+        for p in (0, 1, 10, 25, 50, 75, 99, 100):
+            assert stat.percentile(p)[i] == s[min(n * p // 100, n - 1)]
+
+
+def test_stat():
+    for mode in ("L", "RGB", "RGBA"):
+        im = noise(mode, (31, 17))
+        check(ImageStat.Stat(im), bands(im))
+
+
+def test_stat_mask():
+    im = noise("RGB", (20, 20), 1)
+    mask = Image.new("L", (20, 20))
+    mask.paste(255, (3, 5, 11, 18))
+    check(ImageStat.Stat(im, mask), bands(im, mask))
+
+
+def test_stat_histogram():
+    h = [0] * 256 * 2
+    h[10], h[20], h[256 + 255] = 3, 1, 2
+    stat = ImageStat.Stat(h)
+    assert stat.count == [4, 2]
+    assert stat.sum == [50, 510]
+    assert stat.extrema == [(10, 20), (255, 255)]
+    assert stat.percentile(75) == [20, 255]
+    with pytest.raises(ValueError):
+        stat.percentile(101)
+    with pytest.raises(TypeError):
+        ImageStat.Stat("histogram")
+
+
+def boxes(size, n, seed=0):
+    rng = random.Random(seed)
+    out = [(0, 0) + size, (0, 0, 1, 1), (size[0] - 1, size[1] - 1) + size]
+    for i in range(n):
+        x0, x1 = sorted([rng.randrange(size[0] + 1) for j in range(2)])
+        y0, y1 = sorted([rng.randrange(size[1] + 1) for j in range(2)])
+        if x0 < x1 and y0 < y1:
+            out.append((x0, y0, x1, y1))
+    return out
+
+
+def test_integral():
+    grey = noise("L", (37, 23), 2)
+    for im in (grey, grey.convert("1"), noise("RGB", (37, 23), 3),
+               noise("RGBA", (37, 23), 4)):
+        integral = ImageStat.IntegralImage(im)
+        regions = boxes(im.size, 40)
+        means = integral.means(regions)
+        for box, batch in zip(regions, means):
+            # bilevel images are summed as 0 and 255
+            crop = im.crop(box)
+            if crop.mode == "1":
+                crop = crop.convert("L")
+            stat = ImageStat.Stat(crop)
+            assert integral.count(box) == stat.count[0]
+            assert integral.sum(box) == stat.sum
+            assert integral.sum2(box) == stat.sum2
+            assert integral.mean(box) == stat.mean
+            assert batch == stat.mean
+            for a, b in zip(integral.var(box), stat.var):
+                assert abs(a - b) < 1e-6
+
+
+def test_integral_float():
+    rng = random.Random(3)
+    for mode in ("I", "F"):
+        im = Image.new(mode, (19, 13))
+        values = [rng.randrange(-1000, 1000) for i in range(19 * 13)]
+        im.putdata(values)
+        integral = ImageStat.IntegralImage(im)
+        for x0, y0, x1, y1 in boxes(im.size, 20, 4):
+            v = [values[y * 19 + x] for y in range(y0, y1)
+                 for x in range(x0, x1)]
+            mean = sum(v) / float(len(v))
+            assert integral.sum((x0, y0, x1, y1)) == [sum(v)]
+            assert abs(integral.mean((x0, y0, x1, y1))[0] - mean) < 1e-9
+            var = sum([(x - mean) ** 2 for x in v]) / len(v)
+            assert abs(integral.var((x0, y0, x1, y1))[0] - var) < 1e-6
+
+
+def test_integral_clipping():
+    im = noise("RGB", (10, 8), 5)
+    integral = ImageStat.IntegralImage(im)
+    # boxes are clipped to the image
+    assert integral.sum((-5, -5, 20, 20)) == integral.sum((0, 0, 10, 8))
+    assert integral.mean((7, 6, 99, 99)) == integral.mean((7, 6, 10, 8))
+    assert integral.count((8, -3, 12, 2)) == 4
+    # empty regions have no mean
+    assert integral.count((4, 4, 4, 8)) == 0
+    assert integral.sum((12, 0, 15, 8)) == [0, 0, 0]
+    for method in (integral.mean, integral.var):
+        with pytest.raises(ValueError):
+            method((4, 4, 2, 8))
+    with pytest.raises(ValueError):
+        integral.means([(0, 0, 2, 2), (3, 3, 3, 3)])
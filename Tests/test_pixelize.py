@@ -0,0 +1,141 @@
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PIL import Image, ImageStat
+
+import pixelize
+
+
+def noise(mode, size, seed=0):
+    rng = random.Random(seed)
+    bands = len(mode)
+    return Image.frombytes(mode, size, bytes(
+        rng.randrange(256) for i in range(size[0] * size[1] * bands)))
+
+
+def reference(im, psize, method):
+    # pixelize with getpixel, one block at a time
+    width, height = im.size
+    bands = len(im.getbands())
+    out = im.copy()
+    for y0 in range(0, height, psize):
+        for x0 in range(0, width, psize):
+            box = [(x, y) for y in range(y0, min(y0 + psize, height))
+                          for x in range(x0, min(x0 + psize, width))]
+            values = [im.getpixel(xy) for xy in box]
+            if bands == 1:
+                values = [(v,) for v in values]
+            color = []
+            for band in range(bands):
+                v = [p[band] for p in values]
+                if method == pixelize.MEAN:
+                    color.append((sum(v) + len(v) // 2) // len(v))
+                else:
+                    color.append(sorted(v)[len(v) // 2])
+            for xy in box:
+                out.putpixel(xy, tuple(color) if bands > 1 else color[0])
+    return out
+
+
+@pytest.mark.parametrize("method", [pixelize.MEAN, pixelize.MEDIAN])
+@pytest.mark.parametrize("mode", ["L", "RGB", "RGBA"])
+def test_pixelize(mode, method):
+    # 23x17 leaves partial blocks along the right and bottom edges
+    im = noise(mode, (23, 17))
+    out = pixelize.pixelize(im, 5, method)
+    assert out.mode == mode and out.size == im.size
+    assert out.tobytes() == reference(im, 5, method).tobytes()
+
+
+def test_pixelize_converts():
+    im = noise("L", (8, 8)).convert("P")
+    assert pixelize.pixelize(im, 4).mode == "RGB"
+
+
+def test_pixelize_errors():
+    im = noise("L", (8, 8))
+    with pytest.raises(ValueError):
+        pixelize.pixelize(im, 0)
+    with pytest.raises(ValueError):
+        pixelize.pixelize(im, 4, "mode")
+    with pytest.raises(ValueError):
+        pixelize.pixelize(noise("L", (8, 8)).convert("I"), 4)
+
+
+def leaves(im, threshold, min_size, max_leaves=pixelize.QUADTREE_LEAVES):
+    stats = ImageStat.IntegralImage(im)
+    return pixelize._quadtree_leaves(
+        stats, im.size[0], im.size[1], threshold, min_size, max_leaves
+        )
+
+
+def covers(boxes, size):
+    # the boxes cover the image exactly once
+    seen = [0] * (size[0] * size[1])
+    for x0, y0, x1, y1 in boxes:
+        assert 0 <= x0 < x1 <= size[0] and 0 <= y0 < y1 <= size[1]
+        for y in range(y0, y1):
+            for x in range(x0, x1):
+                seen[y * size[0] + x] += 1
+    return seen == [1] * len(seen)
+
+
+def detail(size, box, seed=0):
+    # flat image, with noise inside the box
+    im = Image.new("RGB", size, (30, 90, 150))
+    patch = noise("RGB", (box[2] - box[0], box[3] - box[1]), seed)
+    im.paste(patch, box[:2])
+    return im
+
+
+def test_quadtree_flat():
+    im = Image.new("RGB", (50, 37), (12, 200, 77))
+    out = pixelize.pixelize_quadtree(im, min_size=4)
+    assert out.tobytes() == im.tobytes()
+    # no blocks are split; 32x32 squares, cut off at the edges
+    assert sorted(leaves(im, 300, 4)) == [
+        (0, 0, 32, 32), (0, 32, 32, 37), (32, 0, 50, 32), (32, 32, 50, 37)
+        ]
+
+
+def test_quadtree_detail():
+    im = detail((64, 64), (0, 0, 16, 16))
+    boxes = leaves(im, 300, 4)
+    assert covers(boxes, im.size)
+    for x0, y0, x1, y1 in boxes:
+        if x0 < 16 and y0 < 16:
+            assert (x1 - x0, y1 - y0) == (4, 4) # detail: smallest blocks
+        else:
+            assert x1 - x0 >= 16 # flat: large blocks
+
+
+def test_quadtree_fill():
+    # each block is filled with its mean colour
+    im = detail((45, 30), (5, 3, 40, 20), 1)
+    out = pixelize.pixelize_quadtree(im, threshold=100, min_size=2)
+    boxes = leaves(im, 100, 2)
+    assert covers(boxes, im.size)
+    for box in boxes:
+        stat = ImageStat.Stat(im.crop(box))
+        color = tuple(int(m + 0.5) for m in stat.mean)
+        crop = out.crop(box)
+        assert crop.tobytes() == bytes(color) * (crop.size[0] * crop.size[1])
+
+
+def test_quadtree_limit():
+    im = noise("RGB", (64, 64), 2)
+    assert len(leaves(im, 300, 4)) == 256
+    for limit in (1, 10, 100):
+        boxes = leaves(im, 300, 4, limit)
+        assert covers(boxes, im.size)
+        assert len(boxes) <= limit
+
+
+def test_quadtree_errors():
+    with pytest.raises(ValueError):
+        pixelize.pixelize_quadtree(noise("L", (8, 8)), min_size=0)
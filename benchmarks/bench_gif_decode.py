@@ -0,0 +1,150 @@
+"""Benchmark GIF decoding, all frames.
+
+Usage: python benchmarks/bench_gif_decode.py [--size 400] [--frames 8]
+       [--repeat 3] [--corpus DIRECTORY]
+
+Decodes a synthetic corpus of animated GIFs (photographic-like, blocky
+and interlaced frames) and, optionally, every .gif file in a directory.
+Throughput is given in millions of decoded pixels per second.
+"""
+
+import argparse
+import glob
+import io
+import os
+import random
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PIL import Image
+
+
+def lzw(pixels, bits):
+    # straightforward LZW writer, with a clear code when the table fills
+    clear = 1 << bits
+    codes = [(clear, bits + 1)]
+    table = dict((bytes([i]), i) for i in range(clear))
+    next, size = clear + 2, bits + 1
+    w = b""
+    for c in pixels:
+        wc = w + bytes([c])
+        if wc in table:
+            w = wc
+            continue
+        codes.append((table[w], size))
+        if next < 4096:
+            table[wc] = next
+            next += 1
+            if next > (1 << size) and size < 12:
+                size += 1
+        else:
+            codes.append((clear, size))
+            table = dict((bytes([i]), i) for i in range(clear))
+            next, size = clear + 2, bits + 1
+        w = bytes([c])
+    if w:
+        codes.append((table[w], size))
+    codes.append((clear + 1, size))
+    acc = count = 0
+    data = bytearray()
+    for code, size in codes:
+        acc |= code << count
+        count += size
+        while count >= 8:
+            data.append(acc & 255)
+            acc >>= 8
+            count -= 8
+    if count:
+        data.append(acc)
+    out = bytearray([bits])
+    for i in range(0, len(data), 255):
+        out.append(len(data[i:i+255]))
+        out += data[i:i+255]
+    return bytes(out + b"\0")
+
+
+def write_gif(width, height, frames, interlace=0):
+    rnd = random.Random(width)
+    out = [b"GIF89a", struct.pack("<HHBBB", width, height, 0xf7, 0, 0),
+           bytes(rnd.randrange(256) for i in range(768))]
+    for pixels in frames:
+        if interlace:
+            order = []
+            for y0, dy in ((0, 8), (4, 8), (2, 4), (1, 2)):
+                order.extend(range(y0, height, dy))
+            pixels = b"".join(pixels[y*width:(y+1)*width] for y in order)
+        out.append(b"!\xf9\x04\x00\x05\x00\x00\x00")
+        out.append(b"," + struct.pack("<HHHHB", 0, 0, width, height,
+                                      interlace and 0x40))
+        out.append(lzw(pixels, 8))
+    out.append(b";")
+    return b"".join(out)
+
+
+def photo_frame(size, frame):
+    rnd = random.Random(frame)
+    return bytes((x + y * 2 + frame * 3 + rnd.randrange(12)) % 256
+                 for y in range(size) for x in range(size))
+
+
+def blocky_frame(size, frame, block=16):
+    return bytes(((x + frame) // block * 7 + y // block * 13) % 256
+                 for y in range(size) for x in range(size))
+
+
+def corpus(size, frames):
+    photo = [photo_frame(size, i) for i in range(frames)]
+    blocky = [blocky_frame(size, i) for i in range(frames)]
+    yield "photo", write_gif(size, size, photo)
+    yield "blocky", write_gif(size, size, blocky)
+    yield "blocky interlaced", write_gif(size, size, blocky, interlace=1)
+
+
+def decode_all(data):
+    im = Image.open(io.BytesIO(data))
+    pixels = 0
+    try:
+        while 1:
+            im.load()
+            pixels += im.size[0] * im.size[1]
+            im.seek(im.tell() + 1)
+    except EOFError:
+        pass
+    return pixels
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=400)
+    parser.add_argument("--frames", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--corpus", default=None)
+    args = parser.parse_args()
+
+    files = list(corpus(args.size, args.frames))
+    if args.corpus:
+        for path in sorted(glob.glob(os.path.join(args.corpus, "*.gif"))):
+            with open(path, "rb") as fp:
+                files.append((os.path.basename(path), fp.read()))
+
+    print("%-24s %10s %10s %10s" % ("file", "KB", "seconds", "Mpx/s"))
+    for name, data in files:
+        best = None
+        try:
+            for i in range(args.repeat):
+                t0 = time.perf_counter()
+                pixels = decode_all(data)
+                t = time.perf_counter() - t0
+                best = t if best is None else min(best, t)
+        except (IOError, ValueError) as v:
+            print("%-24s skipped (%s)" % (name, v))
+            continue
+        print("%-24s %10.1f %10.4f %10.2f" %
+              (name, len(data) / 1024.0, best, pixels / best / 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Benchmark GIF saving, against PNG.
+
+Usage: python benchmarks/bench_gif_encode.py [--size 512] [--psize 8]
+       [--repeat 3]
+
+Saves a photographic-like RGB image and its pixelized version as GIF
+(interlaced and not) and as PNG, and prints the file size and save
+time for each.  The pixelized image has few colours, so it is saved
+with an exact palette.
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pixelize import pixelize
+
+from bench_png_encode import photo
+
+
+def save(im, repeat, format, **options):
+    best = None
+    for i in range(repeat):
+        fp = io.BytesIO()
+        t0 = time.perf_counter()
+        im.save(fp, format, **options)
+        t = time.perf_counter() - t0
+        best = t if best is None else min(best, t)
+    return best, len(fp.getvalue())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=512)
+    parser.add_argument("--psize", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    source = photo(args.size)
+    images = [("photo", source), ("pixelized", pixelize(source, args.psize))]
+    pixels = args.size * args.size / 1e6
+
+    print("%-10s %-16s %10s %10s %10s" %
+          ("image", "format", "KB", "seconds", "Mpx/s"))
+    for name, im in images:
+        for label, format, options in (
+                ("GIF", "GIF", {"interlace": 0}),
+                ("GIF interlaced", "GIF", {"interlace": 1}),
+                ("PNG", "PNG", {})):
+            t, size = save(im, args.repeat, format, **options)
+            print("%-10s %-16s %10.1f %10.4f %10.2f" %
+                  (name, label, size / 1024.0, t, pixels / t))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Benchmark random access to the frames of an animated GIF.
+
+Usage: python benchmarks/bench_gif_seek.py [--size 128] [--frames 500]
+       [--seeks 200] [--interval 16]
+
+Writes an animation, plays it through once (which builds the frame
+index), then seeks to random frames, as a preview UI would when
+scrubbing, and reports the average time per seek (including loading
+the frame).
+"""
+
+import argparse
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PIL import Image, ImageFile, ImageSequence
+
+from bench_gif_decode import blocky_frame, write_gif
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=128)
+    parser.add_argument("--frames", type=int, default=500)
+    parser.add_argument("--seeks", type=int, default=200)
+    parser.add_argument("--interval", type=int, default=ImageFile.KEYFRAMES)
+    args = parser.parse_args()
+
+    frames = [blocky_frame(args.size, i) for i in range(args.frames)]
+    data = write_gif(args.size, args.size, frames)
+
+    im = Image.open(io.BytesIO(data))
+    im.frameindex.interval = args.interval
+    t0 = time.perf_counter()
+    for frame in ImageSequence.Iterator(im):
+        frame.load()
+    t = time.perf_counter() - t0
+    print("first pass   %8.3f s  (%.2f ms/frame)" %
+          (t, t / args.frames * 1000))
+
+    rnd = random.Random(0)
+    targets = [rnd.randrange(args.frames) for i in range(args.seeks)]
+    t0 = time.perf_counter()
+    for k in targets:
+        im.seek(k)
+        im.load()
+    t = time.perf_counter() - t0
+    print("random seek  %8.3f s  (%.2f ms/seek, keyframes every %d)" %
+          (t, t / args.seeks * 1000, args.interval))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Benchmark Image.identify() against Image.open() on many small files.
+
+Usage: python benchmarks/bench_identify.py [--count 2000]
+       [--formats PNG,GIF,JPEG,BMP,PPM,TIFF] [--workers 1,4]
+
+Writes a directory of small images in the given formats, then times
+identifying all of them (once to warm the page cache, then for real),
+and reports files per second.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PIL import Image
+
+
+def make_files(tmp, count, formats):
+    im = Image.new("RGB", (64, 48), (10, 20, 30))
+    paths = []
+    for format in formats:
+        template = os.path.join(tmp, "template." + format.lower())
+        try:
+            im.save(template, format)
+        except (IOError, KeyError, ValueError) as v:
+            print("%-5s skipped (%s)" % (format, v))
+            continue
+        data = open(template, "rb").read()
+        os.remove(template)
+        for i in range(count // len(formats)):
+            path = os.path.join(tmp, "%06d.%s" % (len(paths), format.lower()))
+            with open(path, "wb") as fp:
+                fp.write(data)
+            paths.append(path)
+    return paths
+
+
+def open_all(paths):
+    result = []
+    for path in paths:
+        im = Image.open(path)
+        result.append((im.format, im.mode, im.size))
+        im.fp.close()
+    return result
+
+
+def timed(func, *args):
+    func(*args)  # warm up caches and plugin imports
+    t0 = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=2000)
+    parser.add_argument("--formats", default="PNG,GIF,JPEG,BMP,PPM,TIFF")
+    parser.add_argument("--workers", default="1,4")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        paths = make_files(tmp, args.count, args.formats.split(","))
+        print("%-20s %8s %10s %12s" % ("method", "files", "seconds", "files/s"))
+        result, t = timed(open_all, paths)
+        print("%-20s %8d %10.3f %12.0f" % ("open", len(paths), t, len(paths) / t))
+        for workers in [int(s) for s in args.workers.split(",")]:
+            ids, t = timed(Image.identify_many, paths, workers)
+            assert [i[:3] for i in ids] == result
+            print("%-20s %8d %10.3f %12.0f" % (
+                "identify_many(%d)" % workers, len(paths), t, len(paths) / t))
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
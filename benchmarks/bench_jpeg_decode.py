@@ -0,0 +1,72 @@
+"""Benchmark JPEG decoding at full and reduced (draft) scale.
+
+Usage: python benchmarks/bench_jpeg_decode.py [--repeat 3]
+       [--corpus DIRECTORY] [FILE ...]
+
+Decodes each file at full size, and with draft() at 1/2, 1/4 and 1/8
+scale, and reports the time taken and the speedup over full size.
+Throughput is given in millions of source pixels per second.
+"""
+
+import argparse
+import glob
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PIL import Image
+
+
+def decode(data, scale):
+    im = Image.open(io.BytesIO(data))
+    if scale > 1:
+        im.draft(im.mode, (im.size[0] // scale, im.size[1] // scale))
+    im.load()
+    return im
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", nargs="*")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--corpus", default=None)
+    args = parser.parse_args()
+
+    paths = list(args.files)
+    if args.corpus:
+        for pattern in ("*.jpg", "*.jpeg"):
+            paths.extend(sorted(glob.glob(os.path.join(args.corpus, pattern))))
+    if not paths:
+        parser.error("no JPEG files given")
+
+    print("%-28s %-11s %6s %10s %10s %8s" % (
+        "file", "output", "scale", "seconds", "Mpx/s", "speedup"))
+    for path in paths:
+        with open(path, "rb") as fp:
+            data = fp.read()
+        name = os.path.basename(path)
+        full = None
+        for scale in (1, 2, 4, 8):
+            best = None
+            try:
+                for i in range(args.repeat):
+                    t0 = time.perf_counter()
+                    im = decode(data, scale)
+                    t = time.perf_counter() - t0
+                    best = t if best is None else min(best, t)
+            except (IOError, ValueError) as v:
+                print("%-28s skipped (%s)" % (name, v))
+                break
+            if full is None:
+                full = best
+                pixels = im.size[0] * im.size[1]
+            print("%-28s %-11s %6s %10.4f %10.2f %7.2fx" % (
+                name[:28], "%dx%d" % im.size, "1/%d" % scale, best,
+                pixels / best / 1e6, full / best))
+
+
+if __name__ == "__main__":
+    main()
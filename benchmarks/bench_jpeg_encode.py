@@ -0,0 +1,55 @@
+"""Benchmark JPEG saving.
+
+Usage: python benchmarks/bench_jpeg_encode.py [--size 512] [--psize 12]
+       [--quality 75] [--repeat 3]
+
+Saves a photographic-like RGB image, a pixelized version of it, and a
+pixelized version aligned to JPEG blocks, with the standard and the
+optimized Huffman tables, and with 4:2:0 and 4:4:4 subsampling.  The
+aligned image has a single colour per block, and is encoded without
+a DCT.
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from pixelize import pixelize, JPEG_MCU
+
+from bench_gif_encode import save
+from bench_png_encode import photo
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=512)
+    parser.add_argument("--psize", type=int, default=12)
+    parser.add_argument("--quality", type=int, default=75)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    source = photo(args.size)
+    images = [
+        ("photo", source),
+        ("pixelized", pixelize(source, args.psize)),
+        ("aligned", pixelize(source, args.psize, align=JPEG_MCU)),
+        ]
+    pixels = args.size * args.size / 1e6
+
+    print("%-10s %-16s %10s %10s %10s" %
+          ("image", "options", "KB", "seconds", "Mpx/s"))
+    for name, im in images:
+        for label, options in (
+                ("4:2:0", {}),
+                ("4:2:0 optimize", {"optimize": 1}),
+                ("4:4:4", {"subsampling": "4:4:4"})):
+            t, size = save(im, args.repeat, "JPEG", quality=args.quality,
+                           **options)
+            print("%-10s %-16s %10.1f %10.4f %10.2f" %
+                  (name, label, size / 1024.0, t, pixels / t))
+
+
+if __name__ == "__main__":
+    main()
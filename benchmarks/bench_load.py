@@ -0,0 +1,68 @@
+"""Benchmark ImageFile.load() on uncompressed files of growing size.
+
+Usage: python benchmarks/bench_load.py [--sizes 16,32,64,128]
+       [--formats PPM,TIFF,BMP] [--block BYTES]
+
+For each format and file size (in megabytes), writes a raw RGB file to
+a temporary directory and times opening and loading it.  With a linear
+decode loop the throughput column stays flat as the files grow.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PIL import Image, ImageFile
+
+
+def make_image(megabytes):
+    width = 4096
+    height = max(int(megabytes * 1024 * 1024 / (width * 3)), 1)
+    line = bytes(range(256)) * (width * 3 // 256)
+    return Image.frombytes("RGB", (width, height), line * height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="16,32,64,128")
+    parser.add_argument("--formats", default="PPM,TIFF,BMP")
+    parser.add_argument("--block", type=int, default=None,
+                        help="override decodermaxblock for all formats")
+    args = parser.parse_args()
+
+    if args.block:
+        ImageFile.ImageFile.decodermaxblock = args.block
+
+    tmp = tempfile.mkdtemp()
+    print("%-5s %8s %10s %10s" % ("fmt", "MB", "seconds", "MB/s"))
+    try:
+        for megabytes in [int(s) for s in args.sizes.split(",")]:
+            im = make_image(megabytes)
+            for format in args.formats.split(","):
+                path = os.path.join(tmp, "bench." + format.lower())
+                try:
+                    im.save(path, format)
+                    if args.block:
+                        # subclasses may set their own block size
+                        Image.open(path).__class__.decodermaxblock = args.block
+                    t0 = time.perf_counter()
+                    Image.open(path).load()
+                    t = time.perf_counter() - t0
+                except (IOError, ValueError) as v:
+                    print("%-5s %8d %s" % (format, megabytes, "skipped (%s)" % v))
+                    continue
+                finally:
+                    if os.path.exists(path):
+                        size = os.path.getsize(path) / 1048576.0
+                        os.remove(path)
+                print("%-5s %8.1f %10.3f %10.1f" % (format, size, t, size / t))
+    finally:
+        os.rmdir(tmp)
+
+
+if __name__ == "__main__":
+    main()
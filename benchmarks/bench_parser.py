@@ -0,0 +1,76 @@
+"""Benchmark ImageFile.Parser fed with small chunks.
+
+Usage: python benchmarks/bench_parser.py [--sizes 4,16,32]
+       [--chunks 4096,65536] [--formats PPM,TIFF]
+
+For each format and file size (in megabytes), encodes an RGB image in
+memory and feeds it to a parser in fixed-size chunks, as a network
+upload handler would.  Prints the time, throughput and the largest
+amount of data held by the parser between feeds.
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PIL import Image, ImageFile
+
+
+def make_file(megabytes, format):
+    width = 4096
+    height = max(int(megabytes * 1024 * 1024 / (width * 3)), 1)
+    line = bytes(range(256)) * (width * 3 // 256)
+    im = Image.frombytes("RGB", (width, height), line * height)
+    fp = io.BytesIO()
+    im.save(fp, format)
+    return fp.getvalue()
+
+
+def pending(parser):
+    # bytes held by the parser that the decoder has not consumed yet
+    size = len(parser.data or b"")
+    for chunk in parser.chunks or []:
+        size += len(chunk)
+    return size
+
+
+def feed(data, chunk):
+    parser = ImageFile.Parser()
+    peak = 0
+    t0 = time.perf_counter()
+    for i in range(0, len(data), chunk):
+        parser.feed(data[i:i+chunk])
+        peak = max(peak, pending(parser))
+    parser.close()
+    return time.perf_counter() - t0, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="4,16,32")
+    parser.add_argument("--chunks", default="4096,65536")
+    parser.add_argument("--formats", default="PPM,TIFF")
+    args = parser.parse_args()
+
+    print("%-5s %8s %8s %10s %10s %10s" %
+          ("fmt", "MB", "chunk", "seconds", "MB/s", "peak KB"))
+    for megabytes in [int(s) for s in args.sizes.split(",")]:
+        for format in args.formats.split(","):
+            try:
+                data = make_file(megabytes, format)
+            except (IOError, ValueError) as v:
+                print("%-5s %8d skipped (%s)" % (format, megabytes, v))
+                continue
+            size = len(data) / 1048576.0
+            for chunk in [int(s) for s in args.chunks.split(",")]:
+                t, peak = feed(data, chunk)
+                print("%-5s %8.1f %8d %10.3f %10.1f %10.1f" %
+                      (format, size, chunk, t, size / t, peak / 1024.0))
+
+
+if __name__ == "__main__":
+    main()
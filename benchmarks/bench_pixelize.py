@@ -0,0 +1,63 @@
+"""Benchmark pixelize() with different numbers of worker processes.
+
+Usage: python benchmarks/bench_pixelize.py [--megapixels N] [--psize P]
+       [--workers 1,2,4,8]
+
+Prints the wall time for each worker count and the speedup over the
+single-process engine.  Images smaller than pixelize.PARALLEL_PIXELS
+are always pixelized in one process.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PIL import Image
+import pixelize
+
+
+def best_of(repeat, function, *args, **kw):
+    best = None
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        function(*args, **kw)
+        t = time.perf_counter() - t0
+        if best is None or t < best:
+            best = t
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megapixels", type=float, default=24)
+    parser.add_argument("--psize", type=int, default=8)
+    parser.add_argument("--workers", default="1,2,4,8")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    width = int((args.megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(args.megapixels * 1e6 / width)
+    im = Image.frombytes(
+        "RGB", (width, height), random.randbytes(width * height * 3)
+        )
+    print("image %dx%d RGB, psize=%d, %d cpus" % (
+        width, height, args.psize, os.cpu_count() or 1))
+
+    base = None
+    for workers in [int(w) for w in args.workers.split(",")]:
+        # warm up the worker pool before timing
+        pixelize.pixelize(im, args.psize, workers=workers)
+        t = best_of(args.repeat, pixelize.pixelize, im, args.psize,
+                    workers=workers)
+        if base is None:
+            base = t
+        print("workers=%-3d %8.3f s  %6.1f MP/s  speedup %.2fx" % (
+            workers, t, args.megapixels / t, base / t))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""Benchmark PNG decoding.
+
+Usage: python benchmarks/bench_png_decode.py [--size 512] [--repeat 3]
+       [--corpus DIRECTORY]
+
+Decodes a synthetic reference corpus (photographic-like and blocky
+images, every scanline filter, palette, 16-bit and interlaced files)
+and, optionally, every .png file in a directory such as PngSuite.
+Throughput is given in megabytes of decoded pixel data per second.
+"""
+
+import argparse
+import glob
+import io
+import os
+import random
+import struct
+import sys
+import time
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PIL import Image
+
+MAGIC = b"\211PNG\r\n\032\n"
+
+
+def chunk(cid, data):
+    crc = zlib.crc32(cid + data)
+    return struct.pack(">I", len(data)) + cid + data + struct.pack(">I", crc)
+
+
+def paeth(a, b, c):
+    p = a + b - c
+    pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+    if pa <= pb and pa <= pc:
+        return a
+    if pb <= pc:
+        return b
+    return c
+
+
+def filter_rows(rows, bpp, ftype):
+    out = []
+    prior = bytes(len(rows[0]))
+    for row in rows:
+        line = bytearray([ftype])
+        for i, x in enumerate(row):
+            a = row[i-bpp] if i >= bpp else 0
+            b = prior[i]
+            c = prior[i-bpp] if i >= bpp else 0
+            pred = (0, a, b, (a + b) // 2, paeth(a, b, c))[ftype]
+            line.append((x - pred) & 255)
+        out.append(bytes(line))
+        prior = row
+    return b"".join(out)
+
+
+def write_png(width, height, bits, color, rows, ftype, interlace=0,
+              palette=None):
+    spp = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}[color]
+    bpp = max(bits * spp // 8, 1)
+    if interlace:
+        size = bits * spp // 8
+        data = []
+        for x0, y0, dx, dy in ((0, 0, 8, 8), (4, 0, 8, 8), (0, 4, 4, 8),
+                               (2, 0, 4, 4), (0, 2, 2, 4), (1, 0, 2, 2),
+                               (0, 1, 1, 2)):
+            if x0 >= width or y0 >= height:
+                continue
+            sub = []
+            for y in range(y0, height, dy):
+                sub.append(b"".join(rows[y][x*size:(x+1)*size]
+                                    for x in range(x0, width, dx)))
+            data.append(filter_rows(sub, bpp, ftype))
+        raw = b"".join(data)
+    else:
+        raw = filter_rows(rows, bpp, ftype)
+    header = struct.pack(">IIBBBBB", width, height, bits, color, 0, 0,
+                         interlace)
+    out = [MAGIC, chunk(b"IHDR", header)]
+    if palette:
+        out.append(chunk(b"PLTE", palette))
+    z = zlib.compress(raw, 6)
+    for i in range(0, len(z), 8192):
+        out.append(chunk(b"IDAT", z[i:i+8192]))
+    out.append(chunk(b"IEND", b""))
+    return b"".join(out)
+
+
+def photo_rows(size, channels, bits=8):
+    rnd = random.Random(size)
+    rows = []
+    for y in range(size):
+        row = []
+        for x in range(size):
+            for c in range(channels):
+                v = (x * (c + 1) + y * 2 + rnd.randrange(24)) % (1 << bits)
+                row.append(v.to_bytes(bits // 8, "big"))
+        rows.append(b"".join(row))
+    return rows
+
+
+def blocky_rows(size, channels, block=16):
+    rnd = random.Random(block)
+    colors = {}
+    rows = []
+    for y in range(size):
+        row = []
+        for bx in range(0, size, block):
+            key = bx // block, y // block
+            if key not in colors:
+                colors[key] = bytes(rnd.randrange(256) for c in range(channels))
+            row.append(colors[key] * min(block, size - bx))
+        rows.append(b"".join(row))
+    return rows
+
+
+def corpus(size):
+    names = ("none", "sub", "up", "average", "paeth")
+    photo = photo_rows(size, 3)
+    blocky = blocky_rows(size, 3)
+    for ftype, name in enumerate(names):
+        yield "photo RGB %s" % name, write_png(size, size, 8, 2, photo, ftype)
+    for ftype, name in enumerate(names):
+        yield "blocky RGB %s" % name, write_png(size, size, 8, 2, blocky, ftype)
+    yield "photo L up", write_png(size, size, 8, 0, photo_rows(size, 1), 2)
+    yield "photo RGBA paeth", write_png(size, size, 8, 6,
+                                        photo_rows(size, 4), 4)
+    yield "photo RGB16 sub", write_png(size, size, 16, 2,
+                                       photo_rows(size, 3, 16), 1)
+    palette = bytes(random.Random(0).randrange(256) for i in range(768))
+    yield "blocky P up", write_png(size, size, 8, 3, blocky_rows(size, 1), 2,
+                                   palette=palette)
+    yield "photo RGB adam7 up", write_png(size, size, 8, 2, photo, 2,
+                                          interlace=1)
+
+
+def best_of(data, repeat):
+    best = None
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        im = Image.open(io.BytesIO(data))
+        im.load()
+        t = time.perf_counter() - t0
+        best = t if best is None else min(best, t)
+    return best, im
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=512)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--corpus", default=None)
+    args = parser.parse_args()
+
+    files = list(corpus(args.size))
+    if args.corpus:
+        for path in sorted(glob.glob(os.path.join(args.corpus, "*.png"))):
+            with open(path, "rb") as fp:
+                files.append((os.path.basename(path), fp.read()))
+
+    print("%-24s %10s %10s %10s" % ("file", "KB", "seconds", "MB/s"))
+    total_bytes = total_time = 0
+    for name, data in files:
+        try:
+            t, im = best_of(data, args.repeat)
+        except (IOError, ValueError) as v:
+            print("%-24s skipped (%s)" % (name, v))
+            continue
+        size = len(im.tobytes())
+        total_bytes += size
+        total_time += t
+        print("%-24s %10.1f %10.4f %10.1f" %
+              (name, len(data) / 1024.0, t, size / t / 1048576.0))
+    if total_time:
+        print("%-24s %10s %10.4f %10.1f" %
+              ("total", "", total_time, total_bytes / total_time / 1048576.0))
+
+
+if __name__ == "__main__":
+    main()
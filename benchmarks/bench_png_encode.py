@@ -0,0 +1,74 @@
+"""Benchmark PNG saving with different filter strategies.
+
+Usage: python benchmarks/bench_png_encode.py [--size 512] [--psize 8]
+       [--levels 1,6,9] [--repeat 3]
+
+Saves a photographic-like RGB image and its pixelized version with
+every filter strategy and compression level, and prints the file size
+and save time for each.
+"""
+
+import argparse
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PIL import Image
+from pixelize import pixelize
+
+STRATEGIES = ("none", "sub", "up", "average", "paeth", "adaptive")
+
+
+def photo(size):
+    # smooth gradients with some noise, roughly like a photograph
+    rnd = random.Random(size)
+    data = bytearray(size * size * 3)
+    for y in range(size):
+        for x in range(size):
+            i = (y * size + x) * 3
+            data[i] = (x + rnd.randrange(16)) & 255
+            data[i+1] = (y + rnd.randrange(16)) & 255
+            data[i+2] = ((x + y) // 2 + rnd.randrange(16)) & 255
+    return Image.frombytes("RGB", (size, size), bytes(data))
+
+
+def save(im, repeat, **options):
+    best = None
+    for i in range(repeat):
+        fp = io.BytesIO()
+        t0 = time.perf_counter()
+        im.save(fp, "PNG", **options)
+        t = time.perf_counter() - t0
+        best = t if best is None else min(best, t)
+    return best, len(fp.getvalue())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=512)
+    parser.add_argument("--psize", type=int, default=8)
+    parser.add_argument("--levels", default="1,6,9")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    source = photo(args.size)
+    images = [("photo", source), ("pixelized", pixelize(source, args.psize))]
+    raw = args.size * args.size * 3 / 1048576.0
+
+    print("%-10s %-9s %5s %10s %10s %10s" %
+          ("image", "filter", "level", "KB", "seconds", "MB/s"))
+    for name, im in images:
+        for level in [int(s) for s in args.levels.split(",")]:
+            for strategy in STRATEGIES:
+                t, size = save(im, args.repeat, compress_level=level,
+                               filter_strategy=strategy)
+                print("%-10s %-9s %5d %10.1f %10.4f %10.1f" %
+                      (name, strategy, level, size / 1024.0, t, raw / t))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Benchmark quadtree pixelization against the fixed grid.
+
+Usage: python benchmarks/bench_quadtree.py [--size 640x400] [--psize 4]
+       [--thresholds 100,300,1000] [--repeat 3]
+
+Pixelizes a photographic-like RGB image with pixelize() at the given
+block size, and with pixelize_quadtree() at each threshold, using the
+block size as the smallest block.  Prints the time taken and, for the
+quadtree, the number of blocks.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PIL import Image, ImageStat
+from pixelize import pixelize, pixelize_quadtree, _quadtree_leaves
+from pixelize import QUADTREE_LEAVES
+
+from bench_png_encode import photo
+
+
+def best(repeat, function, *args):
+    t = None
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        function(*args)
+        t1 = time.perf_counter() - t0
+        t = t1 if t is None else min(t, t1)
+    return t
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", default="640x400")
+    parser.add_argument("--psize", type=int, default=4)
+    parser.add_argument("--thresholds", default="100,300,1000")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    width, height = [int(v) for v in args.size.split("x")]
+    im = photo(max(width, height)).resize((width, height), Image.ANTIALIAS)
+    stats = ImageStat.IntegralImage(im)
+
+    print("%-20s %8s %10s" % ("method", "blocks", "seconds"))
+    t = best(args.repeat, pixelize, im, args.psize)
+    blocks = -(-width // args.psize) * -(-height // args.psize)
+    print("%-20s %8d %10.4f" % ("grid", blocks, t))
+    for threshold in [float(v) for v in args.thresholds.split(",")]:
+        leaves = _quadtree_leaves(stats, width, height, threshold,
+                                  args.psize, QUADTREE_LEAVES)
+        t = best(args.repeat, pixelize_quadtree, im, threshold, args.psize)
+        print("%-20s %8d %10.4f" % (
+            "quadtree %g" % threshold, len(leaves), t))
+
+
+if __name__ == "__main__":
+    main()
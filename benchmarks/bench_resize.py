@@ -0,0 +1,75 @@
+"""Benchmark resizing to a preview size.
+
+Usage: python benchmarks/bench_resize.py [--size 1024] [--preview 640x400]
+       [--count 5] [--repeat 3]
+
+Resizes a batch of photographic-like RGB images of the same size to the
+preview size with each resampling filter, and reports the time per
+image.  The filter weights only depend on the sizes, so they are
+computed for the first image of each batch only; the first image is
+timed separately.  Sources at least twice the preview size in both
+directions are reduced by whole blocks before filtering; the "reduce"
+line times a reduction on its own.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PIL import Image
+from PIL import _imagingresample
+
+from bench_png_encode import photo
+
+FILTERS = (
+    ("nearest", Image.NEAREST),
+    ("bilinear", Image.BILINEAR),
+    ("bicubic", Image.BICUBIC),
+    ("antialias", Image.ANTIALIAS),
+    ("reduce", None),
+    )
+
+
+def shrink(im, preview, resample):
+    if resample is None:
+        return im.reduce(max(im.size[0] // preview[0], 1),
+                         max(im.size[1] // preview[1], 1))
+    return im.resize(preview, resample)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--preview", default="640x400")
+    parser.add_argument("--count", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    preview = tuple(int(v) for v in args.preview.split("x"))
+    source = photo(args.size)
+    images = [source.copy() for i in range(args.count)]
+    pixels = args.size * args.size / 1e6
+
+    print("%-10s %10s %10s %10s" % ("filter", "first", "per image", "Mpx/s"))
+    for name, resample in FILTERS:
+        first = best = None
+        for i in range(args.repeat):
+            _imagingresample._coefficients.cache_clear()
+            t0 = time.perf_counter()
+            shrink(images[0], preview, resample)
+            t1 = time.perf_counter()
+            for im in images[1:]:
+                shrink(im, preview, resample)
+            t2 = time.perf_counter()
+            t = (t2 - t1) / max(len(images) - 1, 1)
+            first = t1 - t0 if first is None else min(first, t1 - t0)
+            best = t if best is None else min(best, t)
+        print("%-10s %10.4f %10.4f %10.2f" % (
+            name, first, best, pixels / best))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Benchmark ImageStat on a whole image and on every pixelization tile.
+
+Usage: python benchmarks/bench_stat.py [--size 1024] [--psize 16]
+       [--repeat 3]
+
+Computes the mean, median, standard deviation and 10th/90th
+percentiles of a photographic-like RGB image, and of every psize by
+psize tile of it, and prints the time taken.  Then builds an
+IntegralImage, and gets the mean and variance of every tile from it.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PIL import ImageStat
+
+from bench_png_encode import photo
+
+
+def stats(im):
+    stat = ImageStat.Stat(im)
+    return (stat.mean, stat.median, stat.stddev,
+            stat.percentile(10), stat.percentile(90))
+
+
+def tiles(im, psize):
+    width, height = im.size
+    return [
+        stats(im.crop((x, y, min(x + psize, width), min(y + psize, height))))
+        for y in range(0, height, psize) for x in range(0, width, psize)
+        ]
+
+
+def boxes(size, psize):
+    return [
+        (x, y, min(x + psize, size), min(y + psize, size))
+        for y in range(0, size, psize) for x in range(0, size, psize)
+        ]
+
+
+def variances(integral, boxes):
+    return [integral.var(box) for box in boxes]
+
+
+def best(repeat, function, *args):
+    t = None
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        result = function(*args)
+        t1 = time.perf_counter() - t0
+        t = t1 if t is None else min(t, t1)
+    return t, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--psize", type=int, default=16)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    im = photo(args.size)
+    t, result = best(args.repeat, stats, im)
+    print("%-24s %10.4f s" % ("whole image", t))
+    t, result = best(args.repeat, tiles, im, args.psize)
+    print("%-24s %10.4f s %10.1f us/tile" % (
+        "%d tiles of %dx%d" % (len(result), args.psize, args.psize),
+        t, t / len(result) * 1e6))
+    t, integral = best(args.repeat, ImageStat.IntegralImage, im)
+    print("%-24s %10.4f s" % ("integral image", t))
+    regions = boxes(args.size, args.psize)
+    t, result = best(args.repeat, integral.means, regions)
+    print("%-24s %10.4f s %10.1f us/tile" % (
+        "integral means", t, t / len(result) * 1e6))
+    t, result = best(args.repeat, variances, integral, regions)
+    print("%-24s %10.4f s %10.1f us/tile" % (
+        "integral variances", t, t / len(result) * 1e6))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""Benchmark TIFF strip decoding, compressed against raw strips.
+
+Usage: python benchmarks/bench_tiff_decode.py [--size 1024]
+       [--rows 16] [--threads 1,4] [--repeat 3]
+
+Writes a photographic-like RGB image and a scanned-page-like greyscale
+image as multi-strip TIFF files, uncompressed and with PackBits, LZW
+and Deflate compression (with and without the horizontal predictor),
+and times loading each of them from memory.  Throughput is given in
+megabytes of decoded pixels per second, and relative to raw strips.
+"""
+
+import argparse
+import io
+import os
+import random
+import re
+import struct
+import sys
+import time
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PIL import Image, TiffImagePlugin
+
+
+def packbits(row):
+    # runs of three or more bytes are repeated, the rest is literal
+    out = bytearray()
+    i = 0
+    for m in re.finditer(rb"(.)\1{2,127}", row, re.S):
+        for j in range(i, m.start(), 128):
+            chunk = row[j:min(j + 128, m.start())]
+            out.append(len(chunk) - 1)
+            out += chunk
+        out.append(257 - len(m.group()))
+        out.append(row[m.start()])
+        i = m.end()
+    for j in range(i, len(row), 128):
+        chunk = row[j:j + 128]
+        out.append(len(chunk) - 1)
+        out += chunk
+    return bytes(out)
+
+
+def lzw(data):
+    # TIFF flavoured LZW: codes are written msb first, and widened one
+    # code earlier than in GIF
+    codes = [(256, 9)]
+    table = {}
+    next, size = 258, 9
+    code = -1
+    for c in data:
+        if code < 0:
+            code = c
+            continue
+        k = code << 8 | c
+        t = table.get(k)
+        if t is not None:
+            code = t
+            continue
+        codes.append((code, size))
+        if next < 4094:
+            table[k] = next
+            next += 1
+            if next >= (1 << size) and size < 12:
+                size += 1
+        else:
+            codes.append((256, size))
+            table = {}
+            next, size = 258, 9
+        code = c
+    if code >= 0:
+        codes.append((code, size))
+        next += 1
+        if next >= (1 << size) and size < 12:
+            size += 1
+    codes.append((257, size))
+    acc = count = 0
+    out = bytearray()
+    for code, size in codes:
+        acc = acc << size | code
+        count += size
+        while count >= 8:
+            count -= 8
+            out.append((acc >> count) & 255)
+        acc &= (1 << count) - 1
+    if count:
+        out.append((acc << (8 - count)) & 255)
+    return bytes(out)
+
+
+def difference(row, bpp):
+    # horizontal predictor, 8-bit samples
+    return bytes((a - b) & 255 for a, b in zip(row, bytes(bpp) + row[:-bpp]))
+
+
+def write_tiff(mode, size, pixels, compression=1, rows=16, predictor=1):
+    width, height = size
+    bpp = len(mode)
+    linesize = width * bpp
+    strips = []
+    for y in range(0, height, rows):
+        lines = [pixels[i*linesize:(i+1)*linesize]
+                 for i in range(y, min(y + rows, height))]
+        if predictor == 2:
+            lines = [difference(line, bpp) for line in lines]
+        if compression == 32773:
+            strips.append(b"".join(packbits(line) for line in lines))
+        elif compression == 5:
+            strips.append(lzw(b"".join(lines)))
+        elif compression == 8:
+            strips.append(zlib.compress(b"".join(lines)))
+        else:
+            strips.append(b"".join(lines))
+    data = bytearray(b"II*\0\0\0\0\0")
+    offsets = []
+    for strip in strips:
+        offsets.append(len(data))
+        data += strip
+    bps = len(data)
+    data += struct.pack("<%dH" % bpp, *(8,) * bpp)
+    offoff = len(data)
+    data += struct.pack("<%dI" % len(strips), *offsets)
+    cntoff = len(data)
+    data += struct.pack("<%dI" % len(strips), *map(len, strips))
+    if len(strips) == 1:
+        # single values are stored in the directory entry
+        offoff, cntoff = offsets[0], len(strips[0])
+    tags = [
+        (256, 4, 1, width), (257, 4, 1, height),
+        (258, 3, bpp, 8 if bpp == 1 else bps), (259, 3, 1, compression),
+        (262, 3, 1, 2 if bpp == 3 else 1), (273, 4, len(strips), offoff),
+        (277, 3, 1, bpp), (278, 4, 1, rows),
+        (279, 4, len(strips), cntoff), (317, 3, 1, predictor),
+        ]
+    struct.pack_into("<I", data, 4, len(data))
+    data += struct.pack("<H", len(tags))
+    for tag, type, count, value in tags:
+        if count == 1 and type == 3:
+            data += struct.pack("<HHIHH", tag, type, count, value, 0)
+        else:
+            data += struct.pack("<HHII", tag, type, count, value)
+    data += b"\0\0\0\0"
+    return bytes(data)
+
+
+def photo(size):
+    rnd = random.Random(0)
+    width, height = size
+    line = bytes((x * 3 // 4 + rnd.randrange(8)) % 256
+                 for x in range(width * 3))
+    return b"".join(line[y % 7:] + line[:y % 7] for y in range(height))
+
+
+def page(size):
+    # mostly white, with short dark runs of "text"
+    rnd = random.Random(1)
+    width, height = size
+    lines = []
+    for y in range(height):
+        if y % 24 < 12:
+            line = bytearray(b"\xff" * width)
+            for x in range(0, width - 16, 16):
+                if rnd.random() < 0.6:
+                    n = rnd.randrange(2, 12)
+                    line[x:x+n] = b"\x10" * n
+            lines.append(bytes(line))
+        else:
+            lines.append(b"\xff" * width)
+    return b"".join(lines)
+
+
+COMPRESSIONS = [
+    ("raw", 1, 1), ("packbits", 32773, 1), ("lzw", 5, 1),
+    ("lzw+predictor", 5, 2), ("deflate", 8, 1), ("deflate+predictor", 8, 2),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--rows", type=int, default=16)
+    parser.add_argument("--threads", default="1,4")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    size = (args.size, args.size)
+    images = [("RGB photo", "RGB", photo(size)), ("L page", "L", page(size))]
+    threads = [int(s) for s in args.threads.split(",")]
+
+    print("%-10s %-18s %7s %8s %10s %8s" % (
+        "image", "compression", "threads", "ratio", "MB/s", "vs raw"))
+    for name, mode, pixels in images:
+        raw = None
+        for label, compression, predictor in COMPRESSIONS:
+            data = write_tiff(mode, size, pixels, compression, args.rows,
+                              predictor)
+            for n in threads:
+                TiffImagePlugin.TiffImageFile.decoderthreads = n
+                best = None
+                for i in range(args.repeat):
+                    t0 = time.perf_counter()
+                    im = Image.open(io.BytesIO(data))
+                    im.load()
+                    t = time.perf_counter() - t0
+                    best = t if best is None else min(best, t)
+                assert im.tobytes() == pixels, label
+                rate = len(pixels) / best / 1048576.0
+                if raw is None:
+                    raw = rate
+                print("%-10s %-18s %7d %8.2f %10.1f %7.2fx" % (
+                    name, label, n, len(pixels) / float(len(data)), rate,
+                    rate / raw))
+
+
+if __name__ == "__main__":
+    main()
@@ -44,22 +44,16 @@ def main():
     pixel_size = int(root.b_size.get())
 
     pil_img = load_image()
-    # w, h = 640, 400
-    o = w, h = pil_img.size
-    if (w > 640) or (h > 400):
-        while w > 640:
-            w = w // 2
-        # original width / (width/height ratio) = 
-        h = w / (o[0] / o[1])
-        pil_img = resize_image(pil_img, w, int(h))
+    # fit the image in 640x400; thumbnail reduces whole blocks first
+    pil_img.thumbnail((640, 400), Image.ANTIALIAS)
+    w, h = pil_img.size
 
     img = ImageTk.PhotoImage(pil_img)
     c = Canvas(root, width=w, height=h)
     c.image = c.create_image((w/2, h/2), image=img) # keep tkinter from garbage collecting the photo
     c.grid(row=0, column=0, rowspan=8, sticky=N)
 
-    # pixelize(pil_img, pixel_size, c)
-    pixelize_filter(pil_img, pixel_size)
+    pixelize(pil_img, pixel_size, c)
 
     root.mainloop() # Run the window
 
@@ -1,26 +1,40 @@
+import heapq
 from random import randrange
-from PIL import Image
+from PIL import Image, ImageStat
 
 def color_rgb(r,g,b): return "#%02x%02x%02x" % (r,g,b)
 def colorize():       return color_rgb(randrange(256), randrange(256), randrange(256))
 
+MEAN = "mean"
+MEDIAN = "median"
+
+# JPEG minimum coded unit, for the default (4:2:0) subsampling
+JPEG_MCU = 16
+
+# quadtree defaults: colour variance (summed over the bands) above
+# which a block is split, and the largest number of blocks
+QUADTREE_THRESHOLD = 300
+QUADTREE_LEAVES = 4096
+
+# smallest image (in pixels) worth splitting between worker processes;
+# the serial engine does a few megapixels in less time than it takes
+# to set up the shared memory and dispatch the bands
+PARALLEL_PIXELS = 4000000
+
+# modes with one byte per band
+_MODES = ("L", "LA", "RGB", "RGBA", "RGBX", "CMYK", "YCbCr")
+
 def resize(img, box, fit):
     """Downsample the image.
     @param img: Image - an Image object
     @param box: tuple(x, y) - the bounding box of the result image
     @param fit: boolean - crop the image to fill the box
-    
-    Code based on http://unitedcoders.com/christian-harms/image-resizing-tips-general-and-for-python
-    """
-
-    # preresize image with factor 2, 4, 8, and fast algorithm
-    factor = 1
 
-    while img.size[0]/factor > 2*box[0] and img.size[1]*2/factor > 2*box[1]:
-        factor *= 2
+    Code based on http://unitedcoders.com/christian-harms/image-resizing-tips-general-and-for-python
 
-    if factor > 1:
-        img.thumbnail((img.size[0]/factor, img.size[1]/factor), Image.NEAREST)
+    Image.resize first reduces the image by whole blocks (averaging
+    them, without aliasing), and then applies the filter to the rest.
+    """
 
     # calculate the cropping box and get the cropped part
     if fit:
@@ -32,23 +46,291 @@ def resize(img, box, fit):
             y1 = int(y2/2-box[1]*wRatio/2)
             y2 = int(y2/2+box[1]*wRatio/2)
         else:
-            x1 = int(x2/2-box[1]*hRatio/2)
-            x2 = int(x2/2+box[1]*hRatio/2)
+            x1 = int(x2/2-box[0]*hRatio/2)
+            x2 = int(x2/2+box[0]*hRatio/2)
         img = img.crop((x1,y1,x2,y2))
 
     # Resize the image with best quality algorithm
     return img.resize(box, Image.ANTIALIAS)
 
 
-def pixelize_squares(img, psize, canvas):
-    # Uses the graphics library to draw rectangles all over the image
-    rad = psize//2
+# modes used for pixel data with the given number of bands
+_BANDMODES = {1: "L", 2: "LA", 3: "RGB", 4: "RGBA"}
+
+def _block_means(data, width, bands, y0, y1, psize):
+    """Get the mean colour of every block in the rows y0 to y1 (a
+    multiple of psize, or the end of the image).
+    @return: bytes - one row of block colours per row of blocks
+
+    The rows are reduced by psize in both directions with Image.reduce,
+    which averages whole blocks, and smaller blocks along the edges.
+    """
+    linesize = width * bands
+    band = Image.frombytes(
+        _BANDMODES[bands], (width, y1 - y0), bytes(data[y0*linesize:y1*linesize])
+        )
+    return band.reduce(psize).tobytes()
+
+def _block_medians(data, width, bands, y0, y1, psize):
+    """Get the median of every block in the rows y0 to y1, per band.
+
+    The rows are first reordered so that the values of each block are
+    contiguous, which leaves one sort per block.
+    """
+    linesize = width * bands
+    rows = [bytes(data[y*linesize:(y+1)*linesize]) for y in range(y0, y1)]
+    blocks = width // psize
+    n = len(rows) * psize
+    mid = n // 2
+    medians = []
+    for band in range(bands):
+        planes = [row[band::bands] for row in rows]
+        grouped = bytearray(blocks * n)
+        for k, plane in enumerate(planes):
+            for dx in range(psize):
+                grouped[k*psize+dx::n] = plane[dx:blocks*psize:psize]
+        m = [sorted(grouped[i:i+n])[mid] for i in range(0, blocks * n, n)]
+        if blocks * psize < width:
+            values = sorted(b"".join([p[blocks*psize:] for p in planes]))
+            m.append(values[len(values)//2])
+        medians.append(m)
+    return medians
+
+def _expand(colors, width, bands, psize):
+    """Build one output row from a row of block colours."""
+    blocks = width // psize
+    step = psize * bands
+    row = bytearray(width * bands)
+    for band in range(bands):
+        plane = colors[band::bands]
+        for dx in range(psize):
+            row[dx*bands+band:blocks*step:step] = plane[:blocks]
+    if blocks * psize < width:
+        row[blocks*step:] = colors[-bands:] * (width - blocks*psize)
+    return row
+
+def _pixelize_rows(data, width, bands, y0, y1, psize, method):
+    """Pixelize the rows y0 to y1 (a multiple of psize, or the end of
+    the image) and return the raw output data for them."""
+    if method == MEAN:
+        means = _block_means(data, width, bands, y0, y1, psize)
+        size = len(means) // -(-(y1 - y0) // psize)
+    elif method != MEDIAN:
+        raise ValueError("unknown pixelize method %r" % (method,))
+    out = []
+    for i, y in enumerate(range(y0, y1, psize)):
+        ys = min(y + psize, y1)
+        if method == MEAN:
+            colors = means[i*size:(i+1)*size]
+        else:
+            values = _block_medians(data, width, bands, y, ys, psize)
+            colors = bytearray(len(values[0]) * bands)
+            for band in range(bands):
+                colors[band::bands] = bytes(values[band])
+        out.append(bytes(_expand(colors, width, bands, psize)) * (ys - y))
+    return b"".join(out)
+
+def _pixelize_band(src, dst, width, bands, y0, y1, psize, method):
+    """Worker: pixelize rows y0 to y1 from one shared buffer into another."""
+    from multiprocessing import shared_memory
+    # pool workers share the parent's resource tracker, so attaching
+    # here does not take over ownership of the blocks
+    src = shared_memory.SharedMemory(name=src)
+    dst = shared_memory.SharedMemory(name=dst)
+    try:
+        linesize = width * bands
+        out = _pixelize_rows(src.buf, width, bands, y0, y1, psize, method)
+        dst.buf[y0*linesize:y0*linesize+len(out)] = out
+        del out
+    finally:
+        src.close()
+        dst.close()
+
+_executor = None
+
+def _getexecutor(workers):
+    # keep the worker processes around between calls, so batches of
+    # images do not pay for process startup every time
+    global _executor
+    if _executor is None or _executor._max_workers != workers:
+        from concurrent.futures import ProcessPoolExecutor
+        if _executor is not None:
+            _executor.shutdown()
+        _executor = ProcessPoolExecutor(workers)
+    return _executor
+
+def _pixelize_parallel(data, width, bands, height, psize, method, workers):
+    """Pixelize the image in horizontal bands, one task per band.
+
+    The source and result rasters live in shared memory; workers only
+    receive the block names and their row range, so no pixel data is
+    pickled or copied per worker.
+    """
+    from multiprocessing import shared_memory
+    size = len(data)
+    src = shared_memory.SharedMemory(create=True, size=size)
+    try:
+        dst = shared_memory.SharedMemory(create=True, size=size)
+        try:
+            src.buf[:size] = data
+            # a few bands per worker, aligned to whole blocks, evens
+            # out the load when some bands are slower than others
+            rows = -(-height // psize)
+            step = max(-(-rows // (workers * 4)), 1) * psize
+            executor = _getexecutor(workers)
+            tasks = [
+                executor.submit(
+                    _pixelize_band, src.name, dst.name, width, bands,
+                    y, min(y + step, height), psize, method
+                    )
+                for y in range(0, height, step)
+                ]
+            for task in tasks:
+                task.result()
+            return bytes(dst.buf[:size])
+        finally:
+            dst.close()
+            dst.unlink()
+    finally:
+        src.close()
+        src.unlink()
+
+def pixelize(img, psize, method=MEAN, workers=None, align=None):
+    """Pixelize an image.
+    @param img: Image - an Image object
+    @param psize: int - the size of each square, in pixels
+    @param method: str - MEAN (block average) or MEDIAN
+    @param workers: int - number of worker processes (default: none)
+    @param align: int - round psize up to a multiple of this (default: none)
+    @return: Image - a new image of the same size
+
+    All blocks are reduced in one pass over the raw image data, with
+    partial blocks along the right and bottom edges.  With more than
+    one worker, images of at least PARALLEL_PIXELS pixels are split
+    into bands of whole blocks that are reduced in parallel; smaller
+    images are reduced in this process.
+
+    Use align=JPEG_MCU (or 8, for 4:4:4 files) for images that will
+    be saved as JPEG.  Every JPEG block then has a single colour, which
+    the encoder writes without a DCT, and without ringing at the square
+    edges.
+    """
+    if psize < 1:
+        raise ValueError("pixel size must be positive")
+    if align:
+        psize = -(-psize // align) * align
+    if method not in (MEAN, MEDIAN):
+        raise ValueError("unknown pixelize method %r" % (method,))
+    if img.mode in ("1", "P"):
+        img = img.convert("RGB" if img.mode == "P" else "L")
+    if img.mode not in _MODES:
+        raise ValueError("cannot pixelize mode %s images" % img.mode)
+    width, height = img.size
+    bands = len(img.getbands())
+    data = img.tobytes()
+    if (workers and workers > 1 and height > psize
+            and width * height >= PARALLEL_PIXELS):
+        out = _pixelize_parallel(
+            data, width, bands, height, psize, method, workers
+            )
+    else:
+        out = _pixelize_rows(data, width, bands, 0, height, psize, method)
+    return Image.frombytes(img.mode, img.size, out)
+
+
+def _quadtree_leaves(stats, width, height, threshold, min_size, max_leaves):
+    """Split the image into square blocks, largest error first.
+    @param stats: ImageStat.IntegralImage - statistics for the image
+    @return: list - (x0, y0, x1, y1) boxes that cover the image
+
+    The image starts as a grid of the largest squares that are min_size
+    times a power of two, and fit in it; squares along the right and
+    bottom edges are cut off.  Squares whose variance is above the
+    threshold are split into four, as long as the halves are at least
+    min_size, and there are at most max_leaves blocks.  The block with
+    the largest squared error (variance times area) is split first, so
+    the limit leaves the most detailed parts of the image split.
+    """
+    side = min_size
+    while side * 2 <= min(width, height):
+        side *= 2
+    heap = []
+    def push(x, y, side):
+        box = x, y, x1, y1 = x, y, min(x + side, width), min(y + side, height)
+        variance = sum(stats.var(box))
+        error = variance * (x1 - x) * (y1 - y)
+        heapq.heappush(heap, (-error, box, side, variance))
+    for y in range(0, height, side):
+        for x in range(0, width, side):
+            push(x, y, side)
+    count = len(heap)
+    leaves = []
+    while heap:
+        error, box, side, variance = heapq.heappop(heap)
+        x, y = box[:2]
+        half = side // 2
+        if variance <= threshold or half < min_size:
+            leaves.append(box)
+            continue
+        # quarters that are inside the image
+        children = [(x + dx, y + dy)
+                    for dy in (0, half) if y + dy < height
+                    for dx in (0, half) if x + dx < width]
+        if count + len(children) - 1 > max_leaves:
+            leaves.append(box)
+            continue
+        count += len(children) - 1
+        for cx, cy in children:
+            push(cx, cy, half)
+    return leaves
+
+def pixelize_quadtree(img, threshold=QUADTREE_THRESHOLD, min_size=4,
+                      max_leaves=QUADTREE_LEAVES):
+    """Pixelize an image with blocks that are smaller where it has detail.
+    @param img: Image - an Image object
+    @param threshold: float - split blocks with a larger colour variance
+    @param min_size: int - the smallest block size, in pixels
+    @param max_leaves: int - the largest number of blocks
+    @return: Image - a new image of the same size
+
+    Blocks are split by their variance, which an integral image gives
+    without looking at the pixels, so the cost depends on the number of
+    blocks rather than on their size.  Each block is filled with its
+    mean colour, directly in the output buffer.  With min_size a
+    multiple of JPEG_MCU, all blocks are aligned to JPEG blocks.
+    """
+    if min_size < 1:
+        raise ValueError("pixel size must be positive")
+    if img.mode in ("1", "P"):
+        img = img.convert("RGB" if img.mode == "P" else "L")
+    if img.mode not in _MODES:
+        raise ValueError("cannot pixelize mode %s images" % img.mode)
     width, height = img.size
-    for x in range(0, width, psize):
-        for y in range(0, height, psize):
-            rgba = img.getpixel((x+rad, y+rad))
-            if len(rgba) is 3: r,g,b = rgba
-            elif len(rgba) is 4: r,g,b,a = rgba
-            else: break
-            canvas.create_rectangle(x,y, x+psize,y+psize, fill=color_rgb(r,g,b), width=0)
+    bands = len(img.getbands())
+    stats = ImageStat.IntegralImage(img)
+    leaves = _quadtree_leaves(
+        stats, width, height, threshold, min_size, max_leaves
+        )
+    linesize = width * bands
+    out = bytearray(linesize * height)
+    for box, mean in zip(leaves, stats.means(leaves)):
+        x0, y0, x1, y1 = box
+        row = bytes([int(m + 0.5) for m in mean]) * (x1 - x0)
+        for y in range(y0 * linesize, y1 * linesize, linesize):
+            out[y+x0*bands:y+x1*bands] = row
+    return Image.frombytes(img.mode, img.size, bytes(out))
+
 
+def pixelize_squares(img, psize, canvas, threshold=None):
+    # Pixelizes the image and draws it on the canvas as a single image.
+    # With a threshold, blocks are split down to psize where the image
+    # has detail (see pixelize_quadtree).
+    from PIL import ImageTk
+    if threshold is None:
+        result = pixelize(img, psize)
+    else:
+        result = pixelize_quadtree(img, threshold, psize)
+    photo = ImageTk.PhotoImage(result)
+    canvas.pixelized = photo # keep tkinter from garbage collecting the photo
+    canvas.create_image(0, 0, image=photo, anchor="nw")
+    return result